@@ -7,14 +7,24 @@ This module sets up the core Flask application with:
 - SQLAlchemy ORM initialization
 - Proxy fix for deployment environments
 - Debug logging configuration
+
+create_app() only configures the app and registers the routes; it doesn't
+touch the database. The schema is created and upgraded by the migrate
+command (migrations.py), and warm_up() checks it and loads the catalog
+caches (search index, snapshot, embeddings) once per process, before the
+first request. gunicorn.conf.py calls warm_up() in the master so forked
+workers share the loaded caches copy-on-write.
 """
 
 import os
 import logging
+import threading
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+import db_profile
+from replicas import RoutingSession, replica_router
 
 # Configure debug logging for development
 logging.basicConfig(level=logging.DEBUG)
@@ -26,35 +36,263 @@ class Base(DeclarativeBase):
     """
     pass
 
-# Initialize SQLAlchemy with the custom base class
-db = SQLAlchemy(model_class=Base)
+# Initialize SQLAlchemy with the custom base class; the session routes reads to
+# replicas when DATABASE_REPLICA_URLS is set (see replicas.py)
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
+
+
+def create_app(test_config=None):
+    """
+    Create and configure the Flask application.
+
+    Args:
+        test_config (dict): Settings applied over the environment-derived configuration
+
+    Returns:
+        Flask: The configured application, not yet warmed up
+    """
+    # Create the Flask application instance
+    app = Flask(__name__)
+
+    # Configure application security and sessions
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+
+    # Add proxy fix for deployment environments (handles HTTPS redirects properly)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+    # Database configuration - supports both PostgreSQL (production) and SQLite (development)
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///shopmate.db")
+    # Connection pool and driver settings (see db_profile.py); gunicorn.conf.py sizes the pool per worker
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", "5"))            # Connections kept per process
+    app.config["DB_MAX_OVERFLOW"] = int(os.environ.get("DB_MAX_OVERFLOW", "10"))     # Extra connections under bursts
+    app.config["DB_ASYNC_POOL_SIZE"] = int(os.environ.get("DB_ASYNC_POOL_SIZE", "20"))       # Async engine (CHAT_API_MODE=async)
+    app.config["DB_ASYNC_MAX_OVERFLOW"] = int(os.environ.get("DB_ASYNC_MAX_OVERFLOW", "40"))
+    app.config["DB_POOL_TIMEOUT"] = float(os.environ.get("DB_POOL_TIMEOUT", "30"))   # Seconds to wait for a free connection
+    app.config["DB_POOL_RECYCLE"] = int(os.environ.get("DB_POOL_RECYCLE", "300"))    # Recycle connections every 5 minutes
+    app.config["DB_POOL_PRE_PING"] = os.environ.get("DB_POOL_PRE_PING", "1") == "1"  # Verify connections before use (one round trip)
+    app.config["DB_QUERY_CACHE_SIZE"] = int(os.environ.get("DB_QUERY_CACHE_SIZE", "500"))
+    app.config["DB_STATEMENT_CACHE_SIZE"] = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "100"))  # PostgreSQL prepared statements
+    app.config["DB_PGBOUNCER"] = os.environ.get("DB_PGBOUNCER", "0") == "1"          # Transaction-pooling PgBouncer in front
+    app.config["SQLITE_JOURNAL_MODE"] = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    app.config["SQLITE_SYNCHRONOUS"] = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    app.config["SQLITE_BUSY_TIMEOUT"] = int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"))  # Milliseconds a writer waits for the lock
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_profile.engine_options(app.config)
+    # Read replicas (see replicas.py): comma-separated URLs for read-only queries of requests
+    app.config["DATABASE_REPLICA_URLS"] = os.environ.get("DATABASE_REPLICA_URLS", "")
+    app.config["DB_REPLICA_STICKY_SECONDS"] = float(os.environ.get("DB_REPLICA_STICKY_SECONDS", "10"))  # Primary reads after a user's writes
+    app.config["DB_REPLICA_SHARED_TABLES"] = os.environ.get("DB_REPLICA_SHARED_TABLES", "product")  # Read from replicas even then
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False  # Disable event system for performance
+
+    # Chat API serving mode: "sync" (WSGI views in routes.py) or "async" (asyncio views in
+    # async_api.py, served through asgi.py with the async engine)
+    app.config["CHAT_API_MODE"] = os.environ.get("CHAT_API_MODE", "sync")
+    # Async mode: threads running the catalog handlers on the sync engine, at most this many
+    # messages are answered at once per process. Defaults to DB_POOL_SIZE (one connection each)
+    app.config["ASYNC_CATALOG_THREADS"] = int(os.environ.get("ASYNC_CATALOG_THREADS", app.config["DB_POOL_SIZE"]))
+
+    # Write-behind batching for chat messages (see message_queue.py)
+    app.config["CHAT_WRITE_BEHIND"] = os.environ.get("CHAT_WRITE_BEHIND", "0") == "1"
+    app.config["CHAT_WRITE_BATCH_SIZE"] = int(os.environ.get("CHAT_WRITE_BATCH_SIZE", "200"))         # Rows per bulk insert
+    app.config["CHAT_WRITE_FLUSH_INTERVAL"] = float(os.environ.get("CHAT_WRITE_FLUSH_INTERVAL", "0.5"))  # Max seconds buffered
+    app.config["CHAT_WRITE_GROUP_COMMIT"] = os.environ.get("CHAT_WRITE_GROUP_COMMIT", "0") == "1"   # Reply after the rows are committed
+    app.config["CHAT_WRITE_MAX_ATTEMPTS"] = int(os.environ.get("CHAT_WRITE_MAX_ATTEMPTS", "3"))     # Failed bulk inserts before row by row
+    app.config["CHAT_WRITE_MAX_BUFFER"] = int(os.environ.get("CHAT_WRITE_MAX_BUFFER", "20000"))     # Rows kept while the database is down
+
+    # Number of chat messages rendered by chat() and returned per /api/chat-history page
+    app.config["CHAT_HISTORY_PAGE_SIZE"] = int(os.environ.get("CHAT_HISTORY_PAGE_SIZE", "50"))
+    # Server-side chat session store (see session_store.py); entries use CACHE_BACKEND
+    app.config["CHAT_SESSION_CACHE_TTL"] = float(os.environ.get("CHAT_SESSION_CACHE_TTL", "3600"))        # Seconds a token lookup stays cached
+    app.config["CHAT_SESSION_MAX_IDLE"] = float(os.environ.get("CHAT_SESSION_MAX_IDLE", str(30 * 86400)))  # Sessions idle this long are deleted
+    app.config["CHAT_SESSION_SWEEP_INTERVAL"] = float(os.environ.get("CHAT_SESSION_SWEEP_INTERVAL", "3600"))  # 0 disables the sweep
+    app.config["CHAT_SESSION_SWEEP_BATCH_SIZE"] = int(os.environ.get("CHAT_SESSION_SWEEP_BATCH_SIZE", "500"))
+    # Chat history retention (see chat_retention.py); an empty CHAT_ARCHIVE_DIR deletes without archiving
+    app.config["CHAT_ARCHIVE_DIR"] = os.environ.get("CHAT_ARCHIVE_DIR", os.path.join(app.instance_path, "chat_archive"))
+    app.config["CHAT_MAX_MESSAGES_PER_SESSION"] = int(os.environ.get("CHAT_MAX_MESSAGES_PER_SESSION", "1000"))  # 0 disables the cap
+    app.config["CHAT_RETENTION_INTERVAL"] = float(os.environ.get("CHAT_RETENTION_INTERVAL", "3600"))  # Seconds between passes, 0 disables
+    app.config["CHAT_RETENTION_BATCH_SIZE"] = int(os.environ.get("CHAT_RETENTION_BATCH_SIZE", "1000"))  # Rows per DELETE transaction
+
+    # Cache layer for catalog replies and cart counts (see cache.py). Use a shared
+    # backend ("sqlite:///path" or "redis://...") when running several workers.
+    app.config["CACHE_BACKEND"] = os.environ.get("CACHE_BACKEND", "memory")
+    app.config["CACHE_MAX_ENTRIES"] = int(os.environ.get("CACHE_MAX_ENTRIES", "1024"))   # LRU bound for memory/sqlite
+    app.config["CATALOG_CACHE_ENABLED"] = os.environ.get("CATALOG_CACHE_ENABLED", "1") == "1"
+    app.config["CATALOG_CACHE_TTL"] = float(os.environ.get("CATALOG_CACHE_TTL", "300"))  # Seconds before an entry expires
+    app.config["CART_CACHE_TTL"] = float(os.environ.get("CART_CACHE_TTL", "60"))
+    app.config["LOGIN_MISS_CACHE_TTL"] = float(os.environ.get("LOGIN_MISS_CACHE_TTL", "60"))  # Seconds an unknown username skips the query, 0 disables
+    # Only correct when every worker shares the backend; unset means off with "memory", on otherwise
+    app.config["LOGIN_MISS_CACHE_ENABLED"] = {"1": True, "0": False}.get(os.environ.get("LOGIN_MISS_CACHE_ENABLED"))
+    app.config["LOGIN_MISS_CACHE_MAX_ENTRIES"] = int(os.environ.get("LOGIN_MISS_CACHE_MAX_ENTRIES", "1024"))  # Own bound, apart from CACHE_MAX_ENTRIES
+    app.config["CART_MAX_OPERATIONS"] = int(os.environ.get("CART_MAX_OPERATIONS", "100"))  # Operations per POST /api/cart batch
+    # Cart lines hold their stock until the hold lapses, which drops the line (see reservations.py)
+    app.config["STOCK_RESERVATIONS_ENABLED"] = os.environ.get("STOCK_RESERVATIONS_ENABLED", "0") == "1"
+    app.config["STOCK_HOLD_TTL"] = float(os.environ.get("STOCK_HOLD_TTL", "900"))                # Seconds a hold lasts after the last cart change
+    app.config["STOCK_EXPIRY_INTERVAL"] = float(os.environ.get("STOCK_EXPIRY_INTERVAL", "30"))   # Seconds between expiry passes, 0 disables
+    app.config["STOCK_EXPIRY_BATCH_SIZE"] = int(os.environ.get("STOCK_EXPIRY_BATCH_SIZE", "500"))  # Holds released per transaction
+    app.config["REPLY_CARD_CACHE_SIZE"] = int(os.environ.get("REPLY_CARD_CACHE_SIZE", "4096"))  # Rendered product cards kept per process
+
+    # Per-session context for follow-up filters like "now under $50" (see conversation.py)
+    app.config["CONVERSATION_CONTEXT_SIZE"] = int(os.environ.get("CONVERSATION_CONTEXT_SIZE", "1000"))  # Sessions kept per process (LRU)
+    app.config["CONVERSATION_CONTEXT_TTL"] = float(os.environ.get("CONVERSATION_CONTEXT_TTL", "1800"))  # Idle seconds before a context is dropped
+    app.config["CONVERSATION_CANDIDATES"] = int(os.environ.get("CONVERSATION_CANDIDATES", "200"))       # Products kept per listing for refinements
+
+    # Answer category/price/rating filters from an in-memory NumPy snapshot of the
+    # catalog (see catalog_snapshot.py); ignored when NumPy is not installed
+    app.config["CATALOG_SNAPSHOT_ENABLED"] = os.environ.get("CATALOG_SNAPSHOT_ENABLED", "1") == "1"
+
+    # Semantic product search blended with keyword scores (see semantic_index.py);
+    # ignored when NumPy is not installed
+    app.config["SEMANTIC_SEARCH_ENABLED"] = os.environ.get("SEMANTIC_SEARCH_ENABLED", "1") == "1"
+    app.config["SEMANTIC_SEARCH_WEIGHT"] = float(os.environ.get("SEMANTIC_SEARCH_WEIGHT", "0.4"))    # Share of the semantic score
+    app.config["SEMANTIC_MIN_SCORE"] = float(os.environ.get("SEMANTIC_MIN_SCORE", "0.25"))          # Cosine needed without keyword hits
+    app.config["SEMANTIC_DIMENSIONS"] = int(os.environ.get("SEMANTIC_DIMENSIONS", "256"))           # Embedding width
+    app.config["SEMANTIC_NPROBE"] = int(os.environ.get("SEMANTIC_NPROBE", "12"))                    # IVF partitions scanned per query
+    app.config["SEMANTIC_INDEX_PATH"] = os.environ.get("SEMANTIC_INDEX_PATH",
+                                                       os.path.join(app.instance_path, "semantic_vectors.npy"))
+
+    # Keep the in-memory catalog copies of every process current through the catalog_change
+    # feed (see catalog_sync.py): product edits in other workers, other hosts and CLI imports
+    app.config["CATALOG_SYNC_ENABLED"] = os.environ.get("CATALOG_SYNC_ENABLED", "1") == "1"
+    app.config["CATALOG_SYNC_INTERVAL"] = float(os.environ.get("CATALOG_SYNC_INTERVAL", "1"))         # Seconds between feed checks
+    app.config["CATALOG_CHANGE_RETENTION"] = int(os.environ.get("CATALOG_CHANGE_RETENTION", "10000"))  # Feed rows kept
+
+    # Password hashing (see password_hashing.py): a small process pool per worker with a
+    # bounded queue, so login bursts can't take the CPU from chat requests
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")  # Older hashes are replaced on login
+    app.config["PASSWORD_SALT_LENGTH"] = int(os.environ.get("PASSWORD_SALT_LENGTH", "16"))
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))  # Hash processes per worker, 0 hashes inline
+    # Hashes running or waiting per worker before 503. Each holds a request thread, so the
+    # default is half of DB_POOL_SIZE (gunicorn.conf.py sets both from GUNICORN_THREADS)
+    app.config["PASSWORD_HASH_QUEUE"] = int(os.environ.get("PASSWORD_HASH_QUEUE", max(1, app.config["DB_POOL_SIZE"] // 2)))
+    app.config["PASSWORD_HASH_NICE"] = int(os.environ.get("PASSWORD_HASH_NICE", "5"))        # CPU priority decrease of the hash processes
+
+    # Request instrumentation (see metrics.py): per-stage spans, SQL counts and a
+    # Prometheus /metrics endpoint
+    app.config["METRICS_ENABLED"] = os.environ.get("METRICS_ENABLED", "0") == "1"
+    app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")  # Bearer token for /metrics; unset allows loopback scrapes only
+
+    # Opt-in sampling profiler writing folded stacks for flamegraphs (see profiler.py)
+    app.config["PROFILER_ENABLED"] = os.environ.get("PROFILER_ENABLED", "0") == "1"
+    app.config["PROFILER_INTERVAL"] = float(os.environ.get("PROFILER_INTERVAL", "0.005"))              # Seconds between samples
+    app.config["PROFILER_FLUSH_INTERVAL"] = float(os.environ.get("PROFILER_FLUSH_INTERVAL", "10"))     # Seconds between file writes
+    app.config["PROFILER_OUTPUT"] = os.environ.get("PROFILER_OUTPUT", os.path.join(app.instance_path, "profile.folded"))
+
+    # Check (and with SCHEMA_AUTO_MIGRATE, apply) pending migrations before the
+    # first request; turn it off where a separate migrate step runs the upgrade
+    app.config["SCHEMA_AUTO_MIGRATE"] = os.environ.get("SCHEMA_AUTO_MIGRATE", "1") == "1"
 
-# Create the Flask application instance
-app = Flask(__name__)
+    if test_config:
+        app.config.update(test_config)
+        if "SQLALCHEMY_DATABASE_URI" in test_config and "SQLALCHEMY_ENGINE_OPTIONS" not in test_config:
+            app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_profile.engine_options(app.config)
 
-# Configure application security and sessions
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    # Initialize SQLAlchemy with the Flask app
+    db.init_app(app)
+
+    with app.app_context():
+        # SQLite pragmas for every pooled connection
+        db_profile.init_app(app, db.engine)
+
+        # Import models to register them with SQLAlchemy
+        import models
+
+    # The migrate command
+    import migrations
+    migrations.init_app(app)
+
+    # Configure the optional chat message write-behind queue
+    from message_queue import chat_writer
+    chat_writer.init_app(app)
+
+    # Configure the cache backend shared by the routes
+    import cache
+    cache.init_app(app)
+
+    # Read replicas for request queries, with read-your-writes stickiness
+    replica_router.init_app(app)
+    import reply_templates
+    reply_templates.init_app(app)
+    from conversation import conversations
+    conversations.init_app(app)
+
+    # Chat token -> ChatSession lookups and the idle-session sweep
+    from session_store import chat_sessions
+    chat_sessions.init_app(app)
+
+    # Chat history caps, archiving and background purges
+    from chat_retention import chat_retention
+    chat_retention.init_app(app)
+
+    # Password hash parameters and the hash process pool
+    from password_hashing import password_hasher
+    password_hasher.init_app(app)
+
+    # Follow the catalog change feed of the other processes
+    from catalog_sync import catalog_sync
+    catalog_sync.init_app(app)
+
+    # Stock holds for cart lines and their expiry pass
+    from reservations import stock_reservations
+    stock_reservations.init_app(app)
+
+    # Install request timing, SQL instrumentation and the optional profiler
+    import metrics
+    with app.app_context():
+        metrics.init_app(app, db.engine, replica_router.engines)
+    import profiler
+    profiler.init_app(app)
+
+    # Register all routes
+    import routes
+    routes.init_app(app)
+
+    # Warm up lazily in processes that weren't warmed up before serving
+    warm_lock = threading.Lock()
+
+    @app.before_request
+    def _warm_up_once():
+        if not app.extensions.get("shopmate_warm"):
+            with warm_lock:
+                if not app.extensions.get("shopmate_warm"):
+                    warm_up(app)
+
+    return app
+
+
+def warm_up(app):
+    """
+    Check the schema and load the catalog caches. Runs once per app; later
+    calls return immediately. Call it before forking workers so they share
+    the loaded caches.
+
+    Args:
+        app (Flask): Application created by create_app()
+
+    Raises:
+        RuntimeError: Migrations are pending and SCHEMA_AUTO_MIGRATE is off
+    """
+    if app.extensions.get("shopmate_warm"):
+        return
+    with app.app_context():
+        import migrations
+        migrations.ensure_schema(app)
 
-# Add proxy fix for deployment environments (handles HTTPS redirects properly)
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+        # Changes committed from here on are applied by the before_request feed check
+        from catalog_sync import catalog_sync
+        catalog_sync.start()
 
-# Database configuration - supports both PostgreSQL (production) and SQLite (development)
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///shopmate.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,    # Recycle connections every 5 minutes
-    "pool_pre_ping": True,  # Verify connections before use
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False  # Disable event system for performance
+        # Build the in-memory product search index from the current catalog
+        import search_index
+        search_index.build_product_index()
 
-# Initialize SQLAlchemy with the Flask app
-db.init_app(app)
+        # Load the columnar catalog snapshot used by the category and price filters
+        import catalog_snapshot
+        catalog_snapshot.init_app(app)
 
-# Create database tables within application context
-with app.app_context():
-    # Import models to register them with SQLAlchemy
-    import models
-    # Create all tables defined in models
-    db.create_all()
+        # Embed the catalog for semantic search
+        import semantic_index
+        semantic_index.init_app(app)
 
-# Import and register all routes
-import routes
+        # Hand back the connections opened here; a forked worker must not reuse them
+        db.engine.dispose()
+        replica_router.dispose()
+    app.extensions["shopmate_warm"] = True
@@ -0,0 +1,18 @@
+"""
+ASGI entry point for ShopMate AI
+
+Serve with an ASGI server, e.g.:
+    CHAT_API_MODE=async uvicorn asgi:application --workers 4
+
+In "async" mode the chat API runs on the event loop (see async_api.py);
+in "sync" mode the whole Flask app is served through a WSGI adapter.
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+from main import app
+
+if app.config["CHAT_API_MODE"] == "async":
+    from async_api import AsyncChatAPI
+    application = AsyncChatAPI(app)
+else:
+    application = WsgiToAsgi(app)
@@ -0,0 +1,370 @@
+"""
+Asyncio serving mode for the ShopMate AI chat API
+
+When app.config["CHAT_API_MODE"] is "async", asgi.py serves the application
+through AsyncChatAPI, an ASGI app that:
+- Handles /api/chat, /api/add-to-cart, /api/cart-count and /api/clear-chat
+  as coroutines on the server's event loop
+- Talks to the database through SQLAlchemy's async engine (aiosqlite/asyncpg)
+  for sessions, chat history and the cart
+- Answers the message itself (process_chat_message: catalog queries, indexes,
+  caches) with the sync code of routes.py on ASYNC_CATALOG_THREADS threads and
+  the sync engine's pool. That is the real concurrency limit of /api/chat per
+  process: further messages wait for a thread on the event loop without
+  holding a connection. The threads default to DB_POOL_SIZE so each has a
+  connection; more threads than DB_POOL_SIZE + DB_MAX_OVERFLOW only wait for
+  the pool and are capped at that
+- Reads the signed Flask session cookie, so logins from the sync pages work
+- Runs the Flask app's request hooks around each of these requests, in a
+  request context built from the ASGI scope: the before_request hooks (catalog
+  feed check, background pass starters, warm-up) first, and after a write the
+  after_request hooks, so the user's next sync reads stick to the primary
+- Hands every other route to the Flask WSGI app unchanged
+
+URLs, request bodies and JSON responses match the sync views in routes.py.
+Requires the "async" extra (asgiref, aiosqlite, asyncpg, uvicorn).
+"""
+
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.cookies import SimpleCookie
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.test import EnvironBuilder
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from app import db, warm_up
+from models import User, ChatSession, ChatMessage
+from routes import process_chat_message, cart_count_etag
+from message_queue import chat_writer
+from cache import cart_cache
+from session_store import chat_sessions
+from reply_templates import compact_reply
+from chat_retention import clear_statement
+from conversation import conversations
+from cart import (CartError, parse_operations, lock_products_statement, operation_statement,
+                  over_stock_statement, over_stock_error, shortage_error)
+from reservations import stock_reservations
+from replicas import SAFE_METHODS
+from metrics import instrument_engine
+import db_profile
+
+logger = logging.getLogger(__name__)
+
+# Sync driver name -> async driver used by create_async_engine
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+
+def async_database_url(url):
+    """
+    Translate a sync SQLAlchemy URL into its async driver equivalent.
+
+    Args:
+        url (sqlalchemy.engine.URL): URL of the app's sync engine
+
+    Returns:
+        sqlalchemy.engine.URL: Same database, async driver
+    """
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+class AsyncChatAPI:
+    """
+    ASGI application serving the chat API natively on asyncio.
+
+    Args:
+        app (Flask): The configured ShopMate application
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        self.serializer = app.session_interface.get_signing_serializer(app)
+
+        # Reuse the resolved URL (SQLite paths are relative to the instance folder)
+        with app.app_context():
+            url = db.engine.url
+        async_url = async_database_url(url)
+        self.engine = create_async_engine(async_url, **db_profile.engine_options(app.config, async_url, is_async=True))
+        db_profile.install_sqlite_pragmas(self.engine.sync_engine, app.config)
+        if app.config.get("METRICS_ENABLED", False):
+            instrument_engine(self.engine.sync_engine)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+        # Threads for the sync catalog handlers, one sync pool connection each
+        threads = app.config.get("ASYNC_CATALOG_THREADS", app.config.get("DB_POOL_SIZE", 5))
+        sync_options = db_profile.engine_options(app.config, url)
+        if 'pool_size' in sync_options:
+            connections = sync_options['pool_size'] + sync_options['max_overflow']
+            if threads > connections:
+                logger.warning('ASYNC_CATALOG_THREADS=%d exceeds the sync pool (%d connections); using %d',
+                               threads, connections, connections)
+                threads = connections
+        self.catalog_threads = max(1, threads)
+        self.executor = ThreadPoolExecutor(max_workers=self.catalog_threads, thread_name_prefix='catalog')
+
+        self.routes = {
+            ('POST', '/api/chat'): self.api_chat,
+            ('POST', '/api/add-to-cart'): self.add_to_cart,
+            ('GET', '/api/cart-count'): self.get_cart_count,
+            ('POST', '/api/clear-chat'): self.clear_chat,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        handler = self.routes.get((scope.get('method'), scope.get('path')))
+        if scope['type'] != 'http' or handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        user_session = self._load_session(scope)
+        data = None
+        if scope['method'] == 'POST':
+            try:
+                data = json.loads(await self._read_body(receive) or b'null')
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                return await self._respond(send, {'error': 'Invalid JSON'}, 400)
+
+        # Flask's request hooks don't run for these routes by themselves
+        await self._run_sync(self._before_request, scope)
+        payload, status, *etag = await handler(user_session, data)
+        if scope['method'] not in SAFE_METHODS:
+            await self._run_sync(self._after_request, scope, status)
+        if etag:
+            return await self._respond_conditional(scope, send, payload, etag[0])
+        await self._respond(send, payload, status)
+
+    async def api_chat(self, user_session, data):
+        """Async variant of routes.api_chat."""
+        if 'user_id' not in user_session:
+            return {'error': 'Not authenticated'}, 401
+
+        user_message = str(data.get('message', '')).strip()
+        if not user_message:
+            return {'error': 'Empty message'}, 400
+
+        async with self.sessions() as db_session:
+            # Get current chat session, creating it on the first message
+            chat_session_id = await self._resolve_chat_session(
+                db_session, user_session.get('chat_token'), user_session['user_id'], create=True
+            )
+            if chat_session_id is None:
+                return {'error': 'No chat session found'}, 400
+
+            # The catalog handlers use the sync session, so run them on the catalog threads
+            bot_response = await self._run_sync(self._process_message, user_message, user_session['user_id'],
+                                                chat_session_id)
+
+            if chat_writer.enabled:
+                chat_writer.enqueue(chat_session_id, user_message, 'user')
+                chat_writer.enqueue(chat_session_id, bot_response['message'], 'bot')
+                if chat_writer.group_commit:
+                    await self._run_sync(chat_writer.flush)
+            else:
+                db_session.add_all([
+                    ChatMessage(session_id=chat_session_id, message=user_message, sender='user'),
+                    ChatMessage(session_id=chat_session_id, message=bot_response['message'], sender='bot'),
+                ])
+                await db_session.commit()
+
+        if data.get('format') == 'compact':
+            bot_response = compact_reply(bot_response)
+
+        return {
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'timestamp': datetime.utcnow().isoformat()
+        }, 200
+
+    async def add_to_cart(self, user_session, data):
+        """Async variant of routes.add_to_cart."""
+        if 'user_id' not in user_session:
+            return {'error': 'Not authenticated'}, 401
+
+        user_id = user_session['user_id']
+        try:
+            [(op, product_id, quantity)] = parse_operations(
+                [{'op': 'add', 'product_id': data.get('product_id'), 'quantity': data.get('quantity', 1)}])
+        except CartError as error:
+            return error.to_dict(), error.status
+
+        async with self.sessions() as db_session:
+            # Lock and check the product (see cart.py)
+            product = (await db_session.execute(lock_products_statement([product_id]))).first()
+            if not product:
+                return {'error': 'Product not found'}, 404
+
+            # Insert the cart row or add to its quantity in one atomic statement
+            await db_session.execute(operation_statement(self.engine.dialect.name, user_id, op, product_id, quantity))
+            if stock_reservations.enabled:
+                shortages = await db_session.run_sync(stock_reservations.reserve, user_id, {product_id: product.stock})
+                error = shortage_error(shortages, {product_id: product.title}) if shortages else None
+            else:
+                over_stock = (await db_session.execute(over_stock_statement(user_id, [product_id]))).all()
+                error = over_stock_error(over_stock) if over_stock else None
+            if error:
+                await db_session.rollback()
+                return error.to_dict(), error.status
+            cart_count = await db_session.scalar(User.refresh_cart_count_statement(user_id))
+            await db_session.commit()
+
+        # Share the updated count with the other workers
+        cart_cache.set(user_id, cart_count)
+
+        return {
+            'success': True,
+            'message': f'{product.title} added to cart!',
+            'cart_count': cart_count
+        }, 200
+
+    async def get_cart_count(self, user_session, data):
+        """Async variant of routes.get_cart_count."""
+        if 'user_id' not in user_session:
+            return {'count': 0}, 200
+
+        user_id = user_session['user_id']
+        count = cart_cache.get(user_id)
+        if count is None:
+            async with self.sessions() as db_session:
+                count = cart_cache.set(user_id, await self._load_cart_count(db_session, user_id))
+        return {'count': count}, 200, cart_count_etag(user_id, count)
+
+    async def _load_cart_count(self, db_session, user_id):
+        return await db_session.scalar(select(User.cart_count).where(User.id == user_id)) or 0
+
+    async def clear_chat(self, user_session, data):
+        """Async variant of routes.clear_chat."""
+        if 'user_id' not in user_session:
+            return {'error': 'Not authenticated'}, 401
+
+        session_token = user_session.get('chat_token')
+        if session_token:
+            if chat_writer.enabled:
+                await self._run_sync(chat_writer.flush)
+            async with self.sessions() as db_session:
+                chat_session_id = await self._resolve_chat_session(db_session, session_token, user_session['user_id'])
+                if chat_session_id is not None:
+                    # Hide the history now; chat_retention deletes the rows in batches later
+                    await db_session.execute(clear_statement(chat_session_id))
+                    await db_session.commit()
+                    conversations.forget(chat_session_id)
+
+        return {'success': True}, 200
+
+    async def _resolve_chat_session(self, db_session, token, user_id, create=False):
+        """Async counterpart of session_store.ChatSessionStore.resolve."""
+        if not token:
+            return None
+        chat_session_id = chat_sessions.get(token, user_id)
+        if chat_session_id is not None:
+            if not create or await db_session.scalar(select(ChatSession.id).filter_by(id=chat_session_id)) is not None:
+                return chat_session_id
+            # Swept by another worker after this one cached it
+            chat_sessions.forget(token)
+
+        lookup = select(ChatSession.id, ChatSession.user_id).filter_by(session_token=token)
+        row = (await db_session.execute(lookup)).first()
+        if row is None and create:
+            try:
+                await db_session.execute(insert(ChatSession).values(
+                    user_id=user_id, session_token=token, created_at=datetime.utcnow()))
+                await db_session.commit()
+            except IntegrityError:
+                # A concurrent request created it first
+                await db_session.rollback()
+            row = (await db_session.execute(lookup)).first()
+        if row is None or row.user_id != user_id:
+            return None
+
+        chat_sessions.remember(token, row.id, user_id)
+        return row.id
+
+    async def _run_sync(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def _request_context(self, scope):
+        """Flask request context for an ASGI scope (path, method, headers and session cookie)."""
+        headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope.get('headers', [])]
+        environ = EnvironBuilder(path=scope['path'], method=scope['method'], headers=headers,
+                                 query_string=scope.get('query_string', b'').decode('latin-1')).get_environ()
+        return self.app.request_context(environ)
+
+    def _before_request(self, scope):
+        # Each context is entered and left on one thread, so per-thread hooks (profiler) stay paired
+        with self._request_context(scope):
+            self.app.preprocess_request()
+
+    def _after_request(self, scope, status):
+        with self._request_context(scope):
+            self.app.process_response(self.app.response_class(status=status))
+
+    def _process_message(self, message, user_id, chat_session_id):
+        with self.app.app_context():
+            return process_chat_message(message, user_id, chat_session_id)
+
+    def _load_session(self, scope):
+        """Decode the signed Flask session cookie (read-only)."""
+        cookie_name = self.app.config['SESSION_COOKIE_NAME']
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                morsel = SimpleCookie(value.decode('latin-1')).get(cookie_name)
+                if morsel is not None and self.serializer is not None:
+                    try:
+                        max_age = int(self.app.permanent_session_lifetime.total_seconds())
+                        return self.serializer.loads(morsel.value, max_age=max_age)
+                    except Exception:
+                        return {}
+        return {}
+
+    async def _read_body(self, receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                return body
+
+    async def _respond(self, send, payload, status, headers=()):
+        body = (self.app.json.dumps(payload) + '\n').encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                        *headers],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _respond_conditional(self, scope, send, payload, etag):
+        """Send payload with an ETag, or an empty 304 if the client already has it."""
+        quoted = f'"{etag}"'.encode()
+        for name, value in scope.get('headers', []):
+            if name == b'if-none-match' and quoted in [tag.strip() for tag in value.split(b',')]:
+                await send({'type': 'http.response.start', 'status': 304,
+                            'headers': [(b'etag', quoted), (b'cache-control', b'private, no-cache')]})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+        await self._respond(send, payload, 200, [(b'etag', quoted), (b'cache-control', b'private, no-cache')])
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # The async routes bypass Flask's before_request, so warm up here
+                await asyncio.to_thread(warm_up, self.app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,145 @@
+"""
+Load test: sync (gunicorn threads) vs. async (uvicorn + AsyncChatAPI) chat API
+
+Seeds a throwaway SQLite database, starts one server process per mode and
+drives it with many concurrent simulated chat sessions. Each session
+registers a user, opens /chat and then alternates /api/chat,
+/api/add-to-cart and /api/cart-count calls. Reports throughput and p50/p99
+latency per mode.
+
+Usage:
+    python benchmarks/bench_async.py --sessions 200 --turns 10
+    python benchmarks/bench_async.py --modes async --database-url postgresql://...
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MESSAGES = ['hi', 'show me electronics', 'find books under $40', 'search for headphones',
+            'show my cart', 'wireless mouse', 'textiles below 30', 'help']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_command(mode, port, threads):
+    if mode == 'async':
+        return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port), '--log-level', 'warning']
+    return [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--threads', str(threads),
+            '--log-level', 'warning', 'main:app']
+
+
+def wait_for(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def run_session(base_url, index, turns, latencies, errors, ready):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    rng = random.Random(index)
+    name = f'bench_{uuid.uuid4().hex[:12]}'
+    form = urllib.parse.urlencode({'username': name, 'email': f'{name}@example.com', 'password': 'pw'}).encode()
+    opener.open(f'{base_url}/register', form).read()
+
+    # Start the timed phase only once every session is logged in
+    ready.wait()
+
+    def call(path, payload=None):
+        request = urllib.request.Request(f'{base_url}{path}')
+        if payload is not None:
+            request.data = json.dumps(payload).encode()
+            request.add_header('Content-Type', 'application/json')
+        start = time.perf_counter()
+        try:
+            with opener.open(request, timeout=60) as response:
+                body = json.loads(response.read())
+        except OSError:
+            errors.append(path)
+            return None
+        latencies.setdefault(path, []).append(time.perf_counter() - start)
+        return body
+
+    for _ in range(turns):
+        reply = call('/api/chat', {'message': rng.choice(MESSAGES)})
+        products = (reply or {}).get('bot_response', {}).get('products') or []
+        if products:
+            call('/api/add-to-cart', {'product_id': rng.choice(products)['id'], 'quantity': 1})
+        call('/api/cart-count')
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_mode(mode, args, env):
+    port = free_port()
+    server = subprocess.Popen(server_command(mode, port, args.threads), cwd=ROOT,
+                              env=dict(env, CHAT_API_MODE=mode),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        latencies, errors, started = {}, [], []
+        ready = threading.Barrier(args.sessions, action=lambda: started.append(time.perf_counter()))
+        threads = [threading.Thread(target=run_session,
+                                    args=(f'http://127.0.0.1:{port}', i, args.turns, latencies, errors, ready))
+                   for i in range(args.sessions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started[0]
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"\n[{mode}] {total} requests in {elapsed:.1f} s ({total / elapsed:.0f} req/s), {len(errors)} errors")
+    for path, samples in sorted(latencies.items()):
+        print(f"  {path:<18} p50 {percentile(samples, 50) * 1000:8.1f} ms | p99 {percentile(samples, 99) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=100, help='concurrent simulated chat sessions')
+    parser.add_argument('--turns', type=int, default=10, help='chat turns per session')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads for sync mode')
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_async.db')}"
+    env = dict(os.environ, DATABASE_URL=database_url)
+
+    # Create the schema and mock catalog once, shared by both modes
+    subprocess.run([sys.executable, 'create_mock_data.py'], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    for mode in args.modes.split(','):
+        run_mode(mode, args, env)
+
+
+if __name__ == '__main__':
+    main()
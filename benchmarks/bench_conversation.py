@@ -0,0 +1,125 @@
+"""
+Benchmark: follow-up filters refined from the conversation context versus
+answered as fresh messages (conversation.py)
+
+Loads a synthetic catalog into a throwaway database and replays chats of
+one listing ("show me electronics") followed by filter-only follow-ups
+("now under $50", "rated 4+", "only in stock"). Each follow-up is answered
+twice: through routes.respond_to_intent with a chat session, which filters
+the cached candidate set, and as the equivalent stand-alone message
+("electronics under $50 rated 4+ in stock"), which queries again. Checks
+both show the same products when the candidate set holds the whole listing
+and prints mean and p99 latency with the catalog snapshot off and on. The
+first follow-up of a chat loads the candidate set; later ones only filter it,
+so they are reported separately.
+
+Usage:
+    python benchmarks/bench_conversation.py --products 200000
+    python benchmarks/bench_conversation.py --database-url postgresql://localhost/shopmate_bench
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def chat_mix(count, follow_ups=3, seed=11):
+    """(listing message, [(follow-up, equivalent stand-alone message), ...]) per chat."""
+    rng = random.Random(seed)
+    categories = ['electronics', 'books', 'textiles']
+    filters = [('under ${}', lambda value: f'under ${value}', [20, 50, 100, 250]),
+               ('rated {}+', lambda value: f'rated {value}+', [4, 4.5]),
+               ('only in stock', lambda value: 'in stock', [None])]
+    chats = []
+    for _ in range(count):
+        category = rng.choice(categories)
+        applied, turns = {}, []
+        for _ in range(follow_ups):
+            template, phrase, values = rng.choice(filters)
+            value = rng.choice(values)
+            applied[template] = phrase(value)
+            turns.append((template.format(value), ' '.join([category] + list(applied.values()))))
+        chats.append((f'show me {category}', turns))
+    return chats
+
+
+def run(chats):
+    from intents import classify
+    from conversation import conversations
+    import routes
+
+    first, refined, fresh, mismatches = [], [], [], 0
+    for chat_session_id, (listing, turns) in enumerate(chats, start=1):
+        routes.respond_to_intent(classify(listing), 1, chat_session_id)
+        for turn, (follow_up, standalone) in enumerate(turns):
+            start = time.perf_counter()
+            response = routes.respond_to_intent(classify(follow_up), 1, chat_session_id)
+            (refined if turn else first).append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            expected = routes.respond_to_intent(classify(standalone), 1)
+            fresh.append(time.perf_counter() - start)
+
+            complete = conversations.get(chat_session_id).complete
+            if complete and [p['id'] for p in response.get('products', [])] != [p['id'] for p in expected.get('products', [])]:
+                mismatches += 1
+        conversations.forget(chat_session_id)
+    return first, refined, fresh, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--chats', type=int, default=100)
+    parser.add_argument('--candidates', type=int, default=200, help='CONVERSATION_CANDIDATES')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file (must be empty)')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_conversation.db')}"
+    os.environ['CONVERSATION_CANDIDATES'] = str(args.candidates)
+
+    from main import app
+    from migrations import migrate
+    from catalog_import import synthetic_products, normalize_product, load_products
+    from catalog_snapshot import catalog_snapshot, build_catalog_snapshot
+    from cache import catalog_cache
+
+    with app.app_context():
+        migrate()
+        print(f"Loading {args.products:,} synthetic products...")
+        load_products(normalize_product(record) for record in synthetic_products(args.products))
+        build_catalog_snapshot()
+        chats = chat_mix(args.chats)
+
+        modes = [('database', False)] + ([('snapshot', True)] if catalog_snapshot is not None else [])
+        failed = False
+        for label, snapshot in modes:
+            if catalog_snapshot is not None:
+                catalog_snapshot.ready = snapshot
+            # Measure the queries, not the reply cache
+            catalog_cache.enabled = False
+            first, refined, fresh, mismatches = run(chats)
+            print(f"\n[{label}] {len(first) + len(refined)} follow-ups")
+            for name, samples in (('first', first), ('refined', refined), ('fresh', fresh)):
+                print(f"  {name:8} mean {sum(samples) / len(samples) * 1000:7.2f} ms   "
+                      f"p99 {percentile(samples, 99) * 1000:7.2f} ms")
+            print(f"  refined vs fresh {sum(fresh) / len(fresh) / (sum(refined) / len(refined)):.1f}x, "
+                  f"mismatches {mismatches}")
+            failed = failed or mismatches > 0
+
+    if failed:
+        sys.exit("Refined follow-ups differ from the equivalent stand-alone messages")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: catalog loading with per-row session.add() versus catalog_import.py
+
+Generates a synthetic feed, then loads it into a throwaway database three
+ways and prints rows per second:
+- legacy: one Product object per row through the ORM session (old create_mock_data.py)
+- insert: load_products(mode='insert'), chunked multi-row INSERT batches
+- upsert: load_products(mode='upsert') of the same feed again, so every SKU conflicts
+
+Usage:
+    python benchmarks/bench_import.py --products 200000
+    python benchmarks/bench_import.py --database-url postgresql://localhost/shopmate_bench --copy
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def report(label, rows, elapsed):
+    print(f"  {label:<10} {rows:>10,} rows  {elapsed:8.2f} s  {rows / elapsed:>12,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--legacy-products', type=int, default=20000, help='rows for the slow per-row path')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--copy', action='store_true', help='use COPY for the bulk runs (PostgreSQL)')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file (must be empty)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench_import.db')}"
+
+    from main import app
+    from app import db
+    from migrations import migrate
+    from models import Product
+    from catalog_import import synthetic_products, write_feed, parse_feed, load_products
+
+    feed = os.path.join(workdir, 'catalog.jsonl')
+    write_feed(feed, synthetic_products(args.products))
+
+    with app.app_context():
+        migrate()
+        print(f"Loading {args.products:,} products ({args.legacy_products:,} for legacy)")
+
+        start = time.perf_counter()
+        for row, _ in islice(parse_feed(feed), args.legacy_products):
+            db.session.add(Product(**row))
+        db.session.commit()
+        report('legacy', args.legacy_products, time.perf_counter() - start)
+
+        db.session.execute(Product.__table__.delete())
+        db.session.commit()
+
+        for mode in ('insert', 'upsert'):
+            stats = load_products(parse_feed(feed), mode=mode, chunk_size=args.chunk_size, use_copy=args.copy)
+            report(mode, stats['written'], stats['elapsed'])
+
+
+if __name__ == '__main__':
+    main()
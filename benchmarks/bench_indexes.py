@@ -0,0 +1,131 @@
+"""
+Benchmark: query plans and latency of the hot lookups before/after the
+hot-path indexes (migration 2 in migrations.py)
+
+Seeds a throwaway database, drops the composite indexes to reproduce the
+old schema, prints the query plan and mean latency of each hot query,
+then applies the migration and repeats.
+
+Usage:
+    python benchmarks/bench_indexes.py --products 100000 --users 2000 --messages 500000
+    python benchmarks/bench_indexes.py --database-url postgresql://localhost/shopmate_bench
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(db, args):
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from models import User, Product, CartItem, ChatSession, ChatMessage
+
+    rng = random.Random(42)
+    categories = ['Electronics', 'Books', 'Textiles']
+
+    def bulk(model, rows, size=5000):
+        for start in range(0, len(rows), size):
+            db.session.execute(insert(model), rows[start:start + size])
+
+    bulk(Product, [{'title': f'Product {i}', 'description': 'Synthetic product', 'category': rng.choice(categories),
+                    'price': round(rng.uniform(5, 500), 2), 'rating': 4.0} for i in range(args.products)])
+    bulk(User, [{'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': 'x'}
+                for i in range(args.users)])
+    bulk(ChatSession, [{'user_id': i + 1, 'session_token': f'token-{i}'} for i in range(args.users)])
+
+    cart_rows = {(rng.randrange(1, args.users + 1), rng.randrange(1, args.products + 1))
+                 for _ in range(args.users * 5)}
+    bulk(CartItem, [{'user_id': u, 'product_id': p, 'quantity': 1} for u, p in cart_rows])
+
+    start = datetime(2024, 1, 1)
+    bulk(ChatMessage, [{'session_id': rng.randrange(1, args.users + 1), 'message': 'hello', 'sender': 'user',
+                        'timestamp': start + timedelta(seconds=i)} for i in range(args.messages)])
+    db.session.commit()
+
+
+def hot_queries(args):
+    from sqlalchemy import select
+    from models import Product, CartItem, ChatMessage
+
+    return [
+        ('cart item by (user, product)',
+         select(CartItem).where(CartItem.user_id == args.users // 2, CartItem.product_id == 7)),
+        ('cart items by user (show_cart)',
+         select(CartItem, Product).join(Product).where(CartItem.user_id == args.users // 2)),
+        ('chat history by session',
+         select(ChatMessage).where(ChatMessage.session_id == args.users // 2).order_by(ChatMessage.timestamp)),
+        ('category listing under price',
+         select(Product).where(Product.category == 'Books', Product.price <= 20).limit(6)),
+    ]
+
+
+def explain(connection, statement):
+    from sqlalchemy import text
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'sqlite':
+        return [row[-1] for row in connection.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+    return [row[0] for row in connection.execute(text(f'EXPLAIN {sql}'))]
+
+
+def measure(db, queries, repeat):
+    with db.engine.connect() as connection:
+        for label, statement in queries:
+            for _ in range(3):
+                connection.execute(statement).all()
+            start = time.perf_counter()
+            for _ in range(repeat):
+                connection.execute(statement).all()
+            elapsed = (time.perf_counter() - start) / repeat
+            print(f"  {label:<32} {elapsed * 1000:9.3f} ms")
+            for line in explain(connection, statement):
+                print(f"      {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file (must be empty)')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_indexes.db')}"
+
+    from main import app
+    from app import db
+    from models import Product, CartItem, ChatMessage
+    import migrations
+
+    with app.app_context():
+        migrations.migrate()
+        # Reproduce the schema from before the hot-path indexes existed
+        with db.engine.begin() as connection:
+            for model in (Product, CartItem, ChatMessage):
+                for index in model.__table__.indexes:
+                    index.drop(connection, checkfirst=True)
+
+        print(f"Seeding {args.products} products, {args.users} users, {args.messages} chat messages...")
+        seed(db, args)
+        queries = hot_queries(args)
+
+        print("\nBefore (no composite indexes):")
+        measure(db, queries, args.repeat)
+
+        with db.engine.begin() as connection:
+            migrations.add_hot_path_indexes(connection)
+            if connection.dialect.name == 'sqlite':
+                connection.exec_driver_sql('ANALYZE')
+
+        print("\nAfter migration 2:")
+        measure(db, queries, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
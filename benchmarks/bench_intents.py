@@ -0,0 +1,159 @@
+"""
+Benchmark and accuracy check for intents.classify
+
+Replays a labelled corpus of chat messages through the compiled classifier,
+reports routing accuracy (exits non-zero on any misroute) and compares
+throughput against the original cascade of substring checks, both bare
+(routing only) and followed by the slot parsing the old handlers then did
+(search_products' word and category loops, filter_by_price's regex).
+
+The compiled classifier routes and fills every slot (category, price,
+rating, stock, keywords) in one call, so it is slower than the bare
+substring cascade, which only picks a route (about a third of its rate),
+and still somewhat slower than the cascade plus its slot parsing (about
+0.8x). Messages without digits or multi-word phrases skip the regex (see
+intents.py); the others pay for the single regex pass.
+
+Usage:
+    python benchmarks/bench_intents.py --iterations 2000
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import classify
+
+# (message, expected intent, expected slots subset)
+CORPUS = [
+    ("hi", 'greeting', {}),
+    ("Hello there!", 'greeting', {}),
+    ("hey", 'greeting', {}),
+    ("let's start", 'greeting', {}),
+    ("this is nonsense", 'default', {}),
+    ("which one is better?", 'default', {}),
+    ("thanks", 'default', {}),
+    ("help", 'help', {}),
+    ("what can you do", 'help', {}),
+    ("list commands", 'help', {}),
+    ("show my cart", 'cart', {}),
+    ("Show me my basket", 'cart', {}),
+    ("what have I added", 'cart', {}),
+    ("how do I add to cart", 'add_to_cart', {}),
+    ("show me electronics", 'search', {'category': 'Electronics'}),
+    ("find books", 'search', {'category': 'Books'}),
+    ("Show textiles", 'search', {'category': 'Textiles'}),
+    ("search for headphones", 'search', {'category': None, 'keywords': ['headphones']}),
+    ("I want a wireless mouse", 'search', {'keywords': ['i', 'wireless', 'mouse']}),
+    ("looking for a denim jacket", 'search', {'category': 'Textiles'}),
+    ("find some tech gadgets", 'search', {'category': 'Electronics'}),
+    ("hi, show me a smart watch", 'search', {'keywords': ['smart', 'watch']}),
+    ("electronics", 'category', {'category': 'Electronics', 'category_term': 'electronics'}),
+    ("clothing please", 'category', {'category': 'Textiles', 'category_term': 'clothing'}),
+    ("accessories", 'category', {'category': 'Textiles'}),
+    ("books under $20", 'price', {'category': 'Books', 'max_price': 20.0}),
+    ("Find books under $40", 'price', {'category': 'Books', 'max_price': 40.0}),
+    ("electronics below 100", 'price', {'category': 'Electronics', 'max_price': 100.0}),
+    ("anything less than $19.99", 'price', {'category': None, 'max_price': 19.99}),
+    ("show me products under $50", 'price', {'max_price': 50.0}),
+    ("something cheaper", 'price', {'max_price': None}),
+    ("show me a 4k webcam", 'search', {'max_price': None, 'keywords': ['4k', 'webcam']}),
+    ("shipping to chicago?", 'default', {}),
+]
+
+
+def legacy_classify(message):
+    """The original chain of substring checks from routes.process_chat_message."""
+    message_lower = message.lower()
+    if any(word in message_lower for word in ['hello', 'hi', 'hey', 'start']):
+        return 'greeting'
+    if any(word in message_lower for word in ['show', 'find', 'search', 'looking', 'want']):
+        return 'search'
+    if any(word in message_lower for word in ['cart', 'basket', 'added']):
+        return 'cart'
+    if 'add to cart' in message_lower:
+        return 'add_to_cart'
+    if any(word in message_lower for word in ['under', 'below', 'less than', 'cheaper']):
+        return 'price'
+    for category in ['electronics', 'books', 'textiles', 'clothing', 'accessories']:
+        if category in message_lower:
+            return 'category'
+    if any(word in message_lower for word in ['help', 'what can you do', 'commands']):
+        return 'help'
+    return 'default'
+
+
+LEGACY_CATEGORIES = [
+    (['electronics', 'electronic', 'tech', 'gadget', 'gadgets'], 'Electronics'),
+    (['books', 'book', 'reading', 'novel', 'textbook'], 'Books'),
+    (['textiles', 'textile', 'clothing', 'clothes', 'shirt', 'jacket', 'scarf'], 'Textiles'),
+]
+LEGACY_STOP_WORDS = ['show', 'me', 'find', 'search', 'for', 'the', 'a', 'an', 'get', 'want', 'need', 'looking', 'some']
+
+
+def legacy_pipeline(message):
+    """legacy_classify followed by the slot parsing of the original handlers."""
+    name = legacy_classify(message)
+    message_lower = message.lower()
+    if name == 'search':
+        terms = re.findall(r'\b\w+\b', message_lower)
+        category = next((value for term in terms for words, value in LEGACY_CATEGORIES if term in words), None)
+        keywords = [] if category else [term for term in terms if term not in LEGACY_STOP_WORDS]
+        return name, category, keywords
+    if name == 'price':
+        match = re.search(r'\$?(\d+)', message_lower)
+        return name, float(match.group(1)) if match else None
+    return name
+
+
+def check_accuracy(classifier, with_slots):
+    failures = []
+    for message, expected, expected_slots in CORPUS:
+        result = classifier(message)
+        name = result.name if with_slots else result
+        if name != expected:
+            failures.append(f"{message!r}: expected {expected}, got {name}")
+            continue
+        if with_slots:
+            for key, value in expected_slots.items():
+                if result.slots[key] != value:
+                    failures.append(f"{message!r}: slot {key} expected {value!r}, got {result.slots[key]!r}")
+    return failures
+
+
+def throughput(classifier, iterations):
+    messages = [message for message, _, _ in CORPUS]
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            classifier(message)
+    elapsed = time.perf_counter() - start
+    return iterations * len(messages) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    legacy_failures = check_accuracy(legacy_classify, with_slots=False)
+    failures = check_accuracy(classify, with_slots=True)
+    total = len(CORPUS)
+    print(f"Legacy routing accuracy:            {total - len(legacy_failures)}/{total}")
+    print(f"Compiled routing accuracy:          {total - len({f.split(':')[0] for f in failures})}/{total}")
+    for failure in failures:
+        print(f"  MISROUTE {failure}")
+
+    print(f"Legacy throughput (routing only):    {throughput(legacy_classify, args.iterations):,.0f} msg/s")
+    print(f"Legacy throughput (routing+slots):   {throughput(legacy_pipeline, args.iterations):,.0f} msg/s")
+    print(f"Compiled throughput (routing+slots): {throughput(classify, args.iterations):,.0f} msg/s")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
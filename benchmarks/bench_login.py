@@ -0,0 +1,151 @@
+"""
+Benchmark: login bursts next to steady chat traffic (password_hashing.py)
+
+Seeds users and products, then for --duration seconds runs --chatters
+sessions sending /api/chat messages while --logins clients hammer /login:
+half with the right password, a quarter with a wrong one and a quarter with
+unknown usernames (answered from the login miss cache after the first try).
+Shed logins (503) wait for Retry-After before the client tries again.
+Each profile runs against gunicorn (gunicorn.conf.py, --workers processes):
+- quiet:   chat traffic only, for reference
+- inline:  login storm with hashes on the request threads
+           (PASSWORD_HASH_WORKERS=0, the previous behaviour)
+- pool:    login storm with the per-worker hash pool and bounded queue
+
+Reports chat throughput and p50/p99 latency, and login outcomes: accepted
+(302), rejected credentials (200), shed (503) and their latency.
+
+Usage:
+    python benchmarks/bench_login.py --workers 2 --chatters 16 --logins 32
+    python benchmarks/bench_login.py --profile inline --profile pool --duration 30
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from loadtest import ROOT, PASSWORD, MESSAGES, HTTPSession, percentile, seed, free_port, wait_for
+
+PROFILES = {
+    'quiet': ({}, False),
+    'inline': ({'PASSWORD_HASH_WORKERS': '0', 'PASSWORD_HASH_QUEUE': '100000'}, True),
+    'pool': ({}, True),
+}
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # Report the 302 of a successful login instead of following it
+
+
+class LoginSession(HTTPSession):
+    def __init__(self, base_url):
+        super().__init__(base_url)
+        self.opener = urllib.request.build_opener(NoRedirect())
+
+
+def chatter(make_session, number, users, deadline, results):
+    rng = random.Random(number)
+    client = make_session()
+    while client.request('POST', '/login', form={'username': f'load{number % users}', 'password': PASSWORD})[0] == 503:
+        time.sleep(1)
+    client.request('GET', '/chat')
+    messages = [message for family in ('search', 'price', 'category') for message in MESSAGES[family]]
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        status, _, _ = client.request('POST', '/api/chat', json_body={'message': rng.choice(messages)})
+        results.append((status, time.perf_counter() - start))
+
+
+def login_client(base_url, number, users, deadline, results):
+    rng = random.Random(1000 + number)
+    while time.perf_counter() < deadline:
+        roll = rng.random()
+        if roll < 0.5:
+            form = {'username': f'load{rng.randrange(users)}', 'password': PASSWORD}
+        elif roll < 0.75:
+            form = {'username': f'load{rng.randrange(users)}', 'password': 'wrong-password'}
+        else:
+            form = {'username': f'nobody{rng.randrange(50)}', 'password': PASSWORD}
+        start = time.perf_counter()
+        try:
+            status, _, headers = LoginSession(base_url).request('POST', '/login', form=form)
+        except OSError:
+            status = 0
+        results.append((status, time.perf_counter() - start))
+        if status == 503:
+            time.sleep(float(headers.get('Retry-After', 1)))
+
+
+def run_profile(name, database_url, args, workdir):
+    overrides, storm = PROFILES[name]
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, WEB_CONCURRENCY=str(args.workers),
+               CACHE_BACKEND=f"sqlite:///{os.path.join(workdir, 'cache.db')}", **overrides)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        base_url = f'http://127.0.0.1:{port}'
+        make_session = lambda: HTTPSession(base_url)
+        deadline = time.perf_counter() + args.duration
+        chats, logins = [], []
+        threads = [threading.Thread(target=chatter, args=(make_session, number, args.users, deadline, chats))
+                   for number in range(args.chatters)]
+        if storm:
+            threads += [threading.Thread(target=login_client, args=(base_url, number, args.users, deadline, logins))
+                        for number in range(args.logins)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    chat_latencies = [latency for status, latency in chats if status == 200]
+    print(f"\n[{name}] {args.duration:.0f} s, {args.workers} workers")
+    print(f"  chat    {len(chat_latencies) / args.duration:7.1f} req/s   "
+          f"p50 {percentile(chat_latencies, 50) * 1000:7.1f} ms   p99 {percentile(chat_latencies, 99) * 1000:7.1f} ms   "
+          f"errors {len(chats) - len(chat_latencies)}")
+    if logins:
+        statuses = [status for status, _ in logins]
+        answered = [latency for status, latency in logins if status in (200, 302)]
+        print(f"  login   {len(answered) / args.duration:7.1f} req/s   "
+              f"p50 {percentile(answered, 50) * 1000:7.1f} ms   p99 {percentile(answered, 99) * 1000:7.1f} ms   "
+              f"accepted {statuses.count(302)}, rejected {statuses.count(200)}, shed {statuses.count(503)}, "
+              f"errors {len(statuses) - statuses.count(302) - statuses.count(200) - statuses.count(503)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--chatters', type=int, default=16, help='sessions sending chat messages')
+    parser.add_argument('--logins', type=int, default=32, help='clients posting /login in a loop')
+    parser.add_argument('--duration', type=float, default=20.0, help='seconds per profile')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILES),
+                        help='profiles to run (default: quiet, inline, pool)')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file (must be empty)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench_login.db')}"
+    print(f"Seeding {args.users} users and {args.products:,} products...")
+    seed(database_url, args.users, args.products)
+
+    for name in args.profile or ['quiet', 'inline', 'pool']:
+        run_profile(name, database_url, args, workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Check and measure read-replica routing (replicas.py) with SQLite files
+
+Seeds a SQLite primary, copies it into --replicas replica files and keeps
+them behind: a replicator thread re-copies the primary every --lag seconds.
+Then --sessions simulated users (Flask test client) repeat: search in the
+chat, set a new quantity for a product in the cart, read the cart and the
+chat history back. Every read-back must show the user's own writes
+(read-your-writes). The run is repeated with the stickiness markers turned
+off to show the stale reads they prevent.
+
+Reports the statements executed on the primary and on each replica,
+requests per second and read-your-writes violations.
+
+Usage:
+    python benchmarks/bench_replicas.py --replicas 2 --sessions 16 --turns 20 --lag 1
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from loadtest import PASSWORD, MESSAGES, TestClientSession, seed
+
+
+def replicator(primary, replicas, lag, stopped):
+    from replicas import copy_sqlite
+    while not stopped.wait(lag):
+        for replica in replicas:
+            copy_sqlite(primary, replica)
+
+
+def run_session(app, number, turns, results):
+    rng = random.Random(number)
+    client = TestClientSession(app)
+    while client.request('POST', '/login', form={'username': f'load{number}', 'password': PASSWORD})[0] == 503:
+        time.sleep(1)  # Password hash queue full (password_hashing.py)
+    client.request('GET', '/chat')
+    requests = violations = 0
+    for turn in range(turns):
+        message = f"{rng.choice(MESSAGES['search'])} #{number}-{turn}"
+        _, reply, _ = client.request('POST', '/api/chat', json_body={'message': message})
+        products = (reply or {}).get('bot_response', {}).get('products') or [{'id': rng.randint(1, 1000)}]
+        product_id, quantity = products[0]['id'], turn % 3 + 1
+        status, _, _ = client.request('POST', '/api/cart', json_body={'operations': [
+            {'op': 'set', 'product_id': product_id, 'quantity': quantity}]})
+
+        _, cart, _ = client.request('GET', '/api/cart')
+        _, history, _ = client.request('GET', '/api/chat-history')
+        requests += 4
+        lines = {item['product_id']: item['quantity'] for item in (cart or {}).get('items', [])}
+        if status == 200 and lines.get(product_id) != quantity:
+            violations += 1
+        if message not in [entry['message'] for entry in (history or {}).get('messages', [])]:
+            violations += 1
+    results.append((requests, violations))
+
+
+def run_mode(app, label, args):
+    from replicas import replica_router
+    from app import db
+    from sqlalchemy import event
+
+    counts = {}
+    lock = threading.Lock()
+
+    def counter(name):
+        def count(*_):
+            with lock:
+                counts[name] = counts.get(name, 0) + 1
+        return count
+
+    with app.app_context():
+        listeners = [(db.engine, counter('primary'))]
+    listeners += [(engine, counter(f'replica {number}')) for number, engine in enumerate(replica_router.engines, 1)]
+    for engine, listener in listeners:
+        event.listen(engine, 'before_cursor_execute', listener)
+
+    results = []
+    threads = [threading.Thread(target=run_session, args=(app, number, args.turns, results))
+               for number in range(args.sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    for engine, listener in listeners:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+    requests = sum(count for count, _ in results)
+    violations = sum(count for _, count in results)
+    total = sum(counts.values())
+    print(f"\n[{label}] {requests} requests in {elapsed:.2f} s ({requests / elapsed:.0f} req/s), "
+          f"read-your-writes violations {violations}")
+    for name in sorted(counts):
+        print(f"  {name:10} {counts[name]:7} statements ({counts[name] / total:.0%})")
+    return violations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--replicas', type=int, default=2)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--sessions', type=int, default=16)
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--lag', type=float, default=1.0, help='seconds between replica refreshes')
+    args = parser.parse_args()
+    args.sessions = min(args.sessions, args.users)
+
+    workdir = tempfile.mkdtemp()
+    primary = os.path.join(workdir, 'primary.db')
+    replicas = [os.path.join(workdir, f'replica{number}.db') for number in range(1, args.replicas + 1)]
+    os.environ['DATABASE_REPLICA_URLS'] = ','.join(f'sqlite:///{replica}' for replica in replicas)
+    os.environ['DB_REPLICA_STICKY_SECONDS'] = str(max(10.0, args.lag * 2))
+
+    print(f"Seeding {args.users} users and {args.products:,} products, {args.replicas} replicas...")
+    app = seed(f'sqlite:///{primary}', args.users, args.products)
+    from replicas import copy_sqlite, replica_router
+    for replica in replicas:
+        copy_sqlite(primary, replica)
+
+    stopped = threading.Event()
+    thread = threading.Thread(target=replicator, args=(primary, replicas, args.lag, stopped), daemon=True)
+    thread.start()
+    try:
+        sticky = run_mode(app, 'sticky', args)
+        replica_router._sticky.enabled = False
+        run_mode(app, 'no stickiness', args)
+    finally:
+        stopped.set()
+        thread.join()
+
+    if sticky:
+        sys.exit("Read-your-writes violated with stickiness on")
+
+
+if __name__ == '__main__':
+    main()
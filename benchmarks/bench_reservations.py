@@ -0,0 +1,157 @@
+"""
+Stress test: hundreds of parallel buyers on one SKU (reservations.py)
+
+Seeds N buyers and one product with --stock units, logs every buyer in, then
+releases them at once against /api/add-to-cart for --quantity units each.
+Runs with stock reservations on and, for comparison, off (the per-cart stock
+check only), and checks the database afterwards:
+- sold: units in carts for the product; must not exceed --stock
+- held: units in stock_reservation; with reservations on, sold == held and
+  stock + held == --stock
+- accepted/rejected: 200 and 409 answers; every other status is an error
+
+Targets: "testclient" (Flask test client, one thread per buyer) or
+"gunicorn" (gunicorn.conf.py with --workers processes, over HTTP).
+
+Usage:
+    python benchmarks/bench_reservations.py --buyers 300 --stock 100
+    python benchmarks/bench_reservations.py --target gunicorn --workers 4 --database-url postgresql://localhost/shop
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from loadtest import ROOT, PASSWORD, TestClientSession, HTTPSession, percentile, seed, free_port, wait_for
+
+
+def reset(engine, product_id, stock):
+    """Empty the carts and holds and give the product its stock back."""
+    from models import User, Product, CartItem, StockReservation
+    with engine.begin() as connection:
+        connection.execute(StockReservation.__table__.delete())
+        connection.execute(CartItem.__table__.delete())
+        connection.execute(User.__table__.update().values(cart_count=0))
+        connection.execute(Product.__table__.update().where(Product.__table__.c.id == product_id).values(stock=stock))
+
+
+def inventory(engine, product_id):
+    from sqlalchemy import select, func
+    from models import Product, CartItem, StockReservation
+    with engine.connect() as connection:
+        stock = connection.scalar(select(Product.stock).where(Product.id == product_id))
+        sold = connection.scalar(select(func.coalesce(func.sum(CartItem.quantity), 0))
+                                 .where(CartItem.product_id == product_id))
+        held = connection.scalar(select(func.coalesce(func.sum(StockReservation.quantity), 0))
+                                 .where(StockReservation.product_id == product_id))
+    return stock, sold, held
+
+
+def stampede(make_session, buyers, product_id, quantity):
+    """Log every buyer in, then send all add-to-cart requests at once."""
+    statuses, latencies = [], []
+    lock = threading.Lock()
+    started = []
+    ready = threading.Barrier(buyers, action=lambda: started.append(time.perf_counter()))
+
+    def buyer(number):
+        client = make_session()
+        client.request('POST', '/login', form={'username': f'load{number}', 'password': PASSWORD})
+        ready.wait()
+        start = time.perf_counter()
+        try:
+            status, _, _ = client.request('POST', '/api/add-to-cart',
+                                          json_body={'product_id': product_id, 'quantity': quantity})
+        except OSError:
+            status = 0
+        with lock:
+            statuses.append(status)
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=buyer, args=(number,)) for number in range(buyers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses, latencies, time.perf_counter() - started[0]
+
+
+def run_mode(label, make_session, engine, product_id, args):
+    statuses, latencies, elapsed = stampede(make_session, args.buyers, product_id, args.quantity)
+    stock, sold, held = inventory(engine, product_id)
+    accepted = statuses.count(200)
+    rejected = statuses.count(409)
+    errors = len(statuses) - accepted - rejected
+    oversold = max(0, sold - args.stock)
+    print(f"\n[{label}] {len(statuses)} buyers in {elapsed:.2f} s ({len(statuses) / elapsed:.0f} req/s), "
+          f"p50 {percentile(latencies, 50) * 1000:.1f} ms, p99 {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"  accepted {accepted}, rejected {rejected}, errors {errors}")
+    print(f"  stock left {stock}, sold {sold}, held {held}, oversold {oversold}")
+    return oversold, stock, sold, held, accepted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--buyers', type=int, default=300)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--quantity', type=int, default=1, help='units each buyer adds')
+    parser.add_argument('--target', choices=['testclient', 'gunicorn'], default='testclient')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file (must be empty)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench_reservations.db')}"
+    if args.target == 'testclient':
+        # Every buyer thread holds a connection while it waits for the write lock
+        os.environ.setdefault('DB_MAX_OVERFLOW', str(args.buyers))
+    print(f"Seeding {args.buyers} buyers and one product with {args.stock} units...")
+    app = seed(database_url, args.buyers, 1)
+
+    from sqlalchemy import create_engine, select, func
+    from models import Product
+    engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"])
+    with engine.connect() as connection:
+        product_id = connection.scalar(select(func.min(Product.id)))
+
+    failures = []
+    for enabled in (True, False):
+        label = 'reservations' if enabled else 'cart check only'
+        reset(engine, product_id, args.stock)
+
+        if args.target == 'testclient':
+            from reservations import stock_reservations
+            stock_reservations.enabled = enabled
+            result = run_mode(label, lambda: TestClientSession(app), engine, product_id, args)
+        else:
+            port = free_port()
+            env = dict(os.environ, DATABASE_URL=database_url, WEB_CONCURRENCY=str(args.workers),
+                       STOCK_RESERVATIONS_ENABLED='1' if enabled else '0',
+                       CACHE_BACKEND=f"sqlite:///{os.path.join(workdir, 'cache.db')}")
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+                 '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app'],
+                cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for(port)
+                result = run_mode(label, lambda: HTTPSession(f'http://127.0.0.1:{port}'), engine, product_id, args)
+            finally:
+                server.terminate()
+                server.wait()
+
+        oversold, stock, sold, held, accepted = result
+        if enabled and (oversold or sold != held or stock + held != args.stock
+                        or accepted != min(args.buyers, args.stock // args.quantity)):
+            failures.append(label)
+
+    if failures:
+        sys.exit(f"Inventory check failed: {', '.join(failures)}")
+    print("\nReservations: no overselling, every held unit is in a cart")
+
+
+if __name__ == '__main__':
+    main()
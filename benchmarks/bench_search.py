@@ -0,0 +1,118 @@
+"""
+Benchmark: in-memory BM25 index vs. ILIKE title scans
+
+Seeds a throwaway SQLite database with a synthetic catalog, then times the
+keyword path of routes.search_products both ways:
+- ILIKE: or_(*[Product.title.ilike('%term%')]).limit(6)
+- Index: product_index.search(terms, limit=6)
+
+Usage:
+    python benchmarks/bench_search.py --products 1000000 --queries 200
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADJECTIVES = ['wireless', 'premium', 'classic', 'smart', 'portable', 'ergonomic', 'vintage',
+              'compact', 'deluxe', 'organic', 'waterproof', 'lightweight', 'heavy', 'digital']
+NOUNS = {
+    'Electronics': ['headphones', 'speaker', 'charger', 'mouse', 'keyboard', 'webcam', 'watch',
+                    'monitor', 'tablet', 'router', 'earbuds', 'microphone'],
+    'Books': ['novel', 'handbook', 'guide', 'cookbook', 'biography', 'atlas', 'anthology',
+              'textbook', 'journal', 'workbook'],
+    'Textiles': ['shirt', 'jacket', 'scarf', 'shorts', 'sweater', 'blanket', 'towel', 'hoodie',
+                 'socks', 'dress'],
+}
+QUERIES = ['wireless headphones', 'smart watch', 'cotton shirt', 'portable speaker', 'cookbook',
+           'waterproof jacket', 'vintage atlas', 'ergonomic keyboard', 'wool scarf', 'deluxe blanket']
+
+
+def synthetic_rows(count, seed=42):
+    rng = random.Random(seed)
+    categories = list(NOUNS)
+    for i in range(count):
+        category = rng.choice(categories)
+        noun = rng.choice(NOUNS[category])
+        title = f"{rng.choice(ADJECTIVES).title()} {noun.title()} {rng.choice(ADJECTIVES).title()} {i}"
+        yield {
+            'title': title,
+            'description': f"A {rng.choice(ADJECTIVES)} {noun} for everyday use.",
+            'price': round(rng.uniform(5, 500), 2),
+            'category': category,
+            'rating': round(rng.uniform(3.0, 5.0), 1),
+        }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(label, samples):
+    print(f"{label:>6}: mean {statistics.mean(samples) * 1000:8.3f} ms | "
+          f"p50 {percentile(samples, 50) * 1000:8.3f} ms | p99 {percentile(samples, 99) * 1000:8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+
+    from sqlalchemy import insert, or_
+    from main import app
+    from app import db
+    from migrations import migrate
+    from models import Product
+    from search_index import product_index, build_product_index
+
+    with app.app_context():
+        migrate()
+        print(f"Seeding {args.products} products...")
+        batch = []
+        for row in synthetic_rows(args.products):
+            batch.append(row)
+            if len(batch) == 5000:
+                db.session.execute(insert(Product), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Product), batch)
+        db.session.commit()
+
+        start = time.perf_counter()
+        build_product_index()
+        print(f"Index built over {len(product_index)} products in {time.perf_counter() - start:.2f} s")
+
+        rng = random.Random(7)
+        queries = [rng.choice(QUERIES).split() for _ in range(args.queries)]
+
+        # Warm the lazily built impact lists once, as the first request after startup would
+        for terms in set(map(tuple, queries)):
+            product_index.search(list(terms), limit=6)
+
+        ilike_times, index_times = [], []
+        for terms in queries:
+            start = time.perf_counter()
+            Product.query.filter(or_(*[Product.title.ilike(f'%{t}%') for t in terms])).limit(6).all()
+            ilike_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            product_index.search(terms, limit=6)
+            index_times.append(time.perf_counter() - start)
+
+        report('ILIKE', ilike_times)
+        report('Index', index_times)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark: recall and latency of the IVF semantic index (semantic_index.py)
+
+Embeds a synthetic catalog (catalog_import.synthetic_products) into a
+memory-mapped SemanticProductIndex, then for a set of natural-language and
+title-style queries compares the IVF results with an exact scan:
+- recall@k: share of IVF hits scoring at least the exact k-th best score
+  (tie-aware, since many synthetic products share a title pattern)
+- p50/p99 latency of single queries, and throughput of search_batch()
+
+Usage:
+    python benchmarks/bench_semantic.py --products 1000000
+    python benchmarks/bench_semantic.py --products 200000 --nprobe 4 --nprobe 12 --nprobe 32
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+NATURAL_QUERIES = [
+    'something to listen to music', 'warm clothes for winter', 'learn to code', 'gift for a runner',
+    'stay fit at the gym', 'charge my phone', 'video calls from home', 'books about cooking',
+    'summer outfit', 'play games on my desk', 'read a good story', 'track my workout',
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_queries(count, seed=11):
+    from catalog_import import SYNTHETIC_VOCABULARY
+
+    rng = random.Random(seed)
+    queries = list(NATURAL_QUERIES)
+    while len(queries) < count:
+        adjectives, nouns = SYNTHETIC_VOCABULARY[rng.choice(list(SYNTHETIC_VOCABULARY))]
+        queries.append(f'{rng.choice(adjectives)} {rng.choice(nouns)}'.lower())
+    return queries[:count]
+
+
+def exact_kth_scores(index, queries, k):
+    import numpy as np
+
+    vectors = np.asarray(index._vectors)
+    kth = []
+    for text in queries:
+        scores = vectors @ index.embed(text)
+        kth.append(-float(np.partition(-scores, k - 1)[k - 1]) if len(scores) >= k else 0.0)
+    return kth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=6)
+    parser.add_argument('--nprobe', type=int, action='append', help='repeat to compare settings (default 12)')
+    parser.add_argument('--dimensions', type=int, default=256)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench_semantic.db')}"
+    os.environ['SEMANTIC_SEARCH_ENABLED'] = '0'
+
+    from catalog_import import synthetic_products
+    from semantic_index import SemanticProductIndex, np
+
+    if np is None:
+        sys.exit('NumPy is not installed (pip install ".[numpy]")')
+
+    def documents():
+        return ((int(record['sku'][4:]), record['title'], record['description'], record['category'])
+                for record in synthetic_products(args.products))
+
+    index = SemanticProductIndex(dimensions=args.dimensions, path=os.path.join(workdir, 'vectors.npy'))
+    start = time.perf_counter()
+    index.build(documents)
+    print(f"Embedded {len(index):,} products in {time.perf_counter() - start:.1f}s "
+          f"({index._vectors.nbytes / 2**20:,.0f} MiB memory-mapped, "
+          f"{0 if index._centroids is None else len(index._centroids)} IVF lists)")
+
+    queries = make_queries(args.queries)
+    kth = exact_kth_scores(index, queries, args.k)
+
+    for nprobe in args.nprobe or [12]:
+        index.nprobe = nprobe
+        samples, found, wanted = [], 0, 0
+        for text, threshold in zip(queries, kth):
+            begin = time.perf_counter()
+            hits = index.search(text, limit=args.k)
+            samples.append(time.perf_counter() - begin)
+            found += sum(1 for _, score in hits if score >= threshold - 1e-6)
+            wanted += args.k
+
+        begin = time.perf_counter()
+        index.search_batch(queries, limit=args.k)
+        batch_rate = len(queries) / (time.perf_counter() - begin)
+
+        print(f"  nprobe={nprobe:<4} recall@{args.k} {found / wanted:6.3f}   "
+              f"p50 {percentile(samples, 50) * 1000:7.2f} ms   p99 {percentile(samples, 99) * 1000:7.2f} ms   "
+              f"batch {batch_rate:8,.0f} q/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: throughput of the production serving profile (gunicorn.conf.py, db_profile.py)
+
+Seeds one SQLite (or --database-url) database, then runs the load test of
+benchmarks/loadtest.py against gunicorn started in each profile:
+- baseline:   `gunicorn main:app` (one sync worker) with the previous database
+              settings (pre-ping, rollback journal, synchronous=FULL)
+- db-only:    the same single worker with the new database settings
+              (no pre-ping, WAL, synchronous=NORMAL, busy_timeout)
+- production: `gunicorn -c gunicorn.conf.py main:app` (CPU-sized gthread
+              workers, per-worker pool, shared cache backend)
+
+Usage:
+    python benchmarks/bench_serving.py --sessions 64 --turns 20
+    python benchmarks/bench_serving.py --profile baseline --profile production --database-url postgresql://localhost/shop
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from loadtest import ROOT, MIXES, HTTPSession, drive, free_port, wait_for
+
+LEGACY_DATABASE = {'DB_POOL_PRE_PING': '1', 'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'}
+TUNED_DATABASE = {'DB_POOL_PRE_PING': '0', 'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL'}
+
+PROFILES = {
+    'baseline': ([], LEGACY_DATABASE),
+    'db-only': ([], TUNED_DATABASE),
+    'production': (['-c', os.path.join(ROOT, 'gunicorn.conf.py')], {}),
+}
+
+
+def run_profile(name, database_url, args, workdir):
+    gunicorn_args, overrides = PROFILES[name]
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, **overrides)
+    if name == 'production':
+        # Keep the shared cache file out of the source tree
+        env.setdefault('CACHE_BACKEND', f"sqlite:///{os.path.join(workdir, 'cache.db')}")
+    command = [sys.executable, '-m', 'gunicorn', *gunicorn_args, '--bind', f'127.0.0.1:{port}',
+               '--log-level', 'warning', 'main:app']
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        return drive(lambda: HTTPSession(f'http://127.0.0.1:{port}'), name, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--sessions', type=int, default=64)
+    parser.add_argument('--turns', type=int, default=20)
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default')
+    parser.add_argument('--add-rate', type=float, default=0.3)
+    parser.add_argument('--profile', action='append', choices=sorted(PROFILES), help='repeat to pick profiles')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench_serving.db')}"
+    print(f"Seeding {args.users} users and {args.products} products...")
+    subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'loadtest.py'), '--seed-only',
+                    '--users', str(args.users), '--products', str(args.products)],
+                   cwd=ROOT, env=dict(os.environ, DATABASE_URL=database_url), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    summaries = [run_profile(name, database_url, args, workdir)
+                 for name in args.profile or ['baseline', 'db-only', 'production']]
+
+    base = summaries[0]
+    print(f"\n{'profile':<12} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}  speedup")
+    for summary in summaries:
+        overall = summary['endpoints'].get('all', {'p50_ms': 0.0, 'p99_ms': 0.0})
+        speedup = summary['requests_per_second'] / base['requests_per_second'] if base['requests_per_second'] else 0
+        print(f"{summary['label']:<12} {summary['requests_per_second']:8.0f} {overall['p50_ms']:8.1f} "
+              f"{overall['p99_ms']:8.1f}  {speedup:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark: combined catalog filters from the database versus the NumPy
+columnar snapshot (catalog_snapshot.py)
+
+Loads a synthetic catalog into a throwaway database, runs a mix of
+category/price/rating/stock filters through routes.filter_catalog with the
+snapshot disabled and enabled, checks both return the same products and
+prints mean and p99 latency.
+
+Usage:
+    python benchmarks/bench_snapshot.py --products 500000
+    python benchmarks/bench_snapshot.py --database-url postgresql://localhost/shopmate_bench
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def filter_mix(count, seed=7):
+    rng = random.Random(seed)
+    categories = [None, 'Electronics', 'Books', 'Textiles']
+    return [{
+        'category': rng.choice(categories),
+        'max_price': rng.choice([None, 20, 50, 100, 250]),
+        'min_rating': rng.choice([None, 4.0, 4.5, 4.8]),
+        'in_stock': rng.random() < 0.5,
+    } for _ in range(count)]
+
+
+def run(filter_catalog, filters):
+    samples, results = [], []
+    for kwargs in filters:
+        start = time.perf_counter()
+        products = filter_catalog(**kwargs)
+        samples.append(time.perf_counter() - start)
+        results.append([p.id for p in products])
+    return samples, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file (must be empty)')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_snapshot.db')}"
+
+    from main import app
+    from migrations import migrate
+    from catalog_import import synthetic_products, normalize_product, load_products
+    from catalog_snapshot import catalog_snapshot
+    import routes
+
+    if catalog_snapshot is None:
+        sys.exit('NumPy is not installed (pip install ".[numpy]")')
+
+    with app.app_context():
+        migrate()
+        print(f"Loading {args.products:,} synthetic products...")
+        load_products(normalize_product(record) for record in synthetic_products(args.products))
+        filters = filter_mix(args.queries)
+
+        catalog_snapshot.ready = False
+        db_samples, db_results = run(routes.filter_catalog, filters)
+        catalog_snapshot.ready = True
+        snapshot_samples, snapshot_results = run(routes.filter_catalog, filters)
+
+    for label, samples in (('database', db_samples), ('snapshot', snapshot_samples)):
+        mean = sum(samples) / len(samples)
+        print(f"  {label:<10} mean {mean * 1000:8.3f} ms   p99 {percentile(samples, 99) * 1000:8.3f} ms")
+
+    mismatches = sum(1 for a, b in zip(db_results, snapshot_results) if a != b)
+    print(f"  result mismatches: {mismatches}/{len(filters)}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
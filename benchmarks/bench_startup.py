@@ -0,0 +1,161 @@
+"""
+Benchmark: cold-start time of the app factory, the warm-up and gunicorn workers
+
+Seeds a SQLite (or --database-url) database with M synthetic products, then
+measures, each in fresh processes:
+- import:  `from main import app` (create_app(); no database access)
+- warm-up: app.warm_up() (schema check, search index, snapshot, embeddings)
+- first request: a request to a cold app, which pays for the warm-up, and
+  the next one
+- gunicorn with and without preloading (GUNICORN_PRELOAD): seconds from
+  launch until every worker has answered a request, the slowest of the
+  first requests, and the private memory (USS) per worker. Preloaded
+  workers share the catalog caches built in the master
+
+Usage:
+    python benchmarks/bench_startup.py --products 20000
+    python benchmarks/bench_startup.py --workers 4 --repeat 5 --database-url postgresql://localhost/shop
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from loadtest import ROOT, free_port
+
+# Runs in a fresh interpreter so module imports are cold
+COLD_START = '''
+import json, time
+start = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+client = app.test_client()
+client.get("/")
+first = time.perf_counter()
+client.get("/")
+second = time.perf_counter()
+print(json.dumps({"import": imported - start, "first_request": first - imported, "second_request": second - first}))
+'''
+
+WARM_UP = '''
+import json, time
+from main import app
+from app import warm_up
+start = time.perf_counter()
+warm_up(app)
+print(json.dumps({"warm_up": time.perf_counter() - start}))
+'''
+
+
+def run_script(script, env):
+    output = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def private_memory_kb(pid):
+    """Unique set size of a process (Private_Clean + Private_Dirty), Linux only."""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            return sum(int(line.split()[1]) for line in smaps if line.startswith(('Private_Clean', 'Private_Dirty')))
+    except OSError:
+        return 0
+
+
+def worker_pids(master_pid):
+    try:
+        with open(f'/proc/{master_pid}/task/{master_pid}/children') as children:
+            return [int(pid) for pid in children.read().split()]
+    except OSError:
+        return []
+
+
+def gunicorn_start(env, workers, preload):
+    """Start gunicorn and time it until every worker has served a request."""
+    port = free_port()
+    env = dict(env, WEB_CONCURRENCY=str(workers), GUNICORN_PRELOAD='1' if preload else '0')
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'),
+               '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app']
+    start = time.perf_counter()
+    server = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        def fetch(_):
+            # New connection per request, so gunicorn spreads them over the workers
+            request_start = time.perf_counter()
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=120) as response:
+                response.read()
+            return time.perf_counter() - request_start
+
+        deadline = time.time() + 120
+        while True:
+            try:
+                fetch(None)
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.05)
+        listening = time.perf_counter() - start
+
+        # Enough concurrent requests to reach every worker while it is cold
+        with ThreadPoolExecutor(workers * 4) as pool:
+            latencies = list(pool.map(fetch, range(workers * 8)))
+        all_ready = time.perf_counter() - start
+        pids = worker_pids(server.pid)
+        memory = [private_memory_kb(pid) for pid in pids]
+        return {
+            'first_response': listening,
+            'all_workers_ready': all_ready,
+            'slowest_request': max(latencies),
+            'worker_uss_mb': sum(memory) / len(memory) / 1024 if memory else 0.0,
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement; the median is reported')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench_startup.db')}"
+    env = dict(os.environ, DATABASE_URL=database_url, CACHE_BACKEND=f"sqlite:///{os.path.join(workdir, 'cache.db')}")
+    print(f"Seeding {args.products:,} products...")
+    subprocess.run([sys.executable, os.path.join(ROOT, 'benchmarks', 'loadtest.py'), '--seed-only',
+                    '--users', '1', '--products', str(args.products)],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    cold = [run_script(COLD_START, env) for _ in range(args.repeat)]
+    warm = [run_script(WARM_UP, env) for _ in range(args.repeat)]
+    print(f"\n{'in-process':<24} {'median s':>9}")
+    for key in ('import', 'first_request', 'second_request'):
+        print(f"{key:<24} {median([run[key] for run in cold]):9.3f}")
+    print(f"{'warm_up':<24} {median([run['warm_up'] for run in warm]):9.3f}")
+
+    print(f"\n{args.workers} gunicorn workers   {'first 200 s':>11} {'all ready s':>11} {'slowest s':>9} {'USS/worker MB':>13}")
+    for preload in (False, True):
+        runs = [gunicorn_start(env, args.workers, preload) for _ in range(args.repeat)]
+        print(f"{'preload' if preload else 'no preload':<22} {median([r['first_response'] for r in runs]):11.3f} "
+              f"{median([r['all_workers_ready'] for r in runs]):11.3f} "
+              f"{median([r['slowest_request'] for r in runs]):9.3f} "
+              f"{median([r['worker_uss_mb'] for r in runs]):13.1f}")
+
+
+if __name__ == '__main__':
+    main()
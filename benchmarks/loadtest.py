@@ -0,0 +1,309 @@
+"""
+Load-testing suite for the ShopMate AI chat endpoints
+
+Seeds a database with N users and M synthetic products, then replays a
+weighted chat message mix from many concurrent simulated sessions against
+/api/chat, /api/add-to-cart and /api/cart-count. Each session logs in as
+its own seeded user, opens /chat, and then repeats: send a message, add a
+product from a product reply to the cart (with --add-rate probability), and
+poll the cart count with its ETag.
+
+Targets:
+- testclient: Flask test client in this process (no network, one client per session)
+- gunicorn:   a local gunicorn started for the run (--workers/--threads)
+- url:        an already running server at --url (seeding is skipped)
+
+Databases: "sqlite" (a temporary file) and "postgres" (--postgres-url, skipped
+with a note when it cannot be reached). Reports throughput and p50/p95/p99
+per endpoint and overall; --json writes the same numbers for comparisons.
+
+Usage:
+    python benchmarks/loadtest.py --users 200 --products 50000 --sessions 50 --turns 20
+    python benchmarks/loadtest.py --target gunicorn --workers 4 --databases sqlite,postgres
+    python benchmarks/loadtest.py --mix cart --target url --url http://127.0.0.1:5000
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'loadtest-password'
+
+# Message families; each mix below weights them differently
+MESSAGES = {
+    'greeting': ['hi', 'hello there', 'hey'],
+    'search': ['show me electronics', 'find wireless headphones', 'search for a cookbook', 'looking for a jacket',
+               'smart watch', 'find books', 'show me textiles', 'gaming keyboard'],
+    'price': ['books under $20', 'electronics under 100', 'find jackets below 50', 'anything cheaper than 30',
+              'electronics under $150 rated 4.5+ in stock'],
+    'category': ['electronics', 'books', 'clothing', 'accessories'],
+    'cart': ['show my cart', "what's in my basket", 'cart'],
+    'help': ['help', 'what can you do'],
+    'semantic': ['something to listen to music', 'warm clothes for winter', 'learn to code'],
+}
+
+MIXES = {
+    'default': {'greeting': 5, 'search': 35, 'price': 20, 'category': 15, 'cart': 15, 'help': 5, 'semantic': 5},
+    'browse': {'search': 50, 'category': 25, 'semantic': 15, 'greeting': 10},
+    'price': {'price': 70, 'search': 20, 'cart': 10},
+    'cart': {'cart': 40, 'search': 40, 'price': 20},
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class TestClientSession:
+    """One simulated browser using the Flask test client."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, form=None, headers=None):
+        response = self.client.open(path, method=method, json=json_body, data=form, headers=headers or {})
+        body = response.get_json(silent=True)
+        return response.status_code, body, response.headers
+
+
+class HTTPSession:
+    """One simulated browser talking HTTP, with its own cookie jar."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, json_body=None, form=None, headers=None):
+        request = urllib.request.Request(f'{self.base_url}{path}', method=method, headers=headers or {})
+        if json_body is not None:
+            request.data = json.dumps(json_body).encode()
+            request.add_header('Content-Type', 'application/json')
+        elif form is not None:
+            request.data = urllib.parse.urlencode(form).encode()
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                raw = response.read()
+                status, response_headers = response.status, response.headers
+        except urllib.error.HTTPError as error:
+            raw, status, response_headers = error.read(), error.code, error.headers
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+        return status, body, response_headers
+
+
+def seed(database_url, users, products):
+    """Create the schema, N users sharing one password hash and M synthetic products."""
+    os.environ['DATABASE_URL'] = database_url
+    from sqlalchemy import insert
+    from werkzeug.security import generate_password_hash
+    from main import app
+    from app import db
+    from models import User
+    from migrations import migrate
+    from catalog_import import synthetic_products, normalize_product, load_products
+
+    with app.app_context():
+        migrate()
+        password_hash = generate_password_hash(PASSWORD)
+        rows = [{'username': f'load{i}', 'email': f'load{i}@example.com', 'password_hash': password_hash}
+                for i in range(users)]
+        for start in range(0, len(rows), 5000):
+            db.session.execute(insert(User), rows[start:start + 5000])
+        db.session.commit()
+        load_products(normalize_product(record) for record in synthetic_products(products))
+    return app
+
+
+def run_session(make_session, number, args, mix, results, ready):
+    rng = random.Random(number)
+    families = list(mix)
+    weights = [mix[family] for family in families]
+    client = make_session()
+
+    client.request('POST', '/login', form={'username': f'load{number % args.users}', 'password': PASSWORD})
+    client.request('GET', '/chat')
+    etag = None
+    ready.wait()
+
+    def timed(label, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            status, body, headers = client.request(method, path, **kwargs)
+        except OSError:
+            results['errors'].append(label)
+            return None, None
+        elapsed = time.perf_counter() - start
+        if status >= 400:
+            results['errors'].append(label)
+        else:
+            results['latencies'].setdefault(label, []).append(elapsed)
+        return body, headers
+
+    for _ in range(args.turns):
+        family = rng.choices(families, weights)[0]
+        reply, _ = timed(f'/api/chat [{family}]', 'POST', '/api/chat',
+                         json_body={'message': rng.choice(MESSAGES[family])})
+        products = ((reply or {}).get('bot_response') or {}).get('products') or []
+        if products and rng.random() < args.add_rate:
+            timed('/api/add-to-cart', 'POST', '/api/add-to-cart',
+                  json_body={'product_id': rng.choice(products)['id'], 'quantity': 1})
+        _, headers = timed('/api/cart-count', 'GET', '/api/cart-count',
+                           headers={'If-None-Match': etag} if etag else None)
+        if headers is not None and headers.get('ETag'):
+            etag = headers.get('ETag')
+
+
+def report(label, results, elapsed):
+    latencies = results['latencies']
+    everything = [sample for samples in latencies.values() for sample in samples]
+    total = len(everything)
+    summary = {'label': label, 'requests': total, 'errors': len(results['errors']),
+               'seconds': elapsed, 'requests_per_second': total / elapsed if elapsed else 0.0, 'endpoints': {}}
+
+    print(f"\n[{label}] {total} requests in {elapsed:.1f} s ({summary['requests_per_second']:.0f} req/s), "
+          f"{len(results['errors'])} errors")
+    rows = sorted(latencies.items()) + ([('all', everything)] if everything else [])
+    for path, samples in rows:
+        stats = {pct: percentile(samples, pct) * 1000 for pct in (50, 95, 99)}
+        summary['endpoints'][path] = {'count': len(samples), 'p50_ms': stats[50], 'p95_ms': stats[95],
+                                      'p99_ms': stats[99]}
+        print(f"  {path:<28} {len(samples):>7}  p50 {stats[50]:8.1f} ms | p95 {stats[95]:8.1f} ms | "
+              f"p99 {stats[99]:8.1f} ms")
+    return summary
+
+
+def drive(make_session, label, args):
+    mix = MIXES[args.mix]
+    results = {'latencies': {}, 'errors': []}
+    started = []
+    ready = threading.Barrier(args.sessions, action=lambda: started.append(time.perf_counter()))
+    threads = [threading.Thread(target=run_session, args=(make_session, number, args, mix, results, ready))
+               for number in range(args.sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return report(label, results, time.perf_counter() - started[0])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def postgres_available(url):
+    from sqlalchemy import create_engine, text
+    try:
+        engine = create_engine(url)
+        with engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+        engine.dispose()
+        return True
+    except Exception as error:
+        print(f"Skipping PostgreSQL ({url}): {error.__class__.__name__}: {str(error).splitlines()[0]}")
+        return False
+
+
+def run_database(database, database_url, args):
+    label = f'{args.target}/{database}/{args.mix}'
+    if args.target == 'url':
+        return drive(lambda: HTTPSession(args.url.rstrip('/')), label, args)
+
+    print(f"Seeding {args.users} users and {args.products} products into {database}...")
+    if args.target == 'testclient':
+        app = seed(database_url, args.users, args.products)
+        return drive(lambda: TestClientSession(app), label, args)
+
+    # gunicorn: seed in a child so this process never imports the app for another database
+    subprocess.run([sys.executable, __file__, '--seed-only', '--users', str(args.users),
+                    '--products', str(args.products)], cwd=ROOT, env=dict(os.environ, DATABASE_URL=database_url),
+                   check=True)
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+         '--threads', str(args.threads), '--log-level', 'warning', 'main:app'],
+        cwd=ROOT, env=dict(os.environ, DATABASE_URL=database_url),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(port)
+        return drive(lambda: HTTPSession(f'http://127.0.0.1:{port}'), label, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100, help='seeded user accounts')
+    parser.add_argument('--products', type=int, default=10000, help='seeded synthetic products')
+    parser.add_argument('--sessions', type=int, default=32, help='concurrent simulated chat sessions')
+    parser.add_argument('--turns', type=int, default=20, help='chat turns per session')
+    parser.add_argument('--mix', choices=sorted(MIXES), default='default', help='message mix')
+    parser.add_argument('--add-rate', type=float, default=0.3, help='chance of adding a shown product to the cart')
+    parser.add_argument('--target', choices=['testclient', 'gunicorn', 'url'], default='testclient')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--url', help='base URL for --target url')
+    parser.add_argument('--databases', default='sqlite', help='comma-separated: sqlite,postgres')
+    parser.add_argument('--postgres-url', default=os.environ.get('LOADTEST_POSTGRES_URL',
+                                                                 'postgresql://localhost/shopmate_loadtest'))
+    parser.add_argument('--json', help='write the summaries to this file')
+    parser.add_argument('--seed-only', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed_only:
+        seed(os.environ['DATABASE_URL'], args.users, args.products)
+        return
+    if args.target == 'url' and not args.url:
+        parser.error('--target url needs --url')
+    if args.target == 'testclient' and ',' in args.databases:
+        parser.error('--target testclient runs one database per process; pass a single --databases value')
+
+    summaries = []
+    for database in args.databases.split(','):
+        if database == 'sqlite':
+            database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'loadtest.db')}"
+        elif database == 'postgres':
+            if not postgres_available(args.postgres_url):
+                continue
+            database_url = args.postgres_url
+        else:
+            parser.error(f'unknown database {database!r}')
+        summaries.append(run_database(database, database_url, args))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as handle:
+            json.dump(summaries, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
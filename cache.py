@@ -0,0 +1,365 @@
+"""
+Pluggable cache layer for ShopMate AI
+
+Routes cache catalog replies and per-user cart counts through named Cache
+objects backed by one of three interchangeable backends, chosen with
+app.config["CACHE_BACKEND"]:
+- "memory": process-local LRU with TTL (default, one gunicorn worker)
+- "sqlite:///path/to/cache.db": shared file for all workers on one host
+- "redis://host:port/db": any Redis-protocol server (requires the "redis" extra)
+
+Invalidation goes through the backend, so with a shared backend a Product
+or CartItem change made by one worker is seen by every worker. It happens
+once the change is committed (commit_hooks.py), so a rolled-back change
+invalidates nothing and no request can cache the old rows after it.
+
+The login-miss cache (usernames login() found no account for) keeps its
+entries in a store of the same kind with its own size limit
+(LOGIN_MISS_CACHE_MAX_ENTRIES; a separate table with SQLite), so requests
+with made-up names can't push the other entries out. Redis entries are
+bounded by the server's maxmemory-policy instead. It is off by default
+with the "memory" backend: a registration in one worker would not clear
+the name in the others.
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from models import User, Product, CartItem
+from commit_hooks import on_commit
+
+
+class MemoryBackend:
+    """
+    Thread-safe in-process LRU store with per-entry expiry.
+
+    Args:
+        max_entries (int): Entries kept before the least recently used is evicted
+    """
+
+    name = 'memory'
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self, prefix):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    Cache stored in a SQLite file shared by all worker processes on a host.
+
+    Values are pickled. When the table grows past max_entries the entries
+    closest to expiry are pruned, which approximates LRU for uniform TTLs.
+
+    Args:
+        path (str): Filesystem path of the cache database
+        max_entries (int): Soft limit on stored entries
+        table (str): Table holding the entries; each table has its own limit
+    """
+
+    name = 'sqlite'
+    PRUNE_EVERY = 256  # Check the size limit once per this many writes
+
+    def __init__(self, path, max_entries=1024, table='cache_entries'):
+        self.path = path
+        self.max_entries = max_entries
+        self.table = table
+        self.evictions = 0
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table} ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        # One connection per thread and per forked worker
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            f'SELECT value, expires_at FROM {self.table} WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] < time.time():
+            self.delete(key)
+            return None
+        return pickle.loads(row[0])
+
+    def set(self, key, value, ttl):
+        conn = self._connect()
+        conn.execute(
+            f'INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl)
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self._prune(conn)
+
+    def delete(self, key):
+        self._connect().execute(f'DELETE FROM {self.table} WHERE key = ?', (key,))
+
+    def clear(self, prefix):
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        self._connect().execute(f"DELETE FROM {self.table} WHERE key LIKE ? ESCAPE '\\'", (escaped + '%',))
+
+    def _prune(self, conn):
+        conn.execute(f'DELETE FROM {self.table} WHERE expires_at < ?', (time.time(),))
+        excess = conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                f'DELETE FROM {self.table} WHERE key IN '
+                f'(SELECT key FROM {self.table} ORDER BY expires_at LIMIT ?)', (excess,)
+            )
+            self.evictions += excess
+
+    def __len__(self):
+        return self._connect().execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+
+class RedisBackend:
+    """
+    Cache stored in a Redis-protocol server (Redis, Valkey, KeyDB, fakeredis).
+
+    Args:
+        url (str): Connection URL, e.g. "redis://localhost:6379/0"
+        key_prefix (str): Prepended to every key so several apps can share a server
+    """
+
+    name = 'redis'
+
+    def __init__(self, url, key_prefix='shopmate:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+        self.evictions = 0  # Eviction is the server's job (maxmemory-policy)
+
+    def get(self, key):
+        raw = self.client.get(self.key_prefix + key)
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.key_prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        px=max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self.client.delete(self.key_prefix + key)
+
+    def clear(self, prefix):
+        batch = []
+        for key in self.client.scan_iter(match=self.key_prefix + prefix + '*', count=500):
+            batch.append(key)
+            if len(batch) == 500:
+                self.client.unlink(*batch)
+                batch = []
+        if batch:
+            self.client.unlink(*batch)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(match=self.key_prefix + '*', count=500))
+
+
+def create_backend(spec, max_entries=1024, table='cache_entries'):
+    """
+    Build a backend from a CACHE_BACKEND setting.
+
+    Args:
+        spec (str): "memory", "sqlite:///path" or "redis://..."
+        max_entries (int): Size limit for backends that enforce one
+        table (str): SQLite table, so backends on the same file keep separate limits
+
+    Returns:
+        MemoryBackend, SQLiteBackend or RedisBackend
+    """
+    if spec == 'memory':
+        return MemoryBackend(max_entries)
+    if spec.startswith('sqlite:///'):
+        return SQLiteBackend(spec[len('sqlite:///'):], max_entries, table)
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(spec)
+    raise ValueError(f'Unknown CACHE_BACKEND: {spec!r}')
+
+
+class Cache:
+    """
+    Named view onto the shared backend with its own TTL and hit/miss counters.
+
+    Keys are tuples such as (intent, *slot values); they are namespaced so that
+    invalidate() only drops this cache's entries. A cache given its own store
+    doesn't compete with the others for the shared backend's size limit.
+
+    Args:
+        namespace (str): Key prefix, e.g. "catalog"
+        ttl (float): Seconds an entry stays valid
+    """
+
+    backend = MemoryBackend()  # Shared by Cache instances without a store; replaced by init_app()
+
+    def __init__(self, namespace, ttl=300):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.store = None  # Own backend; None uses Cache.backend
+
+    def _backend(self):
+        return Cache.backend if self.store is None else self.store
+
+    def _key(self, key):
+        return f'{self.namespace}:{key!r}'
+
+    def get(self, key):
+        """
+        Look up a cached value.
+
+        Returns:
+            The cached value, or None on a miss or expired entry
+        """
+        if not self.enabled:
+            return None
+        value = self._backend().get(self._key(key))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """
+        Store a value.
+
+        Returns:
+            The stored value, so callers can `return cache.set(key, reply)`
+        """
+        if self.enabled:
+            self._backend().set(self._key(key), value, self.ttl)
+        return value
+
+    def delete(self, key):
+        """Drop a single entry."""
+        self._backend().delete(self._key(key))
+
+    def invalidate(self):
+        """Drop every entry in this namespace, in every worker sharing the backend."""
+        self._backend().clear(self.namespace + ':')
+        self.invalidations += 1
+
+    def stats(self):
+        """
+        Return cache counters for this process.
+
+        Returns:
+            dict: backend, hits, misses, invalidations, evictions and hit_rate
+        """
+        lookups = self.hits + self.misses
+        return {
+            'backend': self._backend().name,
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'evictions': self._backend().evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+# Finished catalog replies keyed by (intent, *slots)
+catalog_cache = Cache('catalog')
+
+# Cart item counts keyed by user id
+cart_cache = Cache('cart')
+
+# Usernames recently looked up by login() without a match
+login_miss_cache = Cache('login_miss', ttl=60)
+
+
+def init_app(app):
+    """
+    Select the backend and TTLs from app.config.
+
+    Args:
+        app (Flask): Application providing CACHE_* settings
+    """
+    spec = app.config.get("CACHE_BACKEND", "memory")
+    Cache.backend = create_backend(spec, app.config.get("CACHE_MAX_ENTRIES", 1024))
+    catalog_cache.enabled = app.config.get("CATALOG_CACHE_ENABLED", True)
+    catalog_cache.ttl = app.config.get("CATALOG_CACHE_TTL", catalog_cache.ttl)
+    cart_cache.ttl = app.config.get("CART_CACHE_TTL", cart_cache.ttl)
+    login_miss_cache.ttl = app.config.get("LOGIN_MISS_CACHE_TTL", login_miss_cache.ttl)
+    # A registration only clears the name in workers sharing the backend; in the others
+    # the new account couldn't log in until the entry expires
+    enabled = app.config.get("LOGIN_MISS_CACHE_ENABLED")
+    login_miss_cache.enabled = (spec != 'memory' if enabled is None else enabled) and login_miss_cache.ttl > 0
+    # Usernames are chosen by whoever calls login(), so a flood of them gets its own
+    # bounded store instead of evicting catalog replies and cart counts
+    login_miss_cache.store = create_backend(spec, app.config.get("LOGIN_MISS_CACHE_MAX_ENTRIES", 1024),
+                                            table='login_miss_entries') if login_miss_cache.enabled else None
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Product, 'after_delete')
+def _invalidate_catalog(mapper, connection, target):
+    """Any product change can alter cached listings, so start over."""
+    on_commit(target, catalog_cache.invalidate)
+
+
+@event.listens_for(CartItem, 'after_insert')
+@event.listens_for(CartItem, 'after_update')
+@event.listens_for(CartItem, 'after_delete')
+def _invalidate_cart_count(mapper, connection, target):
+    """Forget the cached count of the cart that changed."""
+    on_commit(target, cart_cache.delete, target.user_id)
+
+
+@event.listens_for(User, 'after_insert')
+def _forget_login_miss(mapper, connection, target):
+    """A new account can log in at once, even if its name was just tried."""
+    on_commit(target, login_miss_cache.delete, target.username)
@@ -0,0 +1,228 @@
+"""
+Batched cart mutations and cart snapshots for ShopMate AI
+
+POST /api/cart applies a list of add/remove/set operations in one
+transaction and answers with the resulting cart:
+- The products involved are locked first (SELECT ... FOR UPDATE on
+  PostgreSQL, in id order so concurrent batches can't deadlock). SQLite has
+  no row locks; its first write takes the database write lock, so the
+  stock check below already runs against committed stock
+- Every operation is a single statement (upsert or delete), so operations
+  on the same product compose in order
+- With stock reservations on (STOCK_RESERVATIONS_ENABLED, see reservations.py) the lines'
+  holds are then adjusted with conditional UPDATEs of Product.stock.
+  Otherwise one query finds cart lines above Product.stock. Either way a
+  shortage rolls the whole batch back. Products without a stock value
+  aren't limited
+- The snapshot (lines, line count, quantity and total) comes from one query
+  whose totals are window aggregates, not sums computed in Python
+
+Statement builders are shared with the async API (async_api.py).
+"""
+
+from sqlalchemy import select, delete, func
+from app import db
+from models import User, Product, CartItem
+from cache import cart_cache
+from reservations import stock_reservations
+
+OPERATIONS = ('add', 'remove', 'set')
+
+
+class CartError(Exception):
+    """
+    A cart request that can't be applied.
+
+    Args:
+        message (str): Error shown to the client
+        status (int): HTTP status of the response
+        items (list): Per-product details, e.g. requested and available stock
+    """
+
+    def __init__(self, message, status=400, items=None):
+        super().__init__(message)
+        self.status = status
+        self.items = items or []
+
+    def to_dict(self):
+        payload = {'error': str(self)}
+        if self.items:
+            payload['items'] = self.items
+        return payload
+
+
+def parse_operations(operations, max_operations=100):
+    """
+    Validate the operations of a batch request.
+
+    Args:
+        operations (list): [{'op': 'add'|'remove'|'set', 'product_id': int, 'quantity': int}, ...];
+            'add' defaults to quantity 1, 'set' to 0 removes the line, 'remove' ignores quantity
+        max_operations (int): Largest accepted batch
+
+    Returns:
+        list: (op, product_id, quantity) tuples
+
+    Raises:
+        CartError: The batch is empty, too large or malformed
+    """
+    if not isinstance(operations, list) or not operations:
+        raise CartError('operations must be a non-empty list')
+    if len(operations) > max_operations:
+        raise CartError(f'At most {max_operations} operations per request')
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise CartError(f'Operation {index}: op must be one of {", ".join(OPERATIONS)}')
+        product_id = operation.get('product_id')
+        quantity = operation.get('quantity', 1 if operation['op'] == 'add' else 0)
+        if not _is_int(product_id):
+            raise CartError(f'Operation {index}: product_id must be an integer')
+        if operation['op'] != 'remove' and (not _is_int(quantity) or quantity < (1 if operation['op'] == 'add' else 0)):
+            raise CartError(f'Operation {index}: invalid quantity')
+        parsed.append((operation['op'], product_id, quantity))
+    return parsed
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def lock_products_statement(product_ids):
+    """SELECT the products of a batch FOR UPDATE, in id order (no-op lock on SQLite)."""
+    return (select(Product.id, Product.title, Product.stock)
+            .where(Product.id.in_(product_ids))
+            .order_by(Product.id)
+            .with_for_update())
+
+
+def operation_statement(dialect_name, user_id, op, product_id, quantity):
+    """
+    Build the single statement applying one cart operation.
+
+    Args:
+        dialect_name (str): 'sqlite' or 'postgresql'
+        user_id (int): Cart owner
+        op (str): 'add', 'remove' or 'set'
+        product_id (int): Product of the cart line
+        quantity (int): Quantity to add or set
+
+    Returns:
+        Executable: Upsert or delete statement
+    """
+    if op == 'remove' or (op == 'set' and quantity == 0):
+        return delete(CartItem).where(CartItem.user_id == user_id, CartItem.product_id == product_id)
+    return CartItem.upsert_statement(dialect_name, user_id, product_id, quantity, replace=(op == 'set'))
+
+
+def over_stock_statement(user_id, product_ids):
+    """SELECT the user's cart lines among product_ids whose quantity exceeds Product.stock."""
+    return (select(CartItem.product_id, Product.title, CartItem.quantity, Product.stock)
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.user_id == user_id, CartItem.product_id.in_(product_ids),
+                   Product.stock.is_not(None), CartItem.quantity > Product.stock)
+            .order_by(CartItem.product_id))
+
+
+def over_stock_error(rows):
+    """CartError (409) describing over-stock rows from over_stock_statement()."""
+    return CartError('Not enough stock', status=409, items=[
+        {'product_id': row.product_id, 'title': row.title, 'requested': row.quantity, 'available': row.stock}
+        for row in rows
+    ])
+
+
+def shortage_error(shortages, titles):
+    """
+    CartError (409) for the shortages returned by stock_reservations.reserve().
+
+    Args:
+        shortages (list): {'product_id', 'requested', 'available'} dicts
+        titles (dict): product_id -> title
+    """
+    return CartError('Not enough stock', status=409, items=[
+        dict(shortage, title=titles[shortage['product_id']]) for shortage in shortages
+    ])
+
+
+def snapshot_statement(user_id):
+    """
+    SELECT the cart lines of a user with the cart's line count, quantity and
+    total repeated on every row as window aggregates.
+    """
+    subtotal = CartItem.quantity * Product.price
+    return (select(CartItem.product_id, Product.title, Product.price, CartItem.quantity,
+                   subtotal.label('subtotal'),
+                   func.count().over().label('line_count'),
+                   func.sum(CartItem.quantity).over().label('quantity_total'),
+                   func.sum(subtotal).over().label('total'))
+            .join(Product, Product.id == CartItem.product_id)
+            .where(CartItem.user_id == user_id)
+            .order_by(CartItem.id))
+
+
+def snapshot_from_rows(rows):
+    """
+    Build the cart snapshot returned by the API from snapshot_statement() rows.
+
+    Returns:
+        dict: {'items': [...], 'count': lines, 'quantity': units, 'total': amount}
+    """
+    items = [{'product_id': row.product_id, 'title': row.title, 'price': row.price,
+              'quantity': row.quantity, 'subtotal': round(row.subtotal, 2)} for row in rows]
+    if not rows:
+        return {'items': items, 'count': 0, 'quantity': 0, 'total': 0.0}
+    return {'items': items, 'count': rows[0].line_count, 'quantity': rows[0].quantity_total,
+            'total': round(rows[0].total, 2)}
+
+
+def cart_snapshot(user_id):
+    """Return the current cart snapshot of a user (one query). Requires an app context."""
+    return snapshot_from_rows(db.session.execute(snapshot_statement(user_id)).all())
+
+
+def apply_operations(user_id, operations):
+    """
+    Apply parsed operations to a user's cart in one transaction.
+
+    Args:
+        user_id (int): Cart owner
+        operations (list): (op, product_id, quantity) tuples from parse_operations()
+
+    Returns:
+        dict: Cart snapshot after the commit
+
+    Raises:
+        CartError: Unknown products (404) or not enough stock (409); nothing is changed
+    """
+    product_ids = sorted({product_id for _, product_id, _ in operations})
+    dialect_name = db.session.get_bind().dialect.name
+    try:
+        found = {row.id: row for row in db.session.execute(lock_products_statement(product_ids))}
+        missing = [product_id for product_id in product_ids if product_id not in found]
+        if missing:
+            raise CartError('Product not found', status=404, items=[{'product_id': product_id} for product_id in missing])
+
+        for op, product_id, quantity in operations:
+            db.session.execute(operation_statement(dialect_name, user_id, op, product_id, quantity))
+
+        if stock_reservations.enabled:
+            shortages = stock_reservations.reserve(db.session, user_id, {row.id: row.stock for row in found.values()})
+            if shortages:
+                raise shortage_error(shortages, {row.id: row.title for row in found.values()})
+        else:
+            over_stock = db.session.execute(over_stock_statement(user_id, product_ids)).all()
+            if over_stock:
+                raise over_stock_error(over_stock)
+
+        # Core writes bypass the ORM counter events, so recompute the denormalized count
+        cart_count = db.session.scalar(User.refresh_cart_count_statement(user_id))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # Share the updated count with the other workers
+    cart_cache.set(user_id, cart_count)
+    return cart_snapshot(user_id)
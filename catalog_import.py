@@ -0,0 +1,432 @@
+"""
+Bulk catalog ingestion for ShopMate AI
+
+Loads product catalogs far larger than create_mock_data.py's per-row
+session.add() loop can handle:
+- CSV or JSONL input (optionally gzip-compressed) is streamed in fixed-size
+  chunks, so memory use is bounded by the chunk size, not the file size
+- Each chunk is written with one multi-row INSERT batch (SQLAlchemy's
+  insertmanyvalues) or, on PostgreSQL with --copy, with COPY FROM STDIN
+- Upsert mode matches rows on Product.sku, so a refreshed feed updates
+  prices, ratings and stock in place instead of duplicating products; the
+  units held by carts (reservations.py) are subtracted from the feed's stock
+- Progress (rows read/written/rejected, rows per second) is reported per chunk
+- A synthetic catalog generator produces millions of products for scale tests
+
+Core-level writes bypass the ORM mapper events, so the catalog cache, the
+in-process search indexes and the catalog snapshot are refreshed once at
+the end of the load. A reload entry in the catalog change feed makes every
+other process rebuild its copies too (see catalog_sync.py).
+
+Usage:
+    python catalog_import.py import catalog.csv                  # Upsert by SKU
+    python catalog_import.py import catalog.jsonl --mode insert  # Append only
+    python catalog_import.py import catalog.csv.gz --copy        # PostgreSQL COPY
+    python catalog_import.py generate 2000000 synthetic.jsonl    # Scale-test feed
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import random
+import sys
+import time
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import insert, select, func, literal_column
+from sqlalchemy.dialects import postgresql, sqlite
+from app import create_app, db
+from models import Product, StockReservation
+from cache import catalog_cache
+import migrations
+from catalog_sync import catalog_sync, record_reload, rebuild
+
+logger = logging.getLogger(__name__)
+
+# Columns accepted from a feed, in COPY/CSV order
+PRODUCT_FIELDS = ['sku', 'title', 'description', 'price', 'category', 'rating', 'image_url', 'stock']
+
+# Columns an upsert overwrites on an existing SKU
+UPDATE_FIELDS = ['title', 'description', 'price', 'category', 'rating', 'image_url', 'stock', 'updated_at']
+
+IMPORT_MODES = ('upsert', 'insert', 'replace')
+
+
+def open_feed(path, mode='rt'):
+    """Open a feed file as text, transparently handling .gz."""
+    if path == '-':
+        return sys.stdin if 'r' in mode else sys.stdout
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def feed_format(path, fmt=None):
+    """Return 'csv' or 'jsonl' for a feed, from fmt or the file extension."""
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'jsonl' if name.endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_records(path, fmt=None):
+    """
+    Stream raw records from a CSV or JSONL feed.
+
+    Args:
+        path (str): Feed file, "-" for stdin
+        fmt (str): 'csv' or 'jsonl'; guessed from the extension when omitted
+
+    Yields:
+        dict: One record per product line
+    """
+    with open_feed(path) as feed:
+        if feed_format(path, fmt) == 'csv':
+            yield from csv.DictReader(feed)
+        else:
+            for line in feed:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _field(record, name, default):
+    # Only a missing or empty field takes the default; 0 is a real stock or rating
+    value = record.get(name)
+    return default if value is None or value == '' else value
+
+
+def normalize_product(record, now=None):
+    """
+    Validate a feed record and convert it into a product row.
+
+    Args:
+        record (dict): Raw CSV/JSONL record
+        now (datetime): created_at for new rows and updated_at
+
+    Returns:
+        dict: Values for every column in PRODUCT_FIELDS plus created_at and updated_at
+
+    Raises:
+        ValueError: If a required field is missing or a number is malformed
+    """
+    title = str(record.get('title') or '').strip()
+    category = str(record.get('category') or '').strip()
+    if not title or not category:
+        raise ValueError('title and category are required')
+    if record.get('price') in (None, ''):
+        raise ValueError('price is required')
+
+    price = float(record['price'])
+    if price < 0:
+        raise ValueError('price must not be negative')
+
+    now = now or datetime.utcnow()
+    return {
+        'sku': str(record.get('sku') or '').strip()[:64] or None,
+        'title': title[:200],
+        'description': record.get('description') or None,
+        'price': round(price, 2),
+        'category': category[:50],
+        'rating': float(_field(record, 'rating', 4.0)),
+        'image_url': (record.get('image_url') or None),
+        'stock': int(_field(record, 'stock', 10)),
+        'created_at': now,
+        'updated_at': now,
+    }
+
+
+def chunked(iterable, size):
+    """Yield lists of at most size items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def upsert_statement(dialect_name):
+    """
+    Build INSERT ... ON CONFLICT (sku) DO UPDATE for executemany use.
+
+    Args:
+        dialect_name (str): 'sqlite' or 'postgresql'
+
+    Returns:
+        Insert: Statement updating UPDATE_FIELDS of existing SKUs
+    """
+    dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+    if dialect_name not in dialects:
+        raise NotImplementedError(f'Catalog upsert is not supported on {dialect_name}')
+    statement = dialects[dialect_name].insert(Product)
+    updates = {field: statement.excluded[field] for field in UPDATE_FIELDS}
+    updates['stock'] = statement.excluded.stock - _held_stock()
+    return statement.on_conflict_do_update(index_elements=['sku'], set_=updates)
+
+
+def _held_stock():
+    """Units of the upserted product held by carts (reservations.py), as a SET clause subquery."""
+    # Product.stock excludes held units, the feed does not. Not clamped: while holds
+    # exceed the feed count the column goes negative until they are released.
+    # The SET clause has no FROM to correlate with, so name the target row directly
+    return (
+        select(func.coalesce(func.sum(StockReservation.quantity), 0))
+        .where(StockReservation.product_id == literal_column(f'{Product.__tablename__}.id'))
+        .scalar_subquery()
+    )
+
+
+def _dedupe_skus(rows):
+    # ON CONFLICT cannot touch the same row twice in one statement; last line wins
+    by_sku = {}
+    unkeyed = []
+    for row in rows:
+        if row['sku'] is None:
+            unkeyed.append(row)
+        else:
+            by_sku[row['sku']] = row
+    return unkeyed + list(by_sku.values())
+
+
+def _copy_rows(connection, rows, upsert):
+    """Write a chunk with PostgreSQL COPY (psycopg2), staging through a temp table for upserts."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    columns = PRODUCT_FIELDS + ['created_at', 'updated_at']
+    for row in rows:
+        writer.writerow(['' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+
+    column_list = ', '.join(columns)
+    target = 'product'
+    if upsert:
+        connection.exec_driver_sql(
+            f'CREATE TEMP TABLE IF NOT EXISTS product_import AS '
+            f'SELECT {column_list} FROM product WITH NO DATA'
+        )
+        connection.exec_driver_sql('TRUNCATE product_import')
+        target = 'product_import'
+
+    cursor = connection.connection.driver_connection.cursor()
+    try:
+        # Unquoted empty CSV fields are NULL
+        cursor.copy_expert(f'COPY {target} ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+    if upsert:
+        updates = ', '.join(f'{field} = EXCLUDED.{field}' for field in UPDATE_FIELDS if field != 'stock')
+        updates += (', stock = EXCLUDED.stock - COALESCE((SELECT SUM(quantity) FROM stock_reservation '
+                    'WHERE stock_reservation.product_id = product.id), 0)')
+        connection.exec_driver_sql(
+            f'INSERT INTO product ({column_list}) SELECT {column_list} FROM product_import '
+            f'ON CONFLICT (sku) DO UPDATE SET {updates}'
+        )
+
+
+def load_products(rows, mode='upsert', chunk_size=5000, use_copy=False, progress=None):
+    """
+    Write product rows to the database in chunks, one transaction per chunk.
+    Must be called inside an application context.
+
+    Args:
+        rows (iterable): Product dicts as returned by normalize_product(), or
+            (row, error) pairs where error is a ValueError for rejected input
+        mode (str): 'upsert' (update existing SKUs), 'insert' (append) or
+            'replace' (delete the current catalog first)
+        chunk_size (int): Rows per INSERT batch / COPY
+        use_copy (bool): Use COPY FROM STDIN (PostgreSQL only)
+        progress (callable): Called with the stats dict after every chunk
+
+    Returns:
+        dict: read, written, rejected, elapsed and rows_per_second
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f'Unknown import mode: {mode!r}')
+
+    dialect_name = db.engine.dialect.name
+    if use_copy and dialect_name != 'postgresql':
+        raise ValueError('COPY is only available on PostgreSQL')
+
+    upsert = mode == 'upsert'
+    statement = upsert_statement(dialect_name) if upsert else insert(Product)
+    stats = {'read': 0, 'written': 0, 'rejected': 0, 'elapsed': 0.0, 'rows_per_second': 0.0}
+    started = time.perf_counter()
+
+    if mode == 'replace':
+        with db.engine.begin() as connection:
+            connection.execute(Product.__table__.delete())
+
+    try:
+        for chunk in chunked(rows, chunk_size):
+            stats['read'] += len(chunk)
+            valid = []
+            for item in chunk:
+                row, error = item if isinstance(item, tuple) else (item, None)
+                if error is None:
+                    valid.append(row)
+                else:
+                    stats['rejected'] += 1
+            if upsert:
+                valid = _dedupe_skus(valid)
+
+            if valid:
+                with db.engine.begin() as connection:
+                    if use_copy:
+                        _copy_rows(connection, valid, upsert)
+                    else:
+                        connection.execute(statement, valid)
+                stats['written'] += len(valid)
+
+            stats['elapsed'] = time.perf_counter() - started
+            stats['rows_per_second'] = stats['written'] / stats['elapsed'] if stats['elapsed'] else 0.0
+            if progress is not None:
+                progress(stats)
+    finally:
+        # Mapper events did not fire for these writes; refresh what they maintain,
+        # here and in every other process
+        catalog_cache.invalidate()
+        record_reload()
+        if catalog_sync.version is not None:
+            catalog_sync.refresh(block=True)
+        else:
+            rebuild()
+
+    return stats
+
+
+def parse_feed(path, fmt=None, max_errors=10):
+    """
+    Read and validate a feed lazily.
+
+    Args:
+        path (str): Feed file
+        fmt (str): 'csv' or 'jsonl', guessed when omitted
+        max_errors (int): Rejected lines logged individually before going quiet
+
+    Yields:
+        tuple: (row, None) for valid records, (None, ValueError) for rejected ones
+    """
+    now = datetime.utcnow()
+    logged = 0
+    for line_number, record in enumerate(read_records(path, fmt), 1):
+        try:
+            yield normalize_product(record, now), None
+        except (ValueError, TypeError, AttributeError) as error:
+            if logged < max_errors:
+                logger.warning('Skipping record %d of %s: %s', line_number, path, error)
+                logged += 1
+            yield None, error
+
+
+# Vocabulary for synthetic catalogs, per category
+SYNTHETIC_VOCABULARY = {
+    'Electronics': (['Wireless', 'Smart', 'Portable', 'Noise-Cancelling', 'Ultra', 'Compact', 'Gaming', '4K'],
+                    ['Headphones', 'Speaker', 'Charger', 'Keyboard', 'Monitor', 'Camera', 'Watch', 'Router']),
+    'Books': (['Complete', 'Practical', 'Illustrated', 'Modern', 'Essential', 'Advanced', 'Pocket'],
+              ['Python Guide', 'Cookbook', 'Novel', 'History', 'Atlas', 'Textbook', 'Biography']),
+    'Textiles': (['Cotton', 'Wool', 'Linen', 'Denim', 'Silk', 'Organic', 'Athletic'],
+                 ['Shirt', 'Jacket', 'Scarf', 'Shorts', 'Hoodie', 'Dress', 'Socks']),
+}
+
+
+def synthetic_products(count, seed=0):
+    """
+    Generate a deterministic synthetic catalog.
+
+    Args:
+        count (int): Number of products
+        seed (int): Random seed; the same seed yields the same catalog
+
+    Yields:
+        dict: Feed records with SKUs SYN-00000001, SYN-00000002, ...
+    """
+    rng = random.Random(seed)
+    categories = list(SYNTHETIC_VOCABULARY)
+    for number in range(1, count + 1):
+        category = rng.choice(categories)
+        adjectives, nouns = SYNTHETIC_VOCABULARY[category]
+        adjective, noun = rng.choice(adjectives), rng.choice(nouns)
+        yield {
+            'sku': f'SYN-{number:08d}',
+            'title': f'{adjective} {noun} {number}',
+            'description': f'{adjective} {noun.lower()} from the synthetic {category.lower()} range.',
+            'price': round(rng.uniform(5, 500), 2),
+            'category': category,
+            'rating': round(rng.uniform(3.0, 5.0), 1),
+            'image_url': None,
+            'stock': rng.randint(0, 200),
+        }
+
+
+def write_feed(path, records, fmt=None):
+    """
+    Write records to a CSV or JSONL feed, streaming.
+
+    Returns:
+        int: Number of records written
+    """
+    written = 0
+    with open_feed(path, 'wt') as feed:
+        if feed_format(path, fmt) == 'csv':
+            writer = csv.DictWriter(feed, fieldnames=PRODUCT_FIELDS)
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+                written += 1
+        else:
+            for record in records:
+                feed.write(json.dumps(record) + '\n')
+                written += 1
+    return written
+
+
+def _print_progress(stats):
+    print(f"\r{stats['read']:>12,} read  {stats['written']:>12,} written  {stats['rejected']:>8,} rejected  "
+          f"{stats['rows_per_second']:>10,.0f} rows/s", end='', file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-load or generate ShopMate AI product catalogs')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    load = commands.add_parser('import', help='load a CSV/JSONL feed into the product table')
+    load.add_argument('path', help='feed file (.csv, .jsonl, optionally .gz; "-" for stdin)')
+    load.add_argument('--format', choices=['csv', 'jsonl'], help='override format detection')
+    load.add_argument('--mode', choices=IMPORT_MODES, default='upsert')
+    load.add_argument('--chunk-size', type=int, default=5000, help='rows per batch (default 5000)')
+    load.add_argument('--copy', action='store_true', help='use COPY FROM STDIN (PostgreSQL)')
+    load.add_argument('--quiet', action='store_true', help='no progress output')
+
+    generate = commands.add_parser('generate', help='write a synthetic catalog feed')
+    generate.add_argument('count', type=int)
+    generate.add_argument('path', help='output file (.csv or .jsonl, optionally .gz; "-" for stdout)')
+    generate.add_argument('--format', choices=['csv', 'jsonl'], help='override format detection')
+    generate.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.command == 'generate':
+        written = write_feed(args.path, synthetic_products(args.count, args.seed), args.format)
+        print(f'Wrote {written:,} synthetic products to {args.path}', file=sys.stderr)
+        return
+
+    app = create_app()
+    with app.app_context():
+        migrations.ensure_schema(app)
+        stats = load_products(
+            parse_feed(args.path, args.format), mode=args.mode, chunk_size=args.chunk_size,
+            use_copy=args.copy, progress=None if args.quiet else _print_progress
+        )
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"Imported {stats['written']:,} products ({stats['rejected']:,} rejected) "
+          f"in {stats['elapsed']:.1f}s, {stats['rows_per_second']:,.0f} rows/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Columnar catalog snapshot for ShopMate AI
+
+Category listings and price filters only need a handful of numeric product
+columns, so instead of querying the database for every message they can be
+answered from an in-memory snapshot:
+- NumPy arrays hold id, price, rating, stock and an integer category code
+- Filters (category, max price, min rating, in stock) are vectorized boolean masks
+- Top-k selection by rating or price uses argpartition instead of a full sort
+- The snapshot is loaded once at startup and patched in place through
+  SQLAlchemy mapper events once the change commits; other processes follow
+  through catalog_sync.py, and bulk imports rebuild it everywhere
+
+Enabled with app.config["CATALOG_SNAPSHOT_ENABLED"] when NumPy is installed
+(the "numpy" extra). Without it, routes.filter_catalog queries the database.
+"""
+
+import threading
+from sqlalchemy import event, select
+from app import db
+from models import Product
+from commit_hooks import on_commit
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency
+    np = None
+
+# Sort keys accepted by CatalogSnapshot.filter: rating high to low, price low to high
+ORDERINGS = ('rating', 'price')
+
+# Per-row arrays, all indexed by row position
+COLUMNS = ('_ids', '_price', '_rating', '_stock', '_category', '_alive')
+
+
+class CatalogSnapshot:
+    """
+    Growable column arrays over the product catalog.
+
+    Rows live at fixed positions; deletes only clear the row's alive flag and
+    inserts append (capacity doubles as needed), so a single product change
+    is an O(1) patch. Dead rows are dropped when they outnumber live ones.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self._lock = threading.RLock()
+        self._positions = {}       # product_id -> row position
+        self._category_codes = {}  # category name -> code
+        self._size = 0
+        self._dead = 0
+        self._allocate(0)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def build(self, rows):
+        """
+        Replace the snapshot contents. The new arrays are filled aside and
+        swapped in, so filters keep using the current ones meanwhile.
+
+        Args:
+            rows (iterable): (id, price, rating, stock, category) tuples
+        """
+        fresh = CatalogSnapshot()
+        fresh._allocate(1024)
+        for row in rows:
+            fresh._upsert(*row)
+        with self._lock:
+            for name in COLUMNS + ('_positions', '_category_codes', '_size', '_dead'):
+                setattr(self, name, getattr(fresh, name))
+            self.ready = True
+
+    def upsert(self, product_id, price, rating, stock, category):
+        """Insert or update a product's columns."""
+        with self._lock:
+            self._upsert(product_id, price, rating, stock, category)
+
+    def remove(self, product_id):
+        """Drop a product if present."""
+        with self._lock:
+            position = self._positions.pop(product_id, None)
+            if position is None:
+                return
+            self._alive[position] = False
+            self._dead += 1
+            if self._dead > len(self._positions):
+                self._compact()
+
+    def rows(self, product_ids):
+        """
+        Return the price, rating and stock of products.
+
+        Args:
+            product_ids (list): Product ids; unknown ids are skipped
+
+        Returns:
+            list: (id, price, rating, stock) tuples in product_ids order; missing ratings are None
+        """
+        with self._lock:
+            positions = [(product_id, self._positions.get(product_id)) for product_id in product_ids]
+            return [
+                (product_id, float(self._price[position]),
+                 None if np.isnan(self._rating[position]) else float(self._rating[position]),
+                 int(self._stock[position]))
+                for product_id, position in positions if position is not None
+            ]
+
+    def filter(self, category=None, max_price=None, min_rating=None, in_stock=False, order_by='rating', limit=6):
+        """
+        Return the ids of the best products matching every given filter.
+
+        Args:
+            category (str): Product.category value, or None for all categories
+            max_price (float): Inclusive upper price bound
+            min_rating (float): Inclusive lower rating bound
+            in_stock (bool): Only products with stock > 0
+            order_by (str): 'rating' (highest first) or 'price' (lowest first);
+                ties are broken by ascending id
+            limit (int): Maximum number of ids
+
+        Returns:
+            list: Product ids in result order
+        """
+        if order_by not in ORDERINGS:
+            raise ValueError(f'Unknown ordering: {order_by!r}')
+
+        with self._lock:
+            size = self._size
+            mask = self._alive[:size].copy()
+            if category is not None:
+                code = self._category_codes.get(category)
+                if code is None:
+                    return []
+                mask &= self._category[:size] == code
+            if max_price is not None:
+                mask &= self._price[:size] <= max_price
+            if min_rating is not None:
+                mask &= self._rating[:size] >= min_rating
+            if in_stock:
+                mask &= self._stock[:size] > 0
+
+            rows = np.flatnonzero(mask)
+            ids = self._ids[rows]
+            if order_by == 'rating':
+                keys = -self._rating[rows]
+            else:
+                keys = self._price[rows].copy()
+
+        # Missing values sort last
+        keys[np.isnan(keys)] = np.inf
+        if len(rows) > limit:
+            # Keep every row tied with the k-th key so the id tie-break stays exact
+            kth = np.partition(keys, limit - 1)[limit - 1]
+            candidates = keys <= kth
+            keys, ids = keys[candidates], ids[candidates]
+        order = np.lexsort((ids, keys))[:limit]
+        return ids[order].tolist()
+
+    def _allocate(self, capacity):
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._rating = np.zeros(capacity, dtype=np.float64)
+        self._stock = np.zeros(capacity, dtype=np.int64)
+        self._category = np.zeros(capacity, dtype=np.int32)
+        self._alive = np.zeros(capacity, dtype=bool)
+
+    def _grow(self):
+        capacity = max(1024, len(self._ids) * 2)
+        columns = [(name, getattr(self, name)) for name in COLUMNS]
+        self._allocate(capacity)
+        for name, old in columns:
+            getattr(self, name)[:len(old)] = old
+
+    def _upsert(self, product_id, price, rating, stock, category):
+        position = self._positions.get(product_id)
+        if position is None:
+            if self._size == len(self._ids):
+                self._grow()
+            position = self._size
+            self._size += 1
+            self._positions[product_id] = position
+        code = self._category_codes.setdefault(category, len(self._category_codes))
+
+        self._ids[position] = product_id
+        self._price[position] = price
+        self._rating[position] = np.nan if rating is None else rating
+        self._stock[position] = stock or 0
+        self._category[position] = code
+        self._alive[position] = True
+
+    def _compact(self):
+        live = np.flatnonzero(self._alive[:self._size])
+        for name in COLUMNS:
+            column = getattr(self, name)
+            column[:len(live)] = column[live]
+        self._alive[len(live):] = False
+        self._size = len(live)
+        self._dead = 0
+        self._positions = {int(product_id): position for position, product_id in enumerate(self._ids[:self._size])}
+
+
+# Process-wide snapshot used by routes.filter_catalog
+catalog_snapshot = CatalogSnapshot() if np is not None else None
+
+
+def build_catalog_snapshot():
+    """
+    Load the whole catalog into catalog_snapshot.
+    Must be called inside an application context.
+    """
+    if catalog_snapshot is None:
+        return
+    rows = db.session.execute(
+        select(Product.id, Product.price, Product.rating, Product.stock, Product.category)
+        .execution_options(yield_per=10000)
+    )
+    catalog_snapshot.build(rows)
+
+
+def init_app(app):
+    """
+    Build the snapshot if CATALOG_SNAPSHOT_ENABLED is set and NumPy is available.
+    Must be called inside an application context.
+
+    Args:
+        app (Flask): Application providing the configuration
+    """
+    if app.config.get("CATALOG_SNAPSHOT_ENABLED", True):
+        build_catalog_snapshot()
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+def _snapshot_product(mapper, connection, target):
+    """Patch the snapshot when products are created or edited."""
+    if catalog_snapshot is not None and catalog_snapshot.ready:
+        on_commit(target, catalog_snapshot.upsert, target.id, target.price, target.rating, target.stock,
+                  target.category)
+
+
+@event.listens_for(Product, 'after_delete')
+def _unsnapshot_product(mapper, connection, target):
+    """Remove deleted products from the snapshot."""
+    if catalog_snapshot is not None and catalog_snapshot.ready:
+        on_commit(target, catalog_snapshot.remove, target.id)
@@ -0,0 +1,267 @@
+"""
+Cross-process catalog change feed for ShopMate AI
+
+The BM25 index (search_index.py), the catalog snapshot and the semantic
+index are copies of the catalog in each process's memory. Mapper events
+patch them once a change commits, but only in the process that made it.
+Every other process (other gunicorn workers, other hosts, and all of them
+after a "catalog_import.py import") learns about changes through the
+catalog_change table:
+- A flush that inserts, updates or deletes a Product also inserts a
+  catalog_change row for it on the same connection, so the row commits or
+  rolls back with the change
+- Bulk imports, which bypass the mapper events, write one row without a
+  product id: reload the whole catalog
+- Before a request, at most every CATALOG_SYNC_INTERVAL seconds, a process
+  reads the rows newer than the last one it applied, from the primary.
+  Changed products are read again and patched in
+- A reload row, or falling more than CATALOG_CHANGE_RETENTION rows behind,
+  rebuilds the copies in a background thread. Each copy is built aside and
+  swapped in, so requests keep serving the current copies meanwhile; the
+  entries written during the build are applied by the next check
+- Feed ids are handed out when a transaction inserts its row, not when it
+  commits, so on PostgreSQL a lower id can become visible after a higher
+  one. Ids missing below the newest applied entry are read again on every
+  check for GAP_TIMEOUT seconds (after that they are taken as rolled back)
+- After applying changes the process invalidates the catalog reply cache
+  again, dropping replies a not yet refreshed worker cached from its old copy
+- Rows older than the newest CATALOG_CHANGE_RETENTION are deleted
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event, select, insert, delete, or_
+from app import db
+from models import Product, CatalogChange
+from cache import catalog_cache
+import search_index
+import catalog_snapshot
+import semantic_index
+
+logger = logging.getLogger(__name__)
+
+# Products read back per query when patching
+PATCH_CHUNK = 500
+
+# Seconds a missing feed id is read again before it is taken as rolled back
+GAP_TIMEOUT = 60.0
+
+# Missing ids tracked below the newest entry; older ones are not waited for
+GAP_SPAN = 1000
+
+
+class CatalogSync:
+    """
+    Follows the catalog_change feed for this process. Configured by init_app();
+    start() records the feed position the in-memory copies were built at.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.interval = 1.0
+        self.retention = 10000
+        self.version = None        # Last catalog_change id applied here; None before start()
+        self.patched = 0
+        self.rebuilds = 0
+        self._app = None
+        self._gaps = {}            # Missing catalog_change id -> monotonic time it was first missed
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuilding = None    # Background rebuild thread
+
+    def init_app(self, app):
+        """
+        Configure the feed from app.config and check it before every request.
+
+        Args:
+            app (Flask): Application providing CATALOG_SYNC_* settings
+        """
+        self._app = app
+        self.enabled = app.config.get("CATALOG_SYNC_ENABLED", True)
+        self.interval = app.config.get("CATALOG_SYNC_INTERVAL", self.interval)
+        self.retention = app.config.get("CATALOG_CHANGE_RETENTION", self.retention)
+        self.version = None
+        self._gaps = {}
+        if self.enabled:
+            app.before_request(self.check)
+
+    def start(self):
+        """
+        Remember the current feed position. Call before building the copies,
+        so changes made during the build are applied again afterwards.
+        Must be called inside an application context.
+        """
+        with db.engine.connect() as connection:
+            self.version = self._position(connection)
+
+    def check(self):
+        """Apply new feed entries if CATALOG_SYNC_INTERVAL has passed since the last check."""
+        if self.version is None or time.monotonic() - self._checked_at < self.interval:
+            return
+        # One thread applies the changes; the others serve from the current copies meanwhile
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            self.refresh()
+        except Exception:
+            logger.exception('Failed to apply catalog changes')
+        finally:
+            self._lock.release()
+
+    def refresh(self, block=False):
+        """
+        Apply every feed entry newer than the last one applied, and the
+        entries of ids still missing below it.
+        Must be called inside an application context.
+
+        Args:
+            block (bool): Rebuild on this thread instead of in the background
+
+        Returns:
+            int: Number of feed entries applied
+        """
+        rebuilding = self._rebuilding
+        if rebuilding is not None:
+            if not block:
+                return 0  # The rebuild will bring the copies up to its start
+            rebuilding.join()
+        with db.engine.connect() as connection:
+            changes = connection.execute(
+                select(CatalogChange.id, CatalogChange.product_id)
+                .where(or_(CatalogChange.id > self.version, CatalogChange.id.in_(list(self._gaps))))
+                .order_by(CatalogChange.id)
+            ).all()
+            now = time.monotonic()
+            self._gaps = {change_id: missed for change_id, missed in self._gaps.items()
+                          if now - missed < GAP_TIMEOUT}
+            if not changes:
+                return 0
+            latest = max(self.version, changes[-1].id)
+            product_ids = {change.product_id for change in changes}
+            reload = None in product_ids or latest - self.version > self.retention
+            if not reload:
+                self._patch(connection, sorted(product_ids))
+                self.patched += len(product_ids)
+
+        if reload:
+            if block:
+                self._rebuild()
+            else:
+                self._rebuilding = threading.Thread(target=self._rebuild_in_background,
+                                                    name='catalog-rebuild', daemon=True)
+                self._rebuilding.start()
+            return len(changes)
+        seen = {change.id for change in changes}
+        for change_id in seen:
+            self._gaps.pop(change_id, None)
+        for change_id in range(max(self.version, latest - GAP_SPAN) + 1, latest):
+            if change_id not in seen:
+                self._gaps.setdefault(change_id, now)
+        self.version = latest
+        catalog_cache.invalidate()
+        self._prune(latest)
+        return len(changes)
+
+    def _rebuild(self):
+        """Rebuild the copies and continue the feed from the position read before the build."""
+        with db.engine.connect() as connection:
+            version = self._position(connection)
+        rebuild()
+        self.version = version
+        self.rebuilds += 1
+        catalog_cache.invalidate()
+        self._prune(version)
+
+    def _rebuild_in_background(self):
+        try:
+            with self._app.app_context():
+                self._rebuild()
+        except Exception:
+            logger.exception('Failed to rebuild the catalog copies')
+        finally:
+            self._rebuilding = None
+
+    def _position(self, connection):
+        """Newest feed id, remembering the ids missing just below it as gaps."""
+        ids = connection.scalars(
+            select(CatalogChange.id).order_by(CatalogChange.id.desc()).limit(GAP_SPAN)
+        ).all()
+        if not ids:
+            return 0
+        now = time.monotonic()
+        present = set(ids)
+        for change_id in range(ids[-1] + 1, ids[0]):
+            if change_id not in present:
+                self._gaps.setdefault(change_id, now)
+        return ids[0]
+
+    def _prune(self, latest):
+        if latest > self.retention:
+            with db.engine.begin() as connection:
+                connection.execute(delete(CatalogChange).where(CatalogChange.id <= latest - self.retention))
+
+    def _patch(self, connection, product_ids):
+        snapshot = catalog_snapshot.catalog_snapshot
+        semantic = semantic_index.semantic_index
+        for start in range(0, len(product_ids), PATCH_CHUNK):
+            chunk = product_ids[start:start + PATCH_CHUNK]
+            rows = connection.execute(
+                select(Product.id, Product.title, Product.description, Product.category,
+                       Product.price, Product.rating, Product.stock)
+                .where(Product.id.in_(chunk))
+            ).all()
+            for row in rows:
+                search_index.product_index.add(row.id, row.title, row.description, row.category)
+                if snapshot is not None and snapshot.ready:
+                    snapshot.upsert(row.id, row.price, row.rating, row.stock, row.category)
+                if semantic is not None and semantic.ready:
+                    semantic.add(row.id, row.title, row.description, row.category)
+            for product_id in set(chunk) - {row.id for row in rows}:
+                search_index.product_index.remove(product_id)
+                if snapshot is not None and snapshot.ready:
+                    snapshot.remove(product_id)
+                if semantic is not None and semantic.ready:
+                    semantic.remove(product_id)
+
+
+def rebuild():
+    """
+    Rebuild this process's in-memory catalog copies from the database.
+    Must be called inside an application context.
+    """
+    search_index.build_product_index()
+    if catalog_snapshot.catalog_snapshot is not None and catalog_snapshot.catalog_snapshot.ready:
+        catalog_snapshot.build_catalog_snapshot()
+    if semantic_index.semantic_index is not None and semantic_index.semantic_index.ready:
+        semantic_index.build_semantic_index()
+
+
+def record_reload(connection=None):
+    """
+    Tell every process to rebuild its catalog copies, e.g. after a bulk import.
+    Must be called inside an application context.
+
+    Args:
+        connection (Connection): Connection whose transaction should carry the entry;
+            a new transaction on the primary when omitted
+    """
+    if connection is not None:
+        connection.execute(insert(CatalogChange).values(product_id=None, changed_at=datetime.utcnow()))
+        return
+    with db.engine.begin() as connection:
+        record_reload(connection)
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+@event.listens_for(Product, 'after_delete')
+def _record_change(mapper, connection, target):
+    """Add the product to the change feed in the transaction that changes it."""
+    connection.execute(insert(CatalogChange).values(product_id=target.id, changed_at=datetime.utcnow()))
+
+
+# Process-wide follower used by app.warm_up and before every request
+catalog_sync = CatalogSync()
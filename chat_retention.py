@@ -0,0 +1,373 @@
+"""
+Chat history retention for ShopMate AI
+
+Keeps chat_message, the largest table, bounded:
+- Per-session cap: messages beyond the newest CHAT_MAX_MESSAGES_PER_SESSION
+  of a session are moved to the archive
+- Age-based archiving: the idle-session sweep (session_store.py) hands
+  sessions idle for CHAT_SESSION_MAX_IDLE to archive_sessions() before
+  deleting them
+- Clearing a chat only records a watermark (ChatSession.cleared_through);
+  history reads hide everything up to it and the rows are purged later
+- All deletes run in batches of CHAT_RETENTION_BATCH_SIZE rows, one short
+  transaction each, from a background thread every CHAT_RETENTION_INTERVAL
+  seconds
+
+Archives are gzip-compressed JSONL files, one per session, under
+CHAT_ARCHIVE_DIR/<user_id>/<session_id>.jsonl.gz. Later batches are appended
+as extra gzip members, so every file stays readable with zcat or gzip.open().
+Leave CHAT_ARCHIVE_DIR empty to delete without archiving.
+
+Usage:
+    python chat_retention.py run                 # One retention pass now
+    python chat_retention.py export 42 > out.jsonl  # Archived chats of user 42
+"""
+
+import argparse
+import fcntl
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+from contextlib import contextmanager
+from sqlalchemy import select, delete, update, func
+from flask import current_app
+from app import create_app, db
+from models import ChatSession, ChatMessage
+import migrations
+
+logger = logging.getLogger(__name__)
+
+
+def clear_statement(chat_session_id):
+    """
+    UPDATE hiding every current message of a session, for the sync and async views.
+
+    Args:
+        chat_session_id (int): ChatSession.id to clear
+
+    Returns:
+        Update: Sets cleared_through to the session's newest message id
+    """
+    newest = (select(func.max(ChatMessage.id)).where(ChatMessage.session_id == chat_session_id)
+              .scalar_subquery())
+    return (update(ChatSession).where(ChatSession.id == chat_session_id)
+            .values(cleared_through=func.coalesce(newest, ChatSession.cleared_through)))
+
+
+def visible_messages(chat_session_id):
+    """
+    Condition selecting the messages of a session that were not cleared.
+
+    Args:
+        chat_session_id (int): ChatSession.id
+
+    Returns:
+        ColumnElement: Filter for ChatMessage queries
+    """
+    watermark = (select(func.coalesce(ChatSession.cleared_through, 0))
+                 .where(ChatSession.id == chat_session_id).scalar_subquery())
+    return (ChatMessage.session_id == chat_session_id) & (ChatMessage.id > watermark)
+
+
+class ChatArchive:
+    """
+    Append-only gzip JSONL files of archived chat messages.
+
+    Args:
+        directory (str): Archive root; None or '' disables archiving
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or None
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def path(self, user_id, session_id):
+        return os.path.join(self.directory, str(int(user_id)), f'{int(session_id)}.jsonl.gz')
+
+    def write(self, user_id, session_id, messages):
+        """
+        Append messages to a session's archive and fsync it.
+
+        Args:
+            user_id (int): Owner of the session
+            session_id (int): ChatSession.id
+            messages (list): Dicts with id, sender, message and timestamp
+
+        Returns:
+            int: Number of messages written
+        """
+        if not messages:
+            return 0
+        path = self.path(user_id, session_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as handle:
+                for message in messages:
+                    handle.write(json.dumps(message, default=str).encode('utf-8') + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+        return len(messages)
+
+    def session_ids(self, user_id):
+        """Return the archived session ids of a user, oldest first."""
+        directory = os.path.join(self.directory, str(int(user_id)))
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name.split('.', 1)[0]) for name in os.listdir(directory) if name.endswith('.jsonl.gz'))
+
+    def read(self, user_id, session_id=None):
+        """
+        Stream archived messages back, one session file at a time.
+
+        Args:
+            user_id (int): Owner of the archives
+            session_id (int): Only this session; all of the user's sessions when None
+
+        Yields:
+            dict: session_id, id, sender, message and timestamp
+        """
+        if not self.enabled:
+            return
+        session_ids = [session_id] if session_id is not None else self.session_ids(user_id)
+        for archived_id in session_ids:
+            path = self.path(user_id, archived_id)
+            if not os.path.exists(path):
+                continue
+            with gzip.open(path, 'rt', encoding='utf-8') as handle:
+                for line in handle:
+                    yield dict(json.loads(line), session_id=archived_id)
+
+
+class ChatRetention:
+    """
+    Message caps, archiving and batched purges of chat history.
+    Configured by init_app(); the background pass runs in every worker process,
+    serialized by a lock file.
+    """
+
+    def __init__(self):
+        self.archive = ChatArchive()
+        self.max_messages = 1000
+        self.batch_size = 1000
+        self.interval = 3600.0
+        self._app = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """
+        Configure retention from app.config and start the background pass.
+
+        Args:
+            app (Flask): Application providing CHAT_ARCHIVE_DIR and CHAT_RETENTION_* settings
+        """
+        self._app = app
+        self.archive = ChatArchive(app.config.get("CHAT_ARCHIVE_DIR"))
+        self.max_messages = app.config.get("CHAT_MAX_MESSAGES_PER_SESSION", self.max_messages)
+        self.batch_size = app.config.get("CHAT_RETENTION_BATCH_SIZE", self.batch_size)
+        self.interval = app.config.get("CHAT_RETENTION_INTERVAL", self.interval)
+        if self.interval > 0:
+            app.before_request(self._ensure_thread)
+
+    def clear_session(self, chat_session_id):
+        """
+        Hide a session's messages now and leave their deletion to the background pass.
+        Must be called inside an application context.
+
+        Args:
+            chat_session_id (int): ChatSession.id to clear
+        """
+        db.session.execute(clear_statement(chat_session_id))
+        db.session.commit()
+
+    def archive_sessions(self, session_ids):
+        """
+        Archive every visible message of the given sessions, before they are deleted.
+
+        Args:
+            session_ids (list): ChatSession ids
+
+        Returns:
+            int: Number of messages archived
+        """
+        if not self.archive.enabled or not session_ids:
+            return 0
+        archived = 0
+        sessions = db.session.execute(
+            select(ChatSession.id, ChatSession.user_id, ChatSession.cleared_through)
+            .where(ChatSession.id.in_(session_ids))
+        ).all()
+        for chat_session in sessions:
+            after_id = chat_session.cleared_through or 0
+            while True:
+                rows = self._load_messages(chat_session.id, ChatMessage.id > after_id)
+                if not rows:
+                    break
+                archived += self.archive.write(chat_session.user_id, chat_session.id, rows)
+                after_id = rows[-1]['id']
+        return archived
+
+    def purge_cleared(self):
+        """
+        Delete the messages hidden by clear_session(), in batches.
+
+        Returns:
+            int: Number of messages deleted
+        """
+        deleted = 0
+        cleared = db.session.execute(
+            select(ChatSession.id, ChatSession.cleared_through).where(ChatSession.cleared_through.isnot(None))
+        ).all()
+        for chat_session_id, watermark in cleared:
+            deleted += self._delete_batched(
+                (ChatMessage.session_id == chat_session_id) & (ChatMessage.id <= watermark))
+            # Every message up to the watermark is gone, so the filter is no longer needed
+            db.session.execute(update(ChatSession).where(
+                ChatSession.id == chat_session_id, ChatSession.cleared_through == watermark
+            ).values(cleared_through=None))
+            db.session.commit()
+        return deleted
+
+    def enforce_caps(self):
+        """
+        Archive and delete the oldest messages of sessions above max_messages.
+
+        Returns:
+            int: Number of messages removed from chat_message
+        """
+        if not self.max_messages or self.max_messages <= 0:
+            return 0
+        removed = 0
+        oversized = db.session.execute(
+            select(ChatMessage.session_id, func.count())
+            .group_by(ChatMessage.session_id)
+            .having(func.count() > self.max_messages)
+        ).all()
+        for chat_session_id, count in oversized:
+            user_id = db.session.scalar(select(ChatSession.user_id).where(ChatSession.id == chat_session_id))
+            excess = count - self.max_messages
+            while excess > 0:
+                rows = self._load_messages(chat_session_id, None, min(excess, self.batch_size))
+                if not rows:
+                    break
+                if self.archive.enabled and user_id is not None:
+                    self.archive.write(user_id, chat_session_id, rows)
+                db.session.execute(delete(ChatMessage).where(ChatMessage.id.in_([row['id'] for row in rows])))
+                db.session.commit()
+                removed += len(rows)
+                excess -= len(rows)
+        return removed
+
+    def run_once(self):
+        """
+        One retention pass. Must be called inside an application context.
+
+        Returns:
+            dict: purged, capped; None if another process holds the lock
+        """
+        with self.exclusive() as acquired:
+            if not acquired:
+                return None
+            from message_queue import chat_writer
+            if chat_writer.enabled:
+                chat_writer.flush()
+            return {'purged': self.purge_cleared(), 'capped': self.enforce_caps()}
+
+    def _load_messages(self, chat_session_id, condition, limit=None):
+        query = select(ChatMessage.id, ChatMessage.sender, ChatMessage.message, ChatMessage.timestamp).where(
+            ChatMessage.session_id == chat_session_id)
+        if condition is not None:
+            query = query.where(condition)
+        rows = db.session.execute(
+            query.order_by(ChatMessage.id).limit(limit or self.batch_size)
+        ).all()
+        return [{'id': row.id, 'sender': row.sender, 'message': row.message,
+                 'timestamp': row.timestamp.isoformat() if row.timestamp else None} for row in rows]
+
+    def _delete_batched(self, condition):
+        deleted = 0
+        while True:
+            ids = list(db.session.scalars(select(ChatMessage.id).where(condition).limit(self.batch_size)))
+            if not ids:
+                return deleted
+            db.session.execute(delete(ChatMessage).where(ChatMessage.id.in_(ids)))
+            db.session.commit()
+            deleted += len(ids)
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Hold the host-wide retention lock (non-blocking flock), so workers
+        don't archive the same messages twice.
+
+        Yields:
+            bool: True if the lock was acquired
+        """
+        lock_dir = self.archive.directory or (self._app or current_app).instance_path
+        os.makedirs(lock_dir, exist_ok=True)
+        with open(os.path.join(lock_dir, '.retention.lock'), 'w') as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so start one lazily in every worker process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='chat-retention', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self._app.app_context():
+                    result = self.run_once()
+                if result and any(result.values()):
+                    logger.info('Chat retention: %s', result)
+            except Exception:
+                logger.exception('Chat retention pass failed')
+
+
+# Process-wide retention manager used by the routes and the session sweep
+chat_retention = ChatRetention()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ShopMate AI chat retention')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('run', help='run one retention pass now')
+    export = commands.add_parser('export', help='write archived messages of a user as JSONL to stdout')
+    export.add_argument('user_id', type=int)
+    export.add_argument('--session', type=int, help='only this ChatSession id')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        migrations.ensure_schema(app)
+        if args.command == 'run':
+            print(chat_retention.run_once() or 'Another retention pass is running')
+        else:
+            for message in chat_retention.archive.read(args.user_id, args.session):
+                sys.stdout.write(json.dumps(message) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Side effects of ORM changes that must wait for the commit
+
+Mapper events (after_insert/update/delete) fire when the session flushes,
+before the transaction commits. Caches and in-memory indexes updated there
+could show a change that is later rolled back, or be refilled from the
+database by another request before the change is visible to it. on_commit()
+defers such work:
+- Callbacks are queued in the session's info dict and run after it commits
+- A rollback discards them
+- The same (callback, args) pair runs once per commit, however many flushes
+  queued it, at the position it was last queued (so a product edited A -> B
+  -> A ends up as A)
+- Outside a session (e.g. a Core connection event) the callback runs at once
+"""
+
+import logging
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = 'shopmate_on_commit'
+
+
+def on_commit(target, callback, *args):
+    """
+    Run callback(*args) once the session holding target commits.
+
+    Args:
+        target: Mapped object from a mapper event
+        callback (callable): Function to run after the commit
+        *args: Hashable arguments for callback
+    """
+    session = object_session(target)
+    if session is None:
+        callback(*args)
+        return
+    # dict keeps the order callbacks were queued in; a repeat moves to the end
+    pending = session.info.setdefault(PENDING_KEY, {})
+    pending.pop((callback, args), None)
+    pending[(callback, args)] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_pending(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    for callback, args in pending or ():
+        try:
+            callback(*args)
+        except Exception:
+            # The data is committed; a failed cache update must not fail the request
+            logger.exception('Post-commit hook %s failed', getattr(callback, '__qualname__', callback))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
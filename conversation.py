@@ -0,0 +1,130 @@
+"""
+Conversation context for ShopMate AI chat sessions
+
+A follow-up that only adds filters ("now under $50", "only in stock",
+"rated 4+") refines the session's last product listing instead of starting
+a new search:
+- Each ChatSession keeps its last listing (intent, slots and shown product
+  ids) in a bounded in-process LRU: CONVERSATION_CONTEXT_SIZE sessions, each
+  dropped after CONVERSATION_CONTEXT_TTL idle seconds
+- The listing's candidate set (up to CONVERSATION_CANDIDATES products of its
+  category or keyword search, with price, rating and stock) is loaded on the
+  first refinement: from the catalog snapshot when it is loaded, otherwise
+  with one query. Every later refinement filters it in memory, with the
+  filters of the earlier ones merged in
+- Filters are applied to the whole candidate set, not to the previous
+  answer, so "under $100" after "under $50" widens the results again
+- Contexts live in one worker process; a follow-up answered by another
+  worker is handled as a new message
+"""
+
+from collections import namedtuple
+from cache import MemoryBackend
+
+Candidate = namedtuple('Candidate', ['id', 'price', 'rating', 'stock'])
+
+
+class ConversationContext:
+    """
+    The last product listing of a chat session.
+
+    Args:
+        intent (str): Intent name that produced the listing
+        slots (dict): Its slots, with the filters of later refinements merged in
+        product_ids (list): Ids of the products shown
+        candidates (list): Candidate rows of the listing, None until the first refinement
+        complete (bool): candidates hold every product of the listing, not just the best ones
+    """
+
+    __slots__ = ('intent', 'slots', 'product_ids', 'candidates', 'complete')
+
+    def __init__(self, intent, slots, product_ids, candidates=None, complete=False):
+        self.intent = intent
+        self.slots = slots
+        self.product_ids = product_ids
+        self.candidates = candidates
+        self.complete = complete
+
+    def merge(self, slots):
+        """
+        Combine the context's slots with the filters of a refinement.
+
+        Args:
+            slots (dict): Slots of the follow-up message
+
+        Returns:
+            dict: Slots with the new price bound, rating and stock filters
+        """
+        merged = dict(self.slots)
+        if slots['max_price'] is not None:
+            merged['max_price'] = slots['max_price']
+        if slots['min_rating'] is not None:
+            merged['min_rating'] = slots['min_rating']
+        merged['in_stock'] = merged['in_stock'] or slots['in_stock']
+        return merged
+
+    def refined(self, slots, product_ids):
+        """Return the context after a refinement, sharing the loaded candidates."""
+        return ConversationContext(self.intent, slots, product_ids, self.candidates, self.complete)
+
+
+def refine(candidates, slots):
+    """
+    Filter candidates by the price, rating and stock filters of slots.
+
+    Args:
+        candidates (list): Candidate rows, best first
+        slots (dict): Slots with 'max_price', 'min_rating' and 'in_stock'
+
+    Returns:
+        list: Ids of the matching candidates, in candidate order
+    """
+    max_price, min_rating, in_stock = slots['max_price'], slots['min_rating'], slots['in_stock']
+    return [
+        candidate.id for candidate in candidates
+        if (max_price is None or (candidate.price is not None and candidate.price <= max_price))
+        and (min_rating is None or (candidate.rating is not None and candidate.rating >= min_rating))
+        and (not in_stock or (candidate.stock or 0) > 0)
+    ]
+
+
+class ConversationMemory:
+    """
+    Per-ChatSession contexts in a bounded LRU. Configured by init_app().
+    """
+
+    def __init__(self):
+        self.ttl = 1800.0
+        self.max_candidates = 200
+        self.refinements = 0
+        self._contexts = MemoryBackend(1000)
+
+    def init_app(self, app):
+        """
+        Configure the LRU bound, idle TTL and candidate set size from app.config.
+
+        Args:
+            app (Flask): Application providing CONVERSATION_* settings
+        """
+        self._contexts = MemoryBackend(app.config.get("CONVERSATION_CONTEXT_SIZE", self._contexts.max_entries))
+        self.ttl = app.config.get("CONVERSATION_CONTEXT_TTL", self.ttl)
+        self.max_candidates = app.config.get("CONVERSATION_CANDIDATES", self.max_candidates)
+
+    def get(self, chat_session_id):
+        """Return the context of a session, or None."""
+        return self._contexts.get(chat_session_id)
+
+    def remember(self, chat_session_id, context):
+        """Store the context of a session, evicting the least recently used beyond the bound."""
+        self._contexts.set(chat_session_id, context, self.ttl)
+
+    def forget(self, chat_session_id):
+        """Drop the context of a session (e.g. when its chat is cleared)."""
+        self._contexts.delete(chat_session_id)
+
+    def __len__(self):
+        return len(self._contexts)
+
+
+# Process-wide context store used by the chat routes
+conversations = ConversationMemory()
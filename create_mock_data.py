@@ -1,6 +1,8 @@
-from app import app, db
-from models import Product
+from app import create_app
+from catalog_import import load_products, normalize_product
+from datetime import datetime
 import random
+import migrations
 
 def create_mock_products():
     """Create mock product data for the application"""
@@ -150,16 +152,12 @@ def create_mock_products():
     
     all_products.extend(additional_products)
     
-    # Add products to database
+    # Replace the catalog in one bulk insert
+    app = create_app()
     with app.app_context():
-        # Clear existing products
-        Product.query.delete()
-        
-        for product_data in all_products:
-            product = Product(**product_data)
-            db.session.add(product)
-        
-        db.session.commit()
+        migrations.ensure_schema(app)
+        now = datetime.utcnow()
+        load_products((normalize_product(product_data, now) for product_data in all_products), mode='replace')
         print(f"Created {len(all_products)} mock products!")
 
 if __name__ == '__main__':
@@ -0,0 +1,121 @@
+"""
+Database connection profile for ShopMate AI
+
+Builds the SQLAlchemy engine options from app.config, so the sync engine
+(Flask-SQLAlchemy) and the async engine (async_api.py) get the same settings:
+- Explicit pool sizing: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT and
+  DB_POOL_RECYCLE. Size the pool to the threads of one worker.
+  DB_ASYNC_POOL_SIZE and DB_ASYNC_MAX_OVERFLOW size the async engine
+- DB_POOL_PRE_PING is optional. It costs a round trip on every checkout;
+  pool_recycle plus SQLAlchemy's disconnect handling cover most stale connections
+- SQLite: every new connection sets journal_mode (WAL by default, so readers
+  don't block the writer), busy_timeout (writers wait for the lock instead
+  of failing) and synchronous (NORMAL is durable enough under WAL)
+- PostgreSQL: DB_STATEMENT_CACHE_SIZE sizes the driver's prepared statement
+  cache (asyncpg, psycopg 3). DB_PGBOUNCER makes connections safe behind a
+  transaction-pooling PgBouncer by turning server-side prepared statements off
+"""
+
+import uuid
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+SQLITE_JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SQLITE_SYNCHRONOUS_LEVELS = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _is_memory_sqlite(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, url=None, is_async=False):
+    """
+    Engine keyword arguments for the configured database.
+
+    Args:
+        config (dict): app.config with DB_* settings
+        url (str or URL): Database URL, SQLALCHEMY_DATABASE_URI when omitted
+        is_async (bool): Options for create_async_engine (asyncpg/aiosqlite)
+
+    Returns:
+        dict: Keyword arguments for create_engine / create_async_engine
+    """
+    url = make_url(url or config["SQLALCHEMY_DATABASE_URI"])
+    options = {
+        'pool_pre_ping': config.get("DB_POOL_PRE_PING", True),
+        'query_cache_size': config.get("DB_QUERY_CACHE_SIZE", 500),  # SQLAlchemy's compiled-statement cache
+    }
+    # In-memory SQLite uses a single shared connection, not a sized pool
+    if not _is_memory_sqlite(url):
+        # One event loop serves many concurrent requests, so the async pool is sized separately
+        prefix = 'DB_ASYNC_' if is_async else 'DB_'
+        options.update({
+            'pool_size': config.get(prefix + "POOL_SIZE", 20 if is_async else 5),
+            'max_overflow': config.get(prefix + "MAX_OVERFLOW", 40 if is_async else 10),
+            'pool_timeout': config.get("DB_POOL_TIMEOUT", 30),
+            'pool_recycle': config.get("DB_POOL_RECYCLE", 300),
+            'pool_use_lifo': True,  # Reuse hot connections so idle ones can be recycled
+        })
+
+    if url.get_backend_name() == 'postgresql':
+        driver = 'asyncpg' if is_async else url.get_driver_name()
+        cache_size = config.get("DB_STATEMENT_CACHE_SIZE", 100)
+        if config.get("DB_PGBOUNCER", False):
+            cache_size = 0
+        connect_args = {}
+        if driver == 'asyncpg':
+            connect_args = {'prepared_statement_cache_size': cache_size, 'statement_cache_size': cache_size}
+            if cache_size == 0:
+                # Unique names: PgBouncer may hand the next statement to another server connection
+                connect_args['prepared_statement_name_func'] = lambda: f'__shopmate_{uuid.uuid4().hex}__'
+        elif driver == 'psycopg':
+            # None disables server-side prepares; otherwise prepare after 5 executions
+            connect_args = {'prepare_threshold': 5 if cache_size else None}
+        # psycopg2 has no server-side statement cache; nothing to configure
+        if connect_args:
+            options['connect_args'] = connect_args
+    return options
+
+
+def install_sqlite_pragmas(engine, config):
+    """
+    Apply the SQLite pragmas to every new connection of an engine.
+    No-op for other databases. For an AsyncEngine pass engine.sync_engine.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine to configure
+        config (dict): app.config with SQLITE_* settings; empty values keep SQLite's defaults
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    journal_mode = (config.get("SQLITE_JOURNAL_MODE") or '').upper()
+    synchronous = (config.get("SQLITE_SYNCHRONOUS") or '').upper()
+    busy_timeout = int(config.get("SQLITE_BUSY_TIMEOUT", 5000))
+    if journal_mode and journal_mode not in SQLITE_JOURNAL_MODES:
+        raise ValueError(f'Unknown SQLITE_JOURNAL_MODE: {journal_mode!r}')
+    if synchronous and synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f'Unknown SQLITE_SYNCHRONOUS: {synchronous!r}')
+    memory = _is_memory_sqlite(engine.url)
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'PRAGMA busy_timeout = {busy_timeout}')
+            if journal_mode and not memory:
+                cursor.execute(f'PRAGMA journal_mode = {journal_mode}')
+            if synchronous:
+                cursor.execute(f'PRAGMA synchronous = {synchronous}')
+        finally:
+            cursor.close()
+
+
+def init_app(app, engine):
+    """
+    Install the per-connection settings on the app's engine.
+
+    Args:
+        app (Flask): Application providing SQLITE_* settings
+        engine (sqlalchemy.engine.Engine): The application's database engine
+    """
+    install_sqlite_pragmas(engine, app.config)
@@ -0,0 +1,79 @@
+"""
+Production gunicorn settings for ShopMate AI
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Sizing follows the machine and the database:
+- PostgreSQL: 2 x CPUs + 1 worker processes, GUNICORN_THREADS threads each
+- SQLite: one writer at a time no matter how many processes wait for it, so
+  at most 4 processes (or the CPU count, if lower) and more threads per process
+- WEB_CONCURRENCY and GUNICORN_THREADS override the computed values
+
+Each worker's connection pool is sized to its thread count (DB_POOL_SIZE)
+unless set explicitly, and pre-ping is off (DB_POOL_PRE_PING=0). With more
+than one worker, the caches move to a SQLite file shared by the workers
+(CACHE_BACKEND), so cart counts and catalog invalidations stay consistent,
+and write-behind chat messages are committed before the reply
+(CHAT_WRITE_GROUP_COMMIT), so another worker reading the history sees them.
+Any of these environment variables set before start-up wins.
+
+The app is preloaded (GUNICORN_PRELOAD=0 turns that off): the master checks
+the schema and loads the catalog caches once (app.warm_up), freezes the
+heap for the garbage collector and then forks, so workers start serving at
+once and share those pages copy-on-write instead of each building its own
+copy. Schema changes are not applied at start-up (SCHEMA_AUTO_MIGRATE=0);
+run "python migrations.py" before deploying, or the master exits with the
+list of pending migrations.
+
+Each worker starts its password hash processes (password_hashing.py) right
+after loading the app, before its request threads exist. At most half of
+its threads wait for a hash (PASSWORD_HASH_QUEUE); further logins get a 503.
+"""
+
+import gc
+import multiprocessing
+import os
+
+cpus = multiprocessing.cpu_count()
+sqlite = os.environ.get("DATABASE_URL", "sqlite:///shopmate.db").startswith("sqlite")
+
+bind = os.environ.get("GUNICORN_BIND", f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(cpus, 4) if sqlite else cpus * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 8 if sqlite else 4))
+
+timeout = 60             # Seconds a request may run; streaming replies finish well inside this
+graceful_timeout = 30
+keepalive = 5            # Keep browser connections open between chat requests
+max_requests = 5000      # Recycle workers now and then to cap fragmentation
+max_requests_jitter = 500
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG")  # "-" for stdout; off by default
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+# Read by app.py in each worker
+os.environ.setdefault("DB_POOL_SIZE", str(threads))
+os.environ.setdefault("DB_MAX_OVERFLOW", str(threads))
+os.environ.setdefault("DB_POOL_PRE_PING", "0")
+os.environ.setdefault("SCHEMA_AUTO_MIGRATE", "0")
+os.environ.setdefault("PASSWORD_HASH_QUEUE", str(max(1, threads // 2)))  # Leave half the threads to chat requests
+if workers > 1:
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("CACHE_BACKEND", f"sqlite:///{os.path.join(cache_dir, 'cache.db')}")
+    os.environ.setdefault("CHAT_WRITE_GROUP_COMMIT", "1")
+
+
+def when_ready(server):
+    """Warm the preloaded app up in the master, before the workers are forked."""
+    if not preload_app:
+        return
+    from app import warm_up
+    warm_up(server.app.wsgi())
+    # Keep the collector from touching (and so copying) the shared objects in workers
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """Fork the worker's password hash processes while it has a single thread."""
+    from password_hashing import password_hasher
+    password_hasher.start()
@@ -0,0 +1,169 @@
+"""
+Intent classification for ShopMate AI chat messages
+
+This module turns a raw chat message into an intent plus slots:
+- One precompiled word-boundary regex scans the message exactly once
+- Messages without digits or multi-word phrases (most of them) skip the
+  regex: their words are looked up in a dict, with the same result
+- Trigger words are resolved by a fixed intent priority
+- Slots carry the category, price bound, rating/stock filters and free-text keywords.
+  A bare number is a price bound only right after a price word ("under 50");
+  otherwise it is a keyword ("iphone 15")
+- is_refinement() spots follow-ups that only add filters to the last listing
+"""
+
+import re
+from collections import namedtuple
+
+# Trigger phrases per intent. The compiled alternation lists longer phrases
+# first so that "add to cart" wins over a bare "cart" at the same position.
+INTENT_TRIGGERS = {
+    'add_to_cart': ['add to cart'],
+    'help': ['what can you do', 'help', 'commands'],
+    'price': ['less than', 'under', 'below', 'cheaper'],
+    'cart': ['cart', 'basket', 'added'],
+    'search': ['show', 'find', 'search', 'looking', 'want'],
+    'greeting': ['hello', 'hi', 'hey', 'start'],
+}
+
+# Words that name a catalog category, mapped to Product.category values
+CATEGORY_SYNONYMS = {
+    'electronics': 'Electronics', 'electronic': 'Electronics', 'tech': 'Electronics',
+    'gadget': 'Electronics', 'gadgets': 'Electronics',
+    'books': 'Books', 'book': 'Books', 'reading': 'Books', 'novel': 'Books', 'textbook': 'Books',
+    'textiles': 'Textiles', 'textile': 'Textiles', 'clothing': 'Textiles', 'clothes': 'Textiles',
+    'shirt': 'Textiles', 'jacket': 'Textiles', 'scarf': 'Textiles', 'accessories': 'Textiles',
+}
+
+# Category words that on their own ask for a category listing
+CATEGORY_LISTING_TERMS = {'electronics', 'books', 'textiles', 'clothing', 'accessories'}
+
+# Common words that don't help with product search
+STOP_WORDS = frozenset(['show', 'me', 'find', 'search', 'for', 'the', 'a', 'an', 'get',
+                        'want', 'need', 'looking', 'some'])
+
+# Words a filter-only follow-up may contain ("now only the ones under $50")
+FOLLOW_UP_WORDS = frozenset(['now', 'only', 'just', 'those', 'these', 'them', 'ones', 'one', 'and', 'but',
+                             'with', 'that', 'are', 'is', 'of', 'please', 'what', 'about', 'how', 'any',
+                             'also', 'then', 'ok', 'okay'])
+
+# Filter phrases that refine a listing without choosing the intent
+RATING_PATTERN = r'\brated\s+(?:at\s+least\s+)?\d(?:\.\d+)?\s*\+?|\b\d(?:\.\d+)?\s*\+?\s*stars?\b'
+IN_STOCK_TERMS = ['in stock', 'available']
+
+# First intent present wins. 'price' only qualifies here when a bound was found.
+INTENT_PRIORITY = ['add_to_cart', 'cart', 'price', 'search', 'category', 'help', 'greeting']
+
+Intent = namedtuple('Intent', ['name', 'slots'])
+
+
+def _alternation(phrases):
+    ordered = sorted(phrases, key=len, reverse=True)
+    return '|'.join(re.escape(phrase).replace(r'\ ', r'\s+') for phrase in ordered)
+
+
+def _compile_pattern():
+    groups = [f'(?P<{name}>{_alternation(triggers)})' for name, triggers in INTENT_TRIGGERS.items()]
+    groups.append(f'(?P<category>{_alternation(CATEGORY_SYNONYMS)})')
+    groups.append(f'(?P<in_stock>{_alternation(IN_STOCK_TERMS)})')
+    return re.compile(
+        r'(?P<rating>' + RATING_PATTERN + r')'
+        r'|(?P<amount>\$\s*\d+(?:\.\d+)?|\b\d+(?:\.\d+)?\b)'
+        r'|\b(?:' + '|'.join(groups) + r')\b'
+        r'|(?P<word>\b\w+\b)'
+    )
+
+
+MESSAGE_PATTERN = _compile_pattern()
+
+# Fast path: single trigger words by group, and the words that may start a
+# phrase (or a rating) only MESSAGE_PATTERN can match
+WORD_PATTERN = re.compile(r'\w+')
+DIGIT_PATTERN = re.compile(r'\d')
+WORD_GROUPS = {word: name for name, triggers in INTENT_TRIGGERS.items() for word in triggers if ' ' not in word}
+WORD_GROUPS.update({word: 'category' for word in CATEGORY_SYNONYMS})
+WORD_GROUPS.update({term: 'in_stock' for term in IN_STOCK_TERMS if ' ' not in term})
+PHRASE_STARTS = frozenset([phrase.split()[0] for phrases in [*INTENT_TRIGGERS.values(), IN_STOCK_TERMS]
+                           for phrase in phrases if ' ' in phrase] + ['rated', 'star', 'stars'])
+
+
+def _scan(message):
+    """Return (group, text) for every match of MESSAGE_PATTERN in a lowercase message."""
+    words = WORD_PATTERN.findall(message)
+    if DIGIT_PATTERN.search(message) or not PHRASE_STARTS.isdisjoint(words):
+        return [(match.lastgroup, match.group(match.lastgroup)) for match in MESSAGE_PATTERN.finditer(message)]
+    return [(WORD_GROUPS.get(word, 'word'), word) for word in words]
+
+
+def classify(message):
+    """
+    Classify a chat message in a single regex pass.
+
+    Args:
+        message (str): Raw user message
+
+    Returns:
+        Intent: (name, slots) where slots holds 'category' (Product.category or None),
+            'category_term' (word the user typed), 'max_price' (float or None),
+            'min_rating' (float or None), 'in_stock' (bool) and 'keywords'
+            (list of search words)
+    """
+    found = set()
+    keywords = []
+    category = category_term = max_price = min_rating = None
+    in_stock = listing = price_cue = False
+
+    for group, text in _scan(message.lower()):
+        # "under", "below", "less than", or "cheaper" followed by "than"
+        after_price_word, price_cue = price_cue, group == 'price' or (price_cue and text == 'than')
+        if group == 'word':
+            # Every other word except filler words counts as a search keyword
+            if text not in STOP_WORDS:
+                keywords.append(text)
+        elif group == 'category':
+            is_listing = text in CATEGORY_LISTING_TERMS
+            # Prefer the first listing word so 'category' dispatch can name it
+            if category is None or (is_listing and not listing):
+                category = CATEGORY_SYNONYMS[text]
+                category_term = text
+            listing = listing or is_listing
+        elif group == 'rating':
+            min_rating = min(5.0, float(re.search(r'\d(?:\.\d+)?', text).group()))
+        elif group == 'in_stock':
+            in_stock = True
+        elif group == 'amount':
+            if not (text.startswith('$') or after_price_word):
+                keywords.append(text)
+            elif max_price is None:
+                max_price = float(text.lstrip('$').strip())
+        else:
+            found.add(group)
+
+    if listing:
+        found.add('category')
+    slots = {'category': category, 'category_term': category_term, 'max_price': max_price,
+             'min_rating': min_rating, 'in_stock': in_stock, 'keywords': keywords}
+
+    for name in INTENT_PRIORITY:
+        if name in found and (name != 'price' or max_price is not None):
+            return Intent(name, slots)
+    if 'price' in found:
+        return Intent('price', slots)
+    return Intent('default', slots)
+
+
+def is_refinement(intent):
+    """
+    Tell whether a message only adds filters to the previous listing,
+    like "now under $50", "only in stock" or "what about rated 4+".
+
+    Args:
+        intent (Intent): Result of classify()
+
+    Returns:
+        bool: True for a price, rating or stock filter without a new category or search words
+    """
+    slots = intent.slots
+    has_filter = slots['max_price'] is not None or slots['min_rating'] is not None or slots['in_stock']
+    return (has_filter and slots['category'] is None and intent.name in ('price', 'search', 'default')
+            and all(word in FOLLOW_UP_WORDS for word in slots['keywords']))
@@ -0,0 +1,214 @@
+"""
+Write-behind persistence for ShopMate AI chat messages
+
+When app.config["CHAT_WRITE_BEHIND"] is enabled, api_chat hands ChatMessage
+rows to ChatMessageWriter instead of committing them one turn at a time:
+- Rows are buffered in memory with their timestamp taken at enqueue time
+- A background thread inserts them in bulk (executemany) once the buffer
+  reaches CHAT_WRITE_BATCH_SIZE rows or CHAT_WRITE_FLUSH_INTERVAL seconds pass
+- flush() is synchronous, so readers such as chat() see their own writes.
+  It only writes this process's buffer: with several workers, a read served
+  by another worker misses rows still buffered here for up to
+  CHAT_WRITE_FLUSH_INTERVAL seconds. CHAT_WRITE_GROUP_COMMIT makes every
+  chat turn wait until its rows are committed (batched with the rows of
+  concurrent requests), so replies are only sent for persisted messages;
+  gunicorn.conf.py turns it on when it starts more than one worker
+- Transient database errors (lost connection, locked database, pool
+  timeout) keep the rows buffered for the next flush. Other errors, and a
+  batch failing CHAT_WRITE_MAX_ATTEMPTS times in a row, fall back to one
+  insert per row; rows that still fail are logged (dead-lettered) and dropped
+- At most CHAT_WRITE_MAX_BUFFER rows are kept; beyond that the oldest are
+  dropped and logged, e.g. while the database is down
+- Pending rows are flushed at interpreter exit (atexit)
+"""
+
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
+from app import db
+from models import ChatMessage
+from replicas import replica_router
+
+logger = logging.getLogger(__name__)
+
+
+def is_transient(error):
+    """
+    Tell whether a failed insert may succeed unchanged later.
+
+    Args:
+        error (Exception): Exception raised by the insert
+
+    Returns:
+        bool: True for lost connections, lock and pool timeouts; False for
+            rows the database rejects (constraint violations, bad data)
+    """
+    if isinstance(error, (OperationalError, PoolTimeoutError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class ChatMessageWriter:
+    """
+    Buffered, batched writer for ChatMessage rows.
+    Disabled (enabled=False) until init_app() is called with CHAT_WRITE_BEHIND set.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.batch_size = 200
+        self.flush_interval = 0.5
+        self.group_commit = False
+        self.max_attempts = 3
+        self.max_buffer = 20000
+        self.dropped = 0
+        self._failures = 0                     # Consecutive failed bulk inserts
+        self._app = None
+        self._buffer = []
+        self._lock = threading.Lock()          # Guards _buffer
+        self._flush_lock = threading.Lock()    # Serializes flushes
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """
+        Configure the writer from app.config and register the shutdown flush.
+
+        Args:
+            app (Flask): Application providing the database configuration
+        """
+        self._app = app
+        self.enabled = app.config.get("CHAT_WRITE_BEHIND", False)
+        self.batch_size = app.config.get("CHAT_WRITE_BATCH_SIZE", self.batch_size)
+        self.flush_interval = app.config.get("CHAT_WRITE_FLUSH_INTERVAL", self.flush_interval)
+        self.group_commit = self.enabled and app.config.get("CHAT_WRITE_GROUP_COMMIT", False)
+        self.max_attempts = app.config.get("CHAT_WRITE_MAX_ATTEMPTS", self.max_attempts)
+        self.max_buffer = app.config.get("CHAT_WRITE_MAX_BUFFER", self.max_buffer)
+        if self.enabled:
+            atexit.register(self.close)
+
+    def enqueue(self, session_id, message, sender):
+        """
+        Buffer a chat message for the next bulk insert.
+
+        Args:
+            session_id (int): ChatSession.id the message belongs to
+            message (str): Message content
+            sender (str): Either 'user' or 'bot'
+        """
+        row = {'session_id': session_id, 'message': message, 'sender': sender,
+               'timestamp': datetime.utcnow()}
+        with self._lock:
+            self._buffer.append(row)
+            self._trim()
+            pending = len(self._buffer)
+        self._ensure_thread()
+
+        if pending >= self.batch_size * 10:
+            # Backpressure: the flusher is falling behind, write from the caller
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Insert all buffered rows now. Blocks until they are committed, or
+        kept for a retry after a transient error.
+
+        Returns:
+            int: Number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            try:
+                self._insert(rows)
+            except Exception as error:
+                self._failures += 1
+                if is_transient(error) and self._failures < self.max_attempts:
+                    logger.warning('Failed to flush %d chat messages (%s), will retry', len(rows), error)
+                    self._requeue(rows)
+                    return 0
+                logger.warning('Failed to flush %d chat messages (%s), inserting them one by one',
+                               len(rows), error)
+                return self._insert_each(rows)
+            self._failures = 0
+            return len(rows)
+
+    def _insert(self, rows):
+        # The app context below has its own g, so mark the caller's request here:
+        # its later reads (the history after a flush) must see these rows
+        replica_router.use_primary()
+        with self._app.app_context():
+            try:
+                db.session.execute(insert(ChatMessage), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def _insert_each(self, rows):
+        """Insert rows one at a time, dropping the rejected ones. Stops at a transient error."""
+        written = 0
+        for index, row in enumerate(rows):
+            try:
+                self._insert([row])
+                written += 1
+            except Exception as error:
+                if is_transient(error):
+                    # The database is unavailable, not this row: keep the rest for later
+                    self._requeue(rows[index:])
+                    return written
+                self.dropped += 1
+                logger.error('Dropped chat message %r: %s', row, error)
+        self._failures = 0
+        return written
+
+    def _requeue(self, rows):
+        with self._lock:
+            self._buffer[:0] = rows
+            self._trim()
+
+    def _trim(self):
+        # Caller holds _lock. Drop the oldest rows beyond max_buffer
+        excess = len(self._buffer) - self.max_buffer
+        if excess > 0:
+            self.dropped += excess
+            logger.error('Chat message buffer full, dropped the %d oldest messages', excess)
+            del self._buffer[:excess]
+
+    def close(self):
+        """Stop the background thread and flush whatever is still buffered."""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval * 4)
+        self.flush()
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so start one lazily in every worker process
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._stopped = False
+                    self._thread = threading.Thread(target=self._run, name='chat-message-writer', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+# Process-wide writer used by routes.api_chat
+chat_writer = ChatMessageWriter()
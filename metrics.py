@@ -0,0 +1,283 @@
+"""
+Request instrumentation for ShopMate AI
+
+Answers "where did this slow /api/chat call spend its time?":
+- span(stage) times a stage of a request (intent matching, product query,
+  response formatting, commit) and feeds a per-stage latency histogram
+- SQLAlchemy engine events count every SQL statement and time it, both per
+  request and in a per-operation histogram
+- Every request is timed per endpoint; the stage and SQL totals of the
+  request are sent back in a Server-Timing header (visible in browser devtools).
+  Streamed responses (the SSE chat) get none: their stages run after the
+  headers are sent
+- GET /metrics exposes everything in the Prometheus text format. It answers
+  requests with "Authorization: Bearer <METRICS_TOKEN>" or, without a token
+  configured, direct loopback requests only (none forwarded by a proxy)
+
+Off unless METRICS_ENABLED is set.
+
+Metrics are kept per process. With several gunicorn workers, scrape each
+worker or run a single worker per scrape target.
+"""
+
+import hmac
+import threading
+import time
+from contextlib import contextmanager
+from bisect import bisect_left
+from flask import g, has_request_context, request, Response, current_app
+from sqlalchemy import event
+
+# Upper bounds in seconds, shared by every histogram
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Clients allowed to scrape /metrics when no METRICS_TOKEN is configured
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+
+    Args:
+        name (str): Metric name
+        help (str): One-line description
+        labelnames (tuple): Label names, values passed positionally to inc()
+    """
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f'{self.name}_total{_format_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with labels.
+
+    Args:
+        name (str): Metric name
+        help (str): One-line description
+        labelnames (tuple): Label names, values passed positionally to observe()
+        buckets (tuple): Sorted upper bounds; +Inf is added automatically
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{_format_labels(self.labelnames, labels, [("le", le)])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labelnames, labels)} {series[-1]}'
+            yield f'{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Registry:
+    """Collection of metrics rendered together by /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format (0.0.4).
+
+        Returns:
+            str: Exposition text
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    'shopmate_request_duration_seconds', 'HTTP request latency', ('method', 'endpoint', 'status')))
+STAGE_DURATION = registry.register(Histogram(
+    'shopmate_stage_duration_seconds', 'Latency of instrumented request stages', ('stage',)))
+SQL_DURATION = registry.register(Histogram(
+    'shopmate_sql_query_duration_seconds', 'SQL statement latency', ('operation',)))
+SQL_QUERIES_PER_REQUEST = registry.register(Histogram(
+    'shopmate_sql_queries_per_request', 'SQL statements executed per request', ('endpoint',),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)))
+SQL_ERRORS = registry.register(Counter(
+    'shopmate_sql_errors', 'SQL statements that raised', ('operation',)))
+
+
+def _request_timings():
+    """Per-request accumulator, or None outside a request."""
+    if not has_request_context():
+        return None
+    timings = g.get('_timings')
+    if timings is None:
+        timings = g._timings = {'stages': {}, 'sql_count': 0, 'sql_time': 0.0}
+    return timings
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a stage of the current request.
+
+    Durations go to the stage histogram and, inside a request, are summed
+    per stage into the Server-Timing header.
+
+    Args:
+        stage (str): Stage name, e.g. 'classify' or 'product_query'
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage)
+        timings = _request_timings()
+        if timings is not None:
+            timings['stages'][stage] = timings['stages'].get(stage, 0.0) + elapsed
+
+
+def _statement_operation(statement):
+    word = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+    return word if word in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'PRAGMA', 'BEGIN', 'COMMIT') else 'OTHER'
+
+
+def instrument_engine(engine):
+    """
+    Count and time every statement run on a (sync) SQLAlchemy engine.
+    For an AsyncEngine pass engine.sync_engine.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Engine to instrument
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['_query_started'].pop()
+        SQL_DURATION.observe(elapsed, _statement_operation(statement))
+        timings = _request_timings()
+        if timings is not None:
+            timings['sql_count'] += 1
+            timings['sql_time'] += elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def _on_error(context):
+        started = context.connection.info.get('_query_started') if context.connection is not None else None
+        if started:
+            started.pop()
+        SQL_ERRORS.inc(_statement_operation(context.statement or ''))
+
+
+def _start_request():
+    g._request_started = time.perf_counter()
+
+
+def _finish_request(response):
+    started = g.get('_request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    if endpoint == '/metrics':
+        return response
+
+    REQUEST_DURATION.observe(elapsed, request.method, endpoint, str(response.status_code))
+    timings = _request_timings()
+    SQL_QUERIES_PER_REQUEST.observe(timings['sql_count'], endpoint)
+    if response.is_streamed:
+        # The body (and its spans and queries) is produced after the headers go out
+        return response
+
+    # Durations in milliseconds, per https://www.w3.org/TR/server-timing/
+    entries = [f'{stage};dur={duration * 1000:.2f}' for stage, duration in timings['stages'].items()]
+    entries.append(f'db;dur={timings["sql_time"] * 1000:.2f};desc="{timings["sql_count"]} queries"')
+    entries.append(f'total;dur={elapsed * 1000:.2f}')
+    response.headers['Server-Timing'] = ', '.join(entries)
+    return response
+
+
+def _scrape_allowed():
+    token = current_app.config.get("METRICS_TOKEN")
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    # ProxyFix doesn't rewrite remote_addr, so a request through a local proxy looks like loopback
+    return request.remote_addr in LOOPBACK_ADDRESSES and 'X-Forwarded-For' not in request.headers
+
+
+def metrics_view():
+    """Prometheus scrape endpoint; 403 unless _scrape_allowed()."""
+    if not _scrape_allowed():
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app, engine, replicas=()):
+    """
+    Install the request hooks, SQL instrumentation and /metrics route.
+
+    Args:
+        app (Flask): Application to instrument
+        engine (sqlalchemy.engine.Engine): The application's database engine
+        replicas (list): Read replica engines (see replicas.py), counted like the primary
+    """
+    if not app.config.get("METRICS_ENABLED", False):
+        return
+    for instrumented in (engine, *replicas):
+        instrument_engine(instrumented)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
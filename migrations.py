@@ -0,0 +1,261 @@
+"""
+Schema migrations for ShopMate AI
+
+db.create_all() only creates missing tables; it never changes tables that
+already exist. This module brings an existing database up to date with
+models.py through ordered migrations:
+- Each migration is idempotent, so it is also safe on a freshly created schema
+- Applied versions are recorded in the schema_migrations table
+- Works on SQLite and PostgreSQL
+- Runs as a separate step (the migrate command), not on import. The app
+  checks the schema once before its first request and only migrates by
+  itself when SCHEMA_AUTO_MIGRATE is set
+- A new table needs a migration too: create_all() runs with the migrate
+  command, not on every start-up
+
+Usage:
+    python migrations.py            # Create missing tables and apply pending migrations
+    python migrations.py --status   # List applied and pending migrations
+    flask --app main migrate        # Same as python migrations.py
+"""
+
+import argparse
+import logging
+from datetime import datetime
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime, inspect, select, func, text
+import click
+from app import db
+from models import User, Product, CartItem, ChatSession, ChatMessage, StockReservation, CatalogChange
+
+logger = logging.getLogger(__name__)
+
+# Bookkeeping table, kept out of db.metadata so create_all() never touches it
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def _recount_carts(connection):
+    """Recompute user.cart_count for every user from cart_item."""
+    users = User.__table__
+    count = (select(func.count()).select_from(CartItem.__table__)
+             .where(CartItem.__table__.c.user_id == users.c.id).scalar_subquery())
+    connection.execute(users.update().values(cart_count=count))
+
+
+def _create_indexes(connection, model):
+    """
+    Create the model's missing indexes. Indexes on columns that a later
+    migration adds are left for that migration.
+    """
+    columns = {column['name'] for column in inspect(connection).get_columns(model.__tablename__)}
+    for index in model.__table__.indexes:
+        if all(column.name in columns for column in index.columns):
+            index.create(connection, checkfirst=True)
+
+
+def add_user_cart_count(connection):
+    """Add the denormalized user.cart_count column and backfill it."""
+    columns = {column['name'] for column in inspect(connection).get_columns(User.__tablename__)}
+    if 'cart_count' not in columns:
+        table = connection.dialect.identifier_preparer.format_table(User.__table__)
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN cart_count INTEGER NOT NULL DEFAULT 0'))
+    _recount_carts(connection)
+
+
+def add_hot_path_indexes(connection):
+    """
+    Add composite indexes on the hot lookup columns and make cart rows unique
+    per (user_id, product_id), merging any duplicate rows first.
+    """
+    items = CartItem.__table__
+    duplicates = connection.execute(
+        select(items.c.user_id, items.c.product_id, func.min(items.c.id), func.sum(items.c.quantity))
+        .group_by(items.c.user_id, items.c.product_id)
+        .having(func.count() > 1)
+    ).all()
+    for user_id, product_id, keep_id, quantity in duplicates:
+        connection.execute(items.update().where(items.c.id == keep_id).values(quantity=quantity))
+        connection.execute(items.delete().where(
+            items.c.user_id == user_id, items.c.product_id == product_id, items.c.id != keep_id
+        ))
+    if duplicates:
+        logger.info('Merged %d duplicate cart rows', len(duplicates))
+        _recount_carts(connection)
+
+    for model in (Product, CartItem, ChatMessage):
+        _create_indexes(connection, model)
+
+
+def add_history_keyset_index(connection):
+    """Extend the chat history index with id so (timestamp, id) keyset pages are single index seeks."""
+    existing = {index['name'] for index in inspect(connection).get_indexes(ChatMessage.__tablename__)}
+    if 'ix_chat_message_session_timestamp' in existing:
+        connection.execute(text('DROP INDEX ix_chat_message_session_timestamp'))
+    _create_indexes(connection, ChatMessage)
+
+
+def add_product_sku(connection):
+    """Add product.sku and its unique index, the conflict target of catalog upserts."""
+    columns = {column['name'] for column in inspect(connection).get_columns(Product.__tablename__)}
+    if 'sku' not in columns:
+        table = connection.dialect.identifier_preparer.format_table(Product.__table__)
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN sku VARCHAR(64)'))
+    _create_indexes(connection, Product)
+
+
+def add_product_updated_at(connection):
+    """Add product.updated_at, backfilled from created_at."""
+    columns = {column['name'] for column in inspect(connection).get_columns(Product.__tablename__)}
+    if 'updated_at' not in columns:
+        table = connection.dialect.identifier_preparer.format_table(Product.__table__)
+        column_type = DateTime().compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN updated_at {column_type}'))
+    products = Product.__table__
+    connection.execute(products.update().where(products.c.updated_at.is_(None))
+                       .values(updated_at=func.coalesce(products.c.created_at, datetime.utcnow())))
+
+
+def add_chat_session_cleared_through(connection):
+    """Add chat_session.cleared_through, the watermark of cleared chat history."""
+    columns = {column['name'] for column in inspect(connection).get_columns(ChatSession.__tablename__)}
+    if 'cleared_through' not in columns:
+        table = connection.dialect.identifier_preparer.format_table(ChatSession.__table__)
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN cleared_through INTEGER'))
+
+
+def add_stock_reservations(connection):
+    """Create the stock_reservation table of cart holds."""
+    StockReservation.__table__.create(connection, checkfirst=True)
+    _create_indexes(connection, StockReservation)
+
+
+def add_catalog_changes(connection):
+    """Create the catalog_change feed that keeps every process's catalog copies current."""
+    CatalogChange.__table__.create(connection, checkfirst=True)
+
+
+# (version, description, function) in the order they must run
+MIGRATIONS = [
+    (1, 'Add denormalized user.cart_count', add_user_cart_count),
+    (2, 'Add hot-path indexes and unique cart rows', add_hot_path_indexes),
+    (3, 'Index chat history on (session_id, timestamp, id)', add_history_keyset_index),
+    (4, 'Add product.sku for catalog imports', add_product_sku),
+    (5, 'Add product.updated_at for reply card caching', add_product_updated_at),
+    (6, 'Add chat_session.cleared_through for batched history purges', add_chat_session_cleared_through),
+    (7, 'Add stock_reservation for time-limited cart holds', add_stock_reservations),
+    (8, 'Add catalog_change, the cross-process catalog change feed', add_catalog_changes),
+]
+
+
+def applied_versions(connection):
+    """Return the set of migration versions already recorded."""
+    schema_migrations.create(connection, checkfirst=True)
+    return set(connection.scalars(select(schema_migrations.c.version)))
+
+
+def pending_versions(connection):
+    """Return the versions not applied yet, without creating the bookkeeping table."""
+    if not inspect(connection).has_table(schema_migrations.name):
+        return [version for version, _, _ in MIGRATIONS]
+    applied = set(connection.scalars(select(schema_migrations.c.version)))
+    return [version for version, _, _ in MIGRATIONS if version not in applied]
+
+
+def upgrade():
+    """
+    Apply every pending migration, each in its own transaction.
+    Must be called inside an application context.
+
+    Returns:
+        list: Versions applied by this call
+    """
+    with db.engine.begin() as connection:
+        applied = applied_versions(connection)
+
+    newly_applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        with db.engine.begin() as connection:
+            migrate(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow()
+            ))
+        logger.info('Applied migration %d: %s', version, name)
+        newly_applied.append(version)
+    return newly_applied
+
+
+def migrate():
+    """
+    Create missing tables, then apply pending migrations. This is the
+    migrate command; must be called inside an application context.
+
+    Returns:
+        list: Versions applied by this call
+    """
+    db.create_all()
+    return upgrade()
+
+
+def ensure_schema(app):
+    """
+    Check that the database is up to date before the app serves from it.
+    Must be called inside an application context.
+
+    Args:
+        app (Flask): Application providing SCHEMA_AUTO_MIGRATE
+
+    Raises:
+        RuntimeError: Migrations are pending and SCHEMA_AUTO_MIGRATE is off
+    """
+    with db.engine.connect() as connection:
+        pending = pending_versions(connection)
+    if not pending:
+        return
+    if not app.config.get("SCHEMA_AUTO_MIGRATE", True):
+        raise RuntimeError(f'Database schema is out of date (pending migrations: {pending}); '
+                           'run "python migrations.py" or "flask --app main migrate"')
+    logger.info('Migrating the database schema (pending: %s)', pending)
+    migrate()
+
+
+def init_app(app):
+    """
+    Register the "flask migrate" command.
+
+    Args:
+        app (Flask): Application to extend
+    """
+    @app.cli.command('migrate')
+    def migrate_command():
+        """Create missing tables and apply pending schema migrations."""
+        versions = migrate()
+        click.echo(f"Applied {len(versions)} migration(s)" + (f": {versions}" if versions else ''))
+
+
+def main():
+    from app import create_app
+    parser = argparse.ArgumentParser(description='Apply ShopMate AI schema migrations')
+    parser.add_argument('--status', action='store_true', help='list migrations instead of applying them')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.status:
+            with db.engine.begin() as connection:
+                applied = applied_versions(connection)
+            for version, name, _ in MIGRATIONS:
+                print(f"{'applied' if version in applied else 'pending':>8}  {version:3d}  {name}")
+        else:
+            versions = migrate()
+            print(f"Applied {len(versions)} migration(s)" + (f": {versions}" if versions else ''))
+
+
+if __name__ == '__main__':
+    main()
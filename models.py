@@ -5,13 +5,16 @@ This module defines all database models using SQLAlchemy ORM:
 - User: Customer accounts with authentication
 - Product: E-commerce product catalog
 - CartItem: Shopping cart management
+- StockReservation: Time-limited stock holds for cart lines
 - ChatSession: Chat conversation sessions
 - ChatMessage: Individual chat messages
 """
 
 from app import db
 from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, select, func
+from sqlalchemy.dialects import postgresql, sqlite
+from password_hashing import password_hasher
 
 class User(db.Model):
     """
@@ -25,6 +28,7 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(256))  # Stores hashed password for security
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    cart_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Denormalized CartItem row count
     
     # One-to-many relationships
     cart_items = db.relationship('CartItem', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -36,8 +40,11 @@ class User(db.Model):
         
         Args:
             password (str): Plain text password to hash
+            
+        Raises:
+            HashingBusy: Too many hashes are queued in this worker
         """
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """
@@ -48,8 +55,30 @@ class User(db.Model):
             
         Returns:
             bool: True if password matches, False otherwise
+            
+        Raises:
+            HashingBusy: Too many hashes are queued in this worker
+        """
+        return password_hasher.verify(self.password_hash, password)
+    
+    def needs_rehash(self):
+        """Return True if the stored hash predates the configured hash parameters."""
+        return password_hasher.needs_rehash(self.password_hash)
+    
+    @classmethod
+    def refresh_cart_count_statement(cls, user_id):
+        """
+        Build an UPDATE that recomputes cart_count from cart_item and returns it.
+        Used after Core-level cart writes, which bypass the ORM counter events.
+        
+        Args:
+            user_id (int): User whose count to recompute
+            
+        Returns:
+            Update: Statement returning the new cart_count
         """
-        return check_password_hash(self.password_hash, password)
+        count = select(func.count()).select_from(CartItem).where(CartItem.user_id == user_id).scalar_subquery()
+        return cls.__table__.update().where(cls.id == user_id).values(cart_count=count).returning(cls.cart_count)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -62,6 +91,7 @@ class Product(db.Model):
     and inventory details for the shopping experience.
     """
     id = db.Column(db.Integer, primary_key=True)
+    sku = db.Column(db.String(64))  # Merchant stock-keeping unit, the key for catalog imports
     title = db.Column(db.String(200), nullable=False)  # Product name/title
     description = db.Column(db.Text)  # Detailed product description
     price = db.Column(db.Float, nullable=False)  # Product price in USD
@@ -70,6 +100,12 @@ class Product(db.Model):
     image_url = db.Column(db.String(500))  # Product image URL
     stock = db.Column(db.Integer, default=10)  # Available inventory count
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Product creation timestamp
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # Last change; versions cached reply cards
+    
+    __table_args__ = (
+        db.Index('ix_product_category_price', 'category', 'price'),  # Category listings and price filters
+        db.Index('uq_product_sku', 'sku', unique=True),  # Upsert target for catalog imports; NULLs allowed
+    )
     
     def __repr__(self):
         return f'<Product {self.title}>'
@@ -90,9 +126,118 @@ class CartItem(db.Model):
     # Relationship to access product details
     product = db.relationship('Product', backref='cart_items')
     
+    __table_args__ = (
+        # One row per product per cart; also serves every per-user cart lookup
+        db.Index('uq_cart_item_user_product', 'user_id', 'product_id', unique=True),
+    )
+    
+    @classmethod
+    def upsert_statement(cls, dialect_name, user_id, product_id, quantity, replace=False):
+        """
+        Build an atomic add-to-cart: INSERT ... ON CONFLICT (user_id, product_id)
+        DO UPDATE SET quantity = quantity + excluded.quantity.
+        With replace the conflicting row's quantity is set to the new quantity instead.
+        
+        Args:
+            dialect_name (str): 'sqlite' or 'postgresql'
+            user_id (int): Cart owner
+            product_id (int): Product being added
+            quantity (int): Quantity to add
+            replace (bool): Set the quantity instead of adding to it
+            
+        Returns:
+            Insert: Dialect-specific upsert statement
+        """
+        dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+        if dialect_name not in dialects:
+            raise NotImplementedError(f'Cart upsert is not supported on {dialect_name}')
+        
+        statement = dialects[dialect_name].insert(cls).values(
+            user_id=user_id,
+            product_id=product_id,
+            quantity=quantity,
+            added_at=datetime.utcnow()
+        )
+        return statement.on_conflict_do_update(
+            index_elements=['user_id', 'product_id'],
+            set_={'quantity': statement.excluded.quantity if replace
+                  else cls.__table__.c.quantity + statement.excluded.quantity}
+        )
+    
     def __repr__(self):
         return f'<CartItem {self.product.title} x{self.quantity}>'
 
+class StockReservation(db.Model):
+    """
+    Stock held for one cart line until expires_at.
+    
+    The held units are already taken out of Product.stock; when the hold
+    lapses they go back and the cart line is dropped (see reservations.py).
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Cart owner
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)  # Product held
+    quantity = db.Column(db.Integer, nullable=False)  # Units taken out of Product.stock
+    expires_at = db.Column(db.DateTime, nullable=False)  # Released by the expiry sweep after this
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # One hold per cart line
+        db.Index('uq_stock_reservation_user_product', 'user_id', 'product_id', unique=True),
+        # The expiry sweep scans lapsed holds oldest first
+        db.Index('ix_stock_reservation_expires_at', 'expires_at'),
+    )
+    
+    @classmethod
+    def upsert_statement(cls, dialect_name, user_id, product_id, quantity, expires_at):
+        """
+        Build INSERT ... ON CONFLICT (user_id, product_id) DO UPDATE setting
+        the held quantity and expiry of a cart line's hold.
+        
+        Args:
+            dialect_name (str): 'sqlite' or 'postgresql'
+            user_id (int): Cart owner
+            product_id (int): Product held
+            quantity (int): Units now held
+            expires_at (datetime): When the hold lapses
+            
+        Returns:
+            Insert: Dialect-specific upsert statement
+        """
+        dialects = {'sqlite': sqlite, 'postgresql': postgresql}
+        if dialect_name not in dialects:
+            raise NotImplementedError(f'Stock reservations are not supported on {dialect_name}')
+        
+        statement = dialects[dialect_name].insert(cls).values(
+            user_id=user_id,
+            product_id=product_id,
+            quantity=quantity,
+            expires_at=expires_at,
+            created_at=datetime.utcnow()
+        )
+        return statement.on_conflict_do_update(
+            index_elements=['user_id', 'product_id'],
+            set_={'quantity': statement.excluded.quantity, 'expires_at': statement.excluded.expires_at}
+        )
+    
+    def __repr__(self):
+        return f'<StockReservation product={self.product_id} x{self.quantity}>'
+
+class CatalogChange(db.Model):
+    """
+    One entry of the catalog change feed read by every process.
+    
+    Written in the transaction that changes a product, so other workers and
+    hosts can patch their in-memory catalog copies (see catalog_sync.py).
+    The id orders the feed and doubles as the catalog version.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer)  # Changed or deleted product; NULL means reload the whole catalog
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<CatalogChange {self.id} product={self.product_id}>'
+
 class ChatSession(db.Model):
     """
     Chat session model for tracking user conversations.
@@ -104,6 +249,7 @@ class ChatSession(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # References User.id
     session_token = db.Column(db.String(100), unique=True, nullable=False)  # Unique session identifier
     created_at = db.Column(db.DateTime, default=datetime.utcnow)  # Session start time
+    cleared_through = db.Column(db.Integer)  # Messages with id <= this were cleared and await the retention purge
     
     # One-to-many relationship with chat messages
     messages = db.relationship('ChatMessage', backref='session', lazy=True, cascade='all, delete-orphan')
@@ -124,5 +270,28 @@ class ChatMessage(db.Model):
     sender = db.Column(db.String(10), nullable=False)  # Either 'user' or 'bot'
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)  # Message creation time
     
+    __table_args__ = (
+        # Keyset-paginated history per session, newest first
+        db.Index('ix_chat_message_session_timestamp_id', 'session_id', 'timestamp', 'id'),
+    )
+    
     def __repr__(self):
         return f'<ChatMessage {self.sender}: {self.message[:50]}>'
+
+@event.listens_for(CartItem, 'after_insert')
+def _increment_cart_count(mapper, connection, target):
+    """Keep User.cart_count in step with new cart rows, inside the same transaction."""
+    connection.execute(
+        User.__table__.update()
+        .where(User.__table__.c.id == target.user_id)
+        .values(cart_count=User.__table__.c.cart_count + 1)
+    )
+
+@event.listens_for(CartItem, 'after_delete')
+def _decrement_cart_count(mapper, connection, target):
+    """Keep User.cart_count in step with removed cart rows, inside the same transaction."""
+    connection.execute(
+        User.__table__.update()
+        .where(User.__table__.c.id == target.user_id)
+        .values(cart_count=User.__table__.c.cart_count - 1)
+    )
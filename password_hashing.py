@@ -0,0 +1,185 @@
+"""
+Password hashing for ShopMate AI
+
+Werkzeug's scrypt/pbkdf2 hashes are deliberately slow (~100 ms of CPU each),
+so a burst of logins can take the CPU from chat requests on the same worker:
+- Hashes run in a small process pool per worker (PASSWORD_HASH_WORKERS
+  processes) at a lower CPU priority (PASSWORD_HASH_NICE), so chat threads
+  keep their share of the machine. gunicorn.conf.py starts the pool in each
+  worker before its request threads exist; elsewhere it starts on first use
+- At most PASSWORD_HASH_QUEUE hashes may be running or waiting per worker;
+  beyond that HashingBusy is raised and the login page answers 503 with
+  Retry-After. Each waiting login holds a request thread, so the bound is
+  kept below the worker's thread count to leave threads for chat requests
+- A hash whose pool broke (a hash process was killed) is retried once on a
+  fresh pool; if that breaks too, HashingBusy is raised as well
+- The method and salt length come from PASSWORD_HASH_METHOD and
+  PASSWORD_SALT_LENGTH. Stored hashes made with other parameters still
+  verify; needs_rehash() tells login() to store a new hash while it has the
+  plain password
+- PASSWORD_HASH_WORKERS=0 hashes on the request thread, as before
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+logger = logging.getLogger(__name__)
+
+# Parameters Werkzeug fills in for a bare method name
+METHOD_DEFAULTS = {
+    'scrypt': ('32768', '8', '1'),
+    'pbkdf2': ('sha256', str(DEFAULT_PBKDF2_ITERATIONS)),
+}
+
+
+class HashingBusy(Exception):
+    """This worker can't take another password hash right now; retry shortly."""
+
+
+def normalize_method(method):
+    """
+    Spell out a hash method with every parameter, as it appears in stored hashes.
+
+    Args:
+        method (str): e.g. "scrypt", "scrypt:16384:8:1" or "pbkdf2:sha256"
+
+    Returns:
+        str: e.g. "scrypt:32768:8:1"
+
+    Raises:
+        ValueError: Not a method Werkzeug supports
+    """
+    name, *params = method.split(':')
+    if name not in METHOD_DEFAULTS:
+        raise ValueError(f'Unsupported PASSWORD_HASH_METHOD: {method!r}')
+    return ':'.join([name, *params, *METHOD_DEFAULTS[name][len(params):]])
+
+
+def _lower_priority(niceness):
+    if niceness:
+        os.nice(niceness)
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords, off the request thread when configured.
+    Configured by init_app().
+    """
+
+    def __init__(self):
+        self.method = normalize_method('scrypt')
+        self.salt_length = 16
+        self.workers = 0
+        self.niceness = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(4)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def init_app(self, app):
+        """
+        Configure the hash parameters and the process pool from app.config.
+
+        Args:
+            app (Flask): Application providing PASSWORD_HASH_* settings
+        """
+        self.method = normalize_method(app.config.get("PASSWORD_HASH_METHOD", self.method))
+        self.salt_length = app.config.get("PASSWORD_SALT_LENGTH", self.salt_length)
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", self.workers)
+        self.niceness = app.config.get("PASSWORD_HASH_NICE", self.niceness)
+        self._slots = threading.BoundedSemaphore(app.config.get("PASSWORD_HASH_QUEUE", 4))
+
+    def hash(self, password):
+        """
+        Hash a password with the configured method.
+
+        Args:
+            password (str): Plain text password
+
+        Returns:
+            str: Werkzeug hash string ("method$salt$hash")
+
+        Raises:
+            HashingBusy: The hash queue of this worker is full
+        """
+        return self._call(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        """
+        Check a password against a stored hash made with any supported method.
+
+        Args:
+            password_hash (str): Stored hash
+            password (str): Plain text password
+
+        Returns:
+            bool: True if the password matches
+
+        Raises:
+            HashingBusy: The hash queue of this worker is full
+        """
+        if not password_hash:
+            return False
+        return self._call(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Return True if a stored hash was made with other parameters than the configured ones."""
+        method, _, rest = password_hash.partition('$')
+        salt = rest.partition('$')[0]
+        try:
+            method = normalize_method(method)
+        except ValueError:
+            return True
+        return method != self.method or len(salt) != self.salt_length
+
+    def start(self):
+        """Start this process's hash pool now, e.g. before request threads are started."""
+        if self.workers > 0:
+            self._executor().submit(os.getpid).result()
+
+    def _call(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy('Too many password hashes in progress')
+        try:
+            if self.workers <= 0:
+                return function(*args)
+            for attempt in range(2):
+                pool = self._executor()
+                try:
+                    return pool.submit(function, *args).result()
+                except BrokenProcessPool:
+                    # A hash process died (e.g. OOM-killed); retry once on a fresh pool
+                    logger.exception('Password hash pool broke; restarting it')
+                    self._discard(pool)
+            self.rejected += 1
+            raise HashingBusy('Password hash pool keeps breaking')
+        finally:
+            self._slots.release()
+
+    def _discard(self, pool):
+        # Only the first thread to see a broken pool replaces it
+        with self._lock:
+            if self._pool is pool:
+                self._pid = None
+        pool.shutdown(wait=False)
+
+    def _executor(self):
+        # Process pools don't survive fork, so start one lazily in every worker process
+        if self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_lower_priority, initargs=(self.niceness,))
+                self._pid = os.getpid()
+        return self._pool
+
+
+# Process-wide hasher used by the User model
+password_hasher = PasswordHasher()
@@ -0,0 +1,150 @@
+"""
+Opt-in sampling profiler for ShopMate AI
+
+When app.config["PROFILER_ENABLED"] is set, a background thread samples the
+Python stacks of threads that are currently serving a request every
+PROFILER_INTERVAL seconds:
+- Idle worker threads are skipped, so the profile only shows request work
+- Samples are aggregated as folded stacks ("frame;frame;frame count"), the
+  input format of flamegraph.pl, inferno and speedscope
+- The profile is rewritten to PROFILER_OUTPUT every PROFILER_FLUSH_INTERVAL
+  seconds and at exit; each worker process writes its own file (".<pid>")
+
+Render with e.g.  flamegraph.pl instance/profile.folded.1234 > profile.svg
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from flask import request
+
+
+class SamplingProfiler:
+    """
+    Periodic stack sampler for request threads.
+
+    Args:
+        interval (float): Seconds between samples
+        output (str): Path prefix of the folded-stack file
+        flush_interval (float): Seconds between rewrites of the output file
+    """
+
+    def __init__(self, interval=0.005, output='profile.folded', flush_interval=10.0):
+        self.interval = interval
+        self.output = output
+        self.flush_interval = flush_interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._active = {}  # thread id -> endpoint being served
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def enter(self, endpoint):
+        """Mark the calling thread as serving a request."""
+        self._ensure_thread()
+        self._active[threading.get_ident()] = endpoint
+
+    def leave(self):
+        """Mark the calling thread as idle."""
+        self._active.pop(threading.get_ident(), None)
+
+    def folded(self):
+        """
+        Return the profile in folded-stack format.
+
+        Returns:
+            str: One "root;...;leaf count" line per distinct stack
+        """
+        with self._lock:
+            items = sorted(self._stacks.items())
+        return ''.join(f'{stack} {count}\n' for stack, count in items)
+
+    def write(self):
+        """Write the folded profile to the output file of this process."""
+        if not self._stacks:
+            return None
+        path = f'{self.output}.{os.getpid()}'
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            handle.write(self.folded())
+        os.replace(temporary, path)
+        return path
+
+    def stop(self):
+        """Stop sampling and write the profile."""
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=1.0)
+        self.write()
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so start one lazily in every worker process
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._stacks.clear()
+                    self._stopped.clear()
+                    self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        last_flush = time.monotonic()
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, endpoint in list(self._active.items()):
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(endpoint)
+                with self._lock:
+                    self._stacks[';'.join(reversed(stack))] += 1
+                    self.samples += 1
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.write()
+                last_flush = time.monotonic()
+
+
+# Process-wide profiler, created by init_app() when enabled
+profiler = None
+
+
+def _enter_request():
+    rule = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    profiler.enter(f'{request.method} {rule}')
+
+
+def _leave_request(exception=None):
+    profiler.leave()
+
+
+def init_app(app):
+    """
+    Start the sampling profiler if PROFILER_ENABLED is set.
+
+    Args:
+        app (Flask): Application providing PROFILER_* settings
+    """
+    global profiler
+    if not app.config.get("PROFILER_ENABLED", False):
+        return
+    profiler = SamplingProfiler(
+        interval=app.config.get("PROFILER_INTERVAL", 0.005),
+        output=app.config.get("PROFILER_OUTPUT") or os.path.join(app.instance_path, 'profile.folded'),
+        flush_interval=app.config.get("PROFILER_FLUSH_INTERVAL", 10.0),
+    )
+    app.before_request(_enter_request)
+    app.teardown_request(_leave_request)
+    atexit.register(profiler.stop)
@@ -0,0 +1,214 @@
+"""
+Read-replica routing for ShopMate AI
+
+With DATABASE_REPLICA_URLS set, db.session sends read-only queries made
+while serving a request to the replicas and everything else to the primary
+(SQLALCHEMY_DATABASE_URI):
+- RoutingSession.get_bind picks the engine per statement. Plain SELECTs go
+  to the next replica in turn; INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE,
+  ORM flushes and raw connections go to the primary
+- Read-your-writes: once a request has written, all its later reads
+  (including the refresh of objects expired by commit) go to the primary.
+  A user whose request wrote, or used POST/PUT/PATCH/DELETE (chat messages
+  may be written behind the request by message_queue.py), reads their own
+  data (carts, chat history, sessions) from the primary for
+  DB_REPLICA_STICKY_SECONDS afterwards. Queries touching only
+  DB_REPLICA_SHARED_TABLES (the catalog) keep using the replicas, so an
+  active chat still searches on them. Login and registration read
+  accounts from the primary (use_primary), so a new account can sign in
+  from another device before the replicas have it. The marker lives in the
+  "primary_reads" Cache namespace, so every worker sees it with a shared
+  CACHE_BACKEND; with "memory" it is per process and init_app warns
+- Outside requests (migrations, warm-up, background passes, CLI commands)
+  everything uses the primary
+- Replication itself is the database's job (PostgreSQL streaming replicas).
+  For local tests, "python replicas.py" snapshots a SQLite primary into the
+  SQLite replica files (run it again to catch them up)
+- The async engine of async_api.py always uses the primary
+- Replica engines are instrumented by metrics.py like the primary
+
+Without DATABASE_REPLICA_URLS every query goes to the primary, as before.
+"""
+
+import itertools
+import logging
+import os
+import sqlite3
+import sys
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.util import find_tables
+import db_profile
+
+logger = logging.getLogger(__name__)
+
+# Requests that don't make a user's later reads sticky by themselves
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    """
+    Replica engines and the per-user stickiness markers. Configured by init_app().
+    """
+
+    def __init__(self):
+        self.engines = []
+        self.shared_tables = frozenset(['product'])
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self._cycle = None
+        self._sticky = None
+
+    def init_app(self, app):
+        """
+        Create the replica engines from DATABASE_REPLICA_URLS and install the
+        stickiness hooks. Connections are opened on first use.
+
+        Args:
+            app (Flask): Application providing DATABASE_REPLICA_URLS and DB_* settings
+        """
+        from cache import Cache
+        self.shared_tables = frozenset(name.strip() for name in
+                                       app.config.get("DB_REPLICA_SHARED_TABLES", "product").split(',') if name.strip())
+        self.engines = []
+        for url in replica_urls(app):
+            engine = create_engine(url, **db_profile.engine_options(app.config, url))
+            db_profile.install_sqlite_pragmas(engine, app.config)
+            self.engines.append(engine)
+        self._cycle = itertools.cycle(self.engines)
+        self._sticky = Cache('primary_reads', ttl=app.config.get("DB_REPLICA_STICKY_SECONDS", 10))
+        if self.engines:
+            app.before_request(self._load_stickiness)
+            app.after_request(self._save_stickiness)
+            if app.config.get("CACHE_BACKEND", "memory") == "memory":
+                logger.warning('DATABASE_REPLICA_URLS is set with CACHE_BACKEND=memory: read-your-writes '
+                               'stickiness only holds within one process; use a shared CACHE_BACKEND '
+                               'with more than one worker')
+
+    def route(self, clause, flushing=False):
+        """
+        Return the replica engine for a statement, or None for the primary.
+
+        Args:
+            clause: Statement being executed, None for raw connections
+            flushing (bool): The session is flushing ORM changes
+
+        Returns:
+            Engine: A replica engine, or None to use the primary
+        """
+        if not self.engines or not has_request_context():
+            return None
+        if flushing or not isinstance(clause, Select):
+            # Written (or may have written): read this request's changes back from the primary
+            g.db_primary = True
+            return None
+        if clause._for_update_arg is not None:
+            return None
+        if g.get('db_primary') or (g.get('db_sticky') and not self._shared_only(clause)):
+            self.primary_reads += 1
+            return None
+        self.replica_reads += 1
+        return next(self._cycle)
+
+    def use_primary(self):
+        """Send the rest of this request's reads to the primary, e.g. for credential checks."""
+        if has_request_context():
+            g.db_primary = True
+
+    def dispose(self):
+        """Close the replica connections, e.g. before forking workers."""
+        for engine in self.engines:
+            engine.dispose()
+
+    def _shared_only(self, clause):
+        tables = find_tables(clause)
+        return bool(tables) and all(table.name in self.shared_tables for table in tables)
+
+    def _load_stickiness(self):
+        user_id = session.get('user_id')
+        g.db_sticky = user_id is not None and self._sticky.get(user_id) is not None
+
+    def _save_stickiness(self, response):
+        user_id = session.get('user_id')
+        if user_id is not None and (g.get('db_primary') or request.method not in SAFE_METHODS):
+            self._sticky.set(user_id, True)
+        return response
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends request reads to the replicas (see module docstring)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engine = replica_router.route(clause, self._flushing)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_urls(app):
+    """
+    Parse DATABASE_REPLICA_URLS. Relative SQLite paths are resolved in the
+    instance folder, as Flask-SQLAlchemy does for the primary.
+
+    Args:
+        app (Flask): Application providing DATABASE_REPLICA_URLS
+
+    Returns:
+        list: sqlalchemy URL objects
+    """
+    urls = []
+    for url in app.config.get("DATABASE_REPLICA_URLS", "").split(','):
+        if not url.strip():
+            continue
+        url = make_url(url.strip())
+        if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:') \
+                and not os.path.isabs(url.database):
+            url = url.set(database=os.path.join(app.instance_path, url.database))
+        urls.append(url)
+    return urls
+
+
+def copy_sqlite(primary_path, replica_path):
+    """
+    Snapshot a SQLite primary into a replica file with the online backup API,
+    for trying replica routing locally. Run it again to "replicate".
+
+    Args:
+        primary_path (str): Primary database file
+        replica_path (str): Replica database file, overwritten
+    """
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+# Process-wide router used by RoutingSession
+replica_router = ReplicaRouter()
+
+
+def main():
+    """Copy the SQLite primary into every SQLite replica (local testing)."""
+    from app import create_app, db
+    app = create_app()
+    with app.app_context():
+        primary = db.engine.url
+    replicas = replica_urls(app)
+    if primary.get_backend_name() != 'sqlite' or not replicas:
+        sys.exit('Set DATABASE_URL and DATABASE_REPLICA_URLS to SQLite files')
+    for replica in replicas:
+        if replica.get_backend_name() != 'sqlite':
+            sys.exit(f'Not a SQLite replica: {replica}')
+        copy_sqlite(primary.database, replica.database)
+        print(f'Copied {primary.database} -> {replica.database}')
+
+
+if __name__ == '__main__':
+    main()
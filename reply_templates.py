@@ -0,0 +1,136 @@
+"""
+Reply templates for ShopMate AI chat responses
+
+Keeps the per-reply formatting work in routes.py small:
+- Reply layouts are compiled once at import as bound str.format methods
+  and filled with one call. There is no repeated string concatenation
+- Rendered product cards are cached per (product_id, updated_at) in a
+  process-local LRU (cache.MemoryBackend). A product seen by many searches is
+  rendered once, and any change to the product bumps updated_at and so
+  the key
+- compact_reply() turns a product reply into the compact format: the intro
+  line plus product summaries. Clients that draw their own product cards use
+  it instead of downloading the markdown body
+"""
+
+from cache import MemoryBackend
+
+PRODUCT_CARD = (
+    "🛍️ **{title}**\n"
+    "💰 ${price:.2f} | ⭐ {rating}/5\n"
+    "📦 {category}\n"
+    "[Add to Cart](javascript:addToCart({id}))\n\n"
+).format
+
+PRODUCTS_REPLY = "{intro}\n\n{cards}".format
+
+CART_REPLY = "🛒 **Your Cart:**\n\n{lines}\n💰 **Total: ${total:.2f}**\n\nReady to checkout? Just let me know!".format
+
+CART_LINE = "• {title} x{quantity} - ${subtotal:.2f}\n".format
+
+EMPTY_CART_REPLY = (
+    "Your cart is empty! 🛒\n\n"
+    "Start shopping by asking me to show you products:\n"
+    "• 'Show me electronics'\n"
+    "• 'Find books'\n"
+    "• 'Search for headphones'"
+)
+
+# Cards rarely change, so entries live long; a product update changes the key instead
+CARD_TTL = 24 * 3600
+
+card_cache = MemoryBackend(max_entries=4096)
+
+
+def product_summary(product):
+    """
+    Summarize a Product row for a reply.
+
+    Args:
+        product (Product): Product row
+
+    Returns:
+        dict: id, title, price, rating, category and version (updated_at, ISO format)
+    """
+    return {
+        'id': product.id,
+        'title': product.title,
+        'price': product.price,
+        'rating': product.rating,
+        'category': product.category,
+        'version': product.updated_at.isoformat() if product.updated_at else None,
+    }
+
+
+def product_card(summary):
+    """
+    Return the markdown card of a product summary, rendering it on a cache miss.
+
+    Args:
+        summary (dict): As returned by product_summary()
+
+    Returns:
+        str: Markdown card
+    """
+    version = summary.get('version')
+    if version is None:
+        return PRODUCT_CARD(**summary)
+    key = (summary['id'], version)
+    card = card_cache.get(key)
+    if card is None:
+        card = PRODUCT_CARD(**summary)
+        card_cache.set(key, card, CARD_TTL)
+    return card
+
+
+def products_reply(intro, summaries):
+    """Full markdown message of a product reply: intro, blank line, one card per product."""
+    return PRODUCTS_REPLY(intro=intro, cards=''.join(product_card(summary) for summary in summaries))
+
+
+def cart_reply(snapshot):
+    """
+    Markdown message for the cart view.
+
+    Args:
+        snapshot (dict): Cart snapshot from cart.cart_snapshot(), totals already computed
+
+    Returns:
+        str: Message
+    """
+    if not snapshot['items']:
+        return EMPTY_CART_REPLY
+    lines = ''.join(CART_LINE(title=item['title'], quantity=item['quantity'], subtotal=item['subtotal'])
+                    for item in snapshot['items'])
+    return CART_REPLY(lines=lines, total=snapshot['total'])
+
+
+def compact_reply(bot_response):
+    """
+    Convert a bot response to the compact format.
+
+    Product replies keep the intro as their message and drop the markdown
+    cards, which the client renders from 'products'. Other replies are
+    returned unchanged.
+
+    Args:
+        bot_response (dict): Response from process_chat_message()
+
+    Returns:
+        dict: Compact response
+    """
+    if bot_response.get('type') != 'products':
+        return bot_response
+    compact = {key: value for key, value in bot_response.items() if key != 'intro'}
+    compact['message'] = bot_response['intro']
+    return compact
+
+
+def init_app(app):
+    """
+    Size the card cache from app.config.
+
+    Args:
+        app (Flask): Application providing REPLY_CARD_CACHE_SIZE
+    """
+    card_cache.max_entries = app.config.get("REPLY_CARD_CACHE_SIZE", card_cache.max_entries)
@@ -0,0 +1,222 @@
+"""
+Stock reservations for ShopMate AI
+
+Cart lines hold their units: adding to the cart takes them out of
+Product.stock, and they go back when the line shrinks, is removed or its
+hold lapses. This keeps flash-sale traffic from overselling:
+- Taking units is one conditional UPDATE (stock = stock - n WHERE stock >= n),
+  so concurrent buyers can't both get the last unit, on SQLite or PostgreSQL
+- Each cart line has one StockReservation row with the held quantity and an
+  expiry. Any change to a user's cart renews all of that user's holds for
+  STOCK_HOLD_TTL seconds
+- A background pass in every worker releases lapsed holds in batches:
+  DELETE ... RETURNING picks the rows, so each hold is released exactly once
+  even when several workers sweep at the same time. The units go back to
+  Product.stock and the cart lines are dropped
+- Products without a stock value aren't held
+
+Off by default (STOCK_RESERVATIONS_ENABLED): a lapsed hold removes the line
+from the shopper's cart, which a deployment should opt into.
+
+Stock changes are Core UPDATEs: they don't touch updated_at (it versions
+cached reply cards, which don't show stock) and fire none of the ORM events
+that patch the in-memory catalog snapshot, whose stock column would go
+stale. While holds are on, routes read stock from the database instead of
+the snapshot; catalog replies already cached may still show the old stock
+for up to CATALOG_CACHE_TTL. Catalog imports subtract the held units from
+the feed's stock (catalog_import.py).
+"""
+
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, bindparam, tuple_
+from app import db
+from models import User, Product, CartItem, StockReservation
+from cache import cart_cache
+
+logger = logging.getLogger(__name__)
+
+products = Product.__table__
+reservations = StockReservation.__table__
+
+
+class StockReservations:
+    """
+    Takes, adjusts and releases the stock held by cart lines.
+    Configured by init_app().
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.hold_ttl = timedelta(minutes=15)
+        self.interval = 30.0
+        self.batch_size = 500
+        self.released = 0
+        self._app = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """
+        Configure holds from app.config and start the expiry pass.
+
+        Args:
+            app (Flask): Application providing STOCK_* settings
+        """
+        self._app = app
+        self.enabled = app.config.get("STOCK_RESERVATIONS_ENABLED", self.enabled)
+        self.hold_ttl = timedelta(seconds=app.config.get("STOCK_HOLD_TTL", self.hold_ttl.total_seconds()))
+        self.interval = app.config.get("STOCK_EXPIRY_INTERVAL", self.interval)
+        self.batch_size = app.config.get("STOCK_EXPIRY_BATCH_SIZE", self.batch_size)
+        if self.enabled and self.interval > 0:
+            app.before_request(self._ensure_thread)
+
+    def reserve(self, session, user_id, stocks, now=None):
+        """
+        Bring the holds of a user's cart lines in line with their quantities.
+        Runs inside the caller's transaction, after the cart writes; the
+        caller commits, or rolls back when shortages are returned.
+
+        Args:
+            session (Session): Sync session (AsyncSession.run_sync passes one)
+            user_id (int): Cart owner
+            stocks (dict): product_id -> Product.stock of the changed lines; None means not tracked
+            now (datetime): Current time, for tests
+
+        Returns:
+            list: {'product_id', 'requested', 'available'} for lines that couldn't be held
+        """
+        product_ids = sorted(product_id for product_id, stock in stocks.items() if stock is not None)
+        if not product_ids:
+            return []
+        expires_at = (now or datetime.utcnow()) + self.hold_ttl
+        dialect_name = session.get_bind().dialect.name
+
+        wanted = dict(session.execute(
+            select(CartItem.product_id, CartItem.quantity)
+            .where(CartItem.user_id == user_id, CartItem.product_id.in_(product_ids))
+        ).all())
+        held = dict(session.execute(
+            select(reservations.c.product_id, reservations.c.quantity)
+            .where(reservations.c.user_id == user_id, reservations.c.product_id.in_(product_ids))
+        ).all())
+
+        shortages = []
+        for product_id in product_ids:
+            quantity = wanted.get(product_id, 0)
+            delta = quantity - held.get(product_id, 0)
+            if delta > 0:
+                taken = session.execute(
+                    products.update()
+                    .where(products.c.id == product_id, products.c.stock >= delta)
+                    .values(stock=products.c.stock - delta, updated_at=products.c.updated_at)
+                ).rowcount
+                if not taken:
+                    stock = session.scalar(select(products.c.stock).where(products.c.id == product_id)) or 0
+                    shortages.append({'product_id': product_id, 'requested': quantity,
+                                      'available': stock + held.get(product_id, 0)})
+                    continue
+            elif delta < 0:
+                session.execute(
+                    products.update()
+                    .where(products.c.id == product_id)
+                    .values(stock=products.c.stock - delta, updated_at=products.c.updated_at)
+                )
+
+            if quantity:
+                session.execute(StockReservation.upsert_statement(dialect_name, user_id, product_id, quantity, expires_at))
+            elif product_id in held:
+                session.execute(reservations.delete().where(
+                    reservations.c.user_id == user_id, reservations.c.product_id == product_id))
+        if shortages:
+            return shortages
+
+        # An active cart keeps all of its holds
+        session.execute(reservations.update().where(reservations.c.user_id == user_id).values(expires_at=expires_at))
+        return []
+
+    def expire(self, now=None):
+        """
+        Release lapsed holds in batches of batch_size, one transaction each:
+        give the units back and drop the cart lines. Requires an app context.
+
+        Returns:
+            int: Number of holds released
+        """
+        now = now or datetime.utcnow()
+        released = 0
+        while True:
+            ids = select(reservations.c.id).where(reservations.c.expires_at < now) \
+                .order_by(reservations.c.expires_at).limit(self.batch_size).scalar_subquery()
+            # Re-checking the expiry skips holds renewed since the SELECT
+            rows = db.session.execute(
+                reservations.delete()
+                .where(reservations.c.id.in_(ids), reservations.c.expires_at < now)
+                .returning(reservations.c.user_id, reservations.c.product_id, reservations.c.quantity)
+            ).all()
+            if not rows:
+                db.session.rollback()
+                break
+
+            restock = Counter()
+            for row in rows:
+                restock[row.product_id] += row.quantity
+            db.session.execute(
+                products.update()
+                .where(products.c.id == bindparam('product_id'))
+                .values(stock=products.c.stock + bindparam('released'), updated_at=products.c.updated_at),
+                [{'product_id': product_id, 'released': quantity} for product_id, quantity in restock.items()]
+            )
+            db.session.execute(CartItem.__table__.delete().where(
+                tuple_(CartItem.__table__.c.user_id, CartItem.__table__.c.product_id)
+                .in_([(row.user_id, row.product_id) for row in rows])
+            ))
+            # Core deletes bypass the ORM counter events, so recompute the denormalized counts
+            user_ids = {row.user_id for row in rows}
+            users = User.__table__
+            count = (select(func.count()).select_from(CartItem.__table__)
+                     .where(CartItem.__table__.c.user_id == users.c.id).scalar_subquery())
+            db.session.execute(users.update().where(users.c.id.in_(user_ids)).values(cart_count=count))
+            db.session.commit()
+
+            for user_id in user_ids:
+                cart_cache.delete(user_id)
+            released += len(rows)
+            if len(rows) < self.batch_size:
+                break
+        self.released += released
+        return released
+
+    def close(self):
+        """Stop the expiry thread."""
+        self._stopped.set()
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so start one lazily in every worker process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='stock-expiry', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                with self._app.app_context():
+                    released = self.expire()
+                if released:
+                    logger.info('Released %d lapsed stock holds', released)
+            except Exception:
+                logger.exception('Stock hold expiry failed')
+
+
+# Process-wide reservation manager used by the cart endpoints
+stock_reservations = StockReservations()
@@ -8,14 +8,51 @@ This module handles all web routes including:
 - Session management and user interactions
 """
 
-from flask import render_template, request, redirect, url_for, session, flash, jsonify
-from app import app, db
-from models import User, Product, CartItem, ChatSession, ChatMessage
-import uuid
-import re
+from flask import current_app, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
+from app import db
+from models import User, Product, ChatSession, ChatMessage
+from search_index import product_index
+from catalog_snapshot import catalog_snapshot
+from semantic_index import semantic_index, blend
+from intents import classify, is_refinement, CATEGORY_SYNONYMS
+from message_queue import chat_writer
+from metrics import span
+from cache import catalog_cache, cart_cache, login_miss_cache
+from session_store import chat_sessions
+from chat_retention import chat_retention, visible_messages
+from reply_templates import product_summary, product_card, products_reply, cart_reply, compact_reply
+from cart import CartError, parse_operations, apply_operations, cart_snapshot
+from conversation import conversations, ConversationContext, Candidate, refine
+from password_hashing import HashingBusy
+from replicas import replica_router
+from reservations import stock_reservations
+from sqlalchemy import or_, tuple_, select
+import json
 from datetime import datetime
 
-@app.route('/')
+# (rule, view, options) registered on the app by init_app()
+_routes = []
+
+
+def route(rule, **options):
+    """Record a view for init_app(); endpoint names match the view names as with @app.route."""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+def init_app(app):
+    """
+    Register the routes on an application.
+
+    Args:
+        app (Flask): Application created by create_app()
+    """
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+
+@route('/')
 def index():
     """
     Home page route - displays the landing page with features and call-to-action.
@@ -25,7 +62,7 @@ def index():
     """
     return render_template('index.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     """
     Handle user login - both GET (show form) and POST (process login).
@@ -40,11 +77,33 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        # Find user by username
-        user = User.query.filter_by(username=username).first()
+        # Accounts may be newer than the replicas
+        replica_router.use_primary()
+        
+        # Find user by username; names that just failed to match skip the query
+        user = None
+        if not login_miss_cache.get(username):
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                login_miss_cache.set(username, True)
         
         # Verify credentials
-        if user and user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except HashingBusy:
+            return hashing_busy()
+        
+        if valid:
+            # Store a hash with the current parameters while the password is at hand
+            if user.needs_rehash():
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except HashingBusy:
+                    pass  # Upgraded on a later login
+            
+            # Don't carry another account's chat token over
+            session.pop('chat_token', None)
             session['user_id'] = user.id
             session['username'] = user.username
             flash('Login successful!', 'success')
@@ -54,7 +113,7 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     """
     Handle user registration - creates new user account.
@@ -70,7 +129,8 @@ def register():
         email = request.form['email']
         password = request.form['password']
         
-        # Check if user already exists
+        # Check if user already exists (on the primary; replicas may lag)
+        replica_router.use_primary()
         if User.query.filter_by(username=username).first():
             flash('Username already exists', 'error')
             return render_template('login.html')
@@ -81,12 +141,16 @@ def register():
         
         # Create new user
         new_user = User(username=username, email=email)
-        new_user.set_password(password)
+        try:
+            new_user.set_password(password)
+        except HashingBusy:
+            return hashing_busy()
         
         db.session.add(new_user)
         db.session.commit()
         
         # Auto-login after registration
+        session.pop('chat_token', None)
         session['user_id'] = new_user.id
         session['username'] = new_user.username
         flash('Registration successful!', 'success')
@@ -94,7 +158,17 @@ def register():
     
     return render_template('login.html')
 
-@app.route('/logout')
+def hashing_busy():
+    """
+    Answer a login or registration shed because no password hash could run (see HashingBusy).
+    
+    Returns:
+        tuple: Login form with a 503 status and a Retry-After header
+    """
+    flash('We are busy right now, please try again in a moment', 'error')
+    return render_template('login.html'), 503, {'Retry-After': '1'}
+
+@route('/logout')
 def logout():
     """
     Handle user logout - clears session and redirects to home.
@@ -106,7 +180,7 @@ def logout():
     flash('You have been logged out', 'info')
     return redirect(url_for('index'))
 
-@app.route('/chat')
+@route('/chat')
 def chat():
     """
     Main chat interface route - displays chat UI with history and cart info.
@@ -119,39 +193,174 @@ def chat():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    # Create or get chat session for this user
+    # Issue a chat token; the ChatSession row is created by the first message
     session_token = session.get('chat_token')
     if not session_token:
-        # Generate new session token
-        session_token = str(uuid.uuid4())
+        session_token = chat_sessions.new_token()
         session['chat_token'] = session_token
-        
-        # Create new chat session in database
-        chat_session = ChatSession(
-            user_id=session['user_id'],
-            session_token=session_token
-        )
-        db.session.add(chat_session)
-        db.session.commit()
     
-    # Get existing chat history for this session
-    chat_session = ChatSession.query.filter_by(session_token=session_token).first()
-    if chat_session:
-        messages = ChatMessage.query.filter_by(session_id=chat_session.id).order_by(ChatMessage.timestamp).all()
+    # Read-your-writes: persist any buffered messages before reading history. This only
+    # covers this worker's buffer; see CHAT_WRITE_GROUP_COMMIT in message_queue.py
+    if chat_writer.enabled:
+        chat_writer.flush()
+    
+    # Get the most recent page of chat history; older pages load on scroll
+    chat_session_id = chat_sessions.resolve(session_token, session['user_id'])
+    if chat_session_id is not None:
+        messages, history_cursor = load_history_page(chat_session_id)
     else:
-        messages = []
+        messages, history_cursor = [], None
     
     # Get current cart items count for display
-    cart_count = CartItem.query.filter_by(user_id=session['user_id']).count()
+    cart_count = get_cached_cart_count(session['user_id'])
     
-    return render_template('chat.html', messages=messages, cart_count=cart_count)
+    return render_template('chat.html', messages=messages, cart_count=cart_count, history_cursor=history_cursor)
 
-@app.route('/api/chat', methods=['POST'])
+@route('/api/chat-history')
+def chat_history():
+    """
+    API endpoint returning one page of older chat history.
+    
+    Query parameters:
+        before: Cursor from the previous page (omit for the newest page)
+        limit: Page size, capped at CHAT_HISTORY_PAGE_SIZE
+    
+    Returns:
+        JSON with messages (oldest first) and next_cursor (None when exhausted)
+        401 if not authenticated, 400 for a malformed cursor
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    page_size = current_app.config["CHAT_HISTORY_PAGE_SIZE"]
+    limit = min(request.args.get('limit', page_size, type=int), page_size)
+    try:
+        before = decode_history_cursor(request.args.get('before'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    chat_session_id = chat_sessions.resolve(session.get('chat_token'), session['user_id'])
+    if chat_session_id is None:
+        return jsonify({'messages': [], 'next_cursor': None})
+    
+    # Read-your-writes for buffered messages, as in chat()
+    if chat_writer.enabled:
+        chat_writer.flush()
+    
+    messages, next_cursor = load_history_page(chat_session_id, before, max(limit, 1))
+    return jsonify({
+        'messages': [{
+            'id': m.id,
+            'message': m.message,
+            'sender': m.sender,
+            'time': m.timestamp.strftime('%H:%M')
+        } for m in messages],
+        'next_cursor': next_cursor
+    })
+
+@route('/api/chat-export')
+def chat_export():
+    """
+    Stream the user's whole chat history as JSON lines: archived messages
+    first (chat_retention), then those still in the database.
+    
+    Query parameters:
+        session_id: Only this ChatSession
+    
+    Returns:
+        application/x-ndjson response, one message per line
+        401 if not authenticated
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    if chat_writer.enabled:
+        chat_writer.flush()
+    
+    stream = export_chat_lines(session['user_id'], request.args.get('session_id', type=int))
+    return Response(stream_with_context(stream), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename="shopmate-chat-history.jsonl"'
+    })
+
+def export_chat_lines(user_id, chat_session_id=None, batch_size=1000):
+    """Yield archived, then live, messages of a user as JSON lines"""
+    for message in chat_retention.archive.read(user_id, chat_session_id):
+        yield json.dumps(dict(message, archived=True)) + '\n'
+    
+    sessions = ChatSession.query.with_entities(ChatSession.id).filter_by(user_id=user_id)
+    if chat_session_id is not None:
+        sessions = sessions.filter_by(id=chat_session_id)
+    for (live_session_id,) in sessions.order_by(ChatSession.id).all():
+        after_id = 0
+        while True:
+            rows = db.session.execute(
+                select(ChatMessage.id, ChatMessage.sender, ChatMessage.message, ChatMessage.timestamp)
+                .where(visible_messages(live_session_id), ChatMessage.id > after_id)
+                .order_by(ChatMessage.id).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            for m in rows:
+                yield json.dumps({
+                    'session_id': live_session_id,
+                    'id': m.id,
+                    'sender': m.sender,
+                    'message': m.message,
+                    'timestamp': m.timestamp.isoformat() if m.timestamp else None,
+                    'archived': False
+                }) + '\n'
+            after_id = rows[-1].id
+
+def load_history_page(chat_session_id, before=None, limit=None):
+    """
+    Load chat messages with keyset pagination on (timestamp, id).
+    
+    Args:
+        chat_session_id (int): ChatSession.id to read
+        before (tuple): (timestamp, id) of the oldest message already shown, or None
+        limit (int): Page size, defaults to CHAT_HISTORY_PAGE_SIZE
+        
+    Returns:
+        tuple: (messages oldest first, cursor for the next older page or None)
+    """
+    limit = limit or current_app.config["CHAT_HISTORY_PAGE_SIZE"]
+    query = ChatMessage.query.filter(visible_messages(chat_session_id))
+    if before:
+        query = query.filter(tuple_(ChatMessage.timestamp, ChatMessage.id) < tuple_(*before))
+    
+    # Fetch one extra row to learn whether an older page exists
+    rows = query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    messages = rows[:limit][::-1]
+    
+    next_cursor = None
+    if has_more:
+        oldest = messages[0]
+        next_cursor = f"{oldest.timestamp.isoformat()}_{oldest.id}"
+    return messages, next_cursor
+
+def decode_history_cursor(cursor):
+    """Parse a 'timestamp_id' history cursor; raises ValueError when malformed"""
+    if not cursor:
+        return None
+    timestamp, _, message_id = cursor.rpartition('_')
+    message_id = int(message_id)
+    if not 0 <= message_id < 2 ** 63:
+        # Beyond a BIGINT the driver raises instead of comparing
+        raise ValueError(f'Cursor id out of range: {message_id}')
+    return datetime.fromisoformat(timestamp), message_id
+
+@route('/api/chat', methods=['POST'])
 def api_chat():
     """
     API endpoint for processing chat messages.
     Handles user input, generates bot responses, and saves conversation history.
     
+    Request JSON:
+        message: The user's message
+        format: "compact" to get product replies as the intro line plus
+            product summaries, without the markdown cards
+    
     Returns:
         JSON response with user message, bot response, and timestamp
         401 if not authenticated, 400 if message is empty
@@ -165,32 +374,20 @@ def api_chat():
     if not user_message:
         return jsonify({'error': 'Empty message'}), 400
     
-    # Get current chat session
-    session_token = session.get('chat_token')
-    chat_session = ChatSession.query.filter_by(session_token=session_token).first()
+    # Get current chat session, creating it on the first message
+    chat_session_id = chat_sessions.resolve(session.get('chat_token'), session['user_id'], create=True)
     
-    if not chat_session:
+    if chat_session_id is None:
         return jsonify({'error': 'No chat session found'}), 400
     
-    # Save user message to database
-    user_msg = ChatMessage(
-        session_id=chat_session.id,
-        message=user_message,
-        sender='user'
-    )
-    db.session.add(user_msg)
-    
     # Process message and generate bot response using NLP logic
-    bot_response = process_chat_message(user_message, session['user_id'])
+    bot_response = process_chat_message(user_message, session['user_id'], chat_session_id)
+    
+    # Save both sides of the conversation turn
+    save_chat_turn(chat_session_id, user_message, bot_response['message'])
     
-    # Save bot response to database
-    bot_msg = ChatMessage(
-        session_id=chat_session.id,
-        message=bot_response['message'],
-        sender='bot'
-    )
-    db.session.add(bot_msg)
-    db.session.commit()
+    if data.get('format') == 'compact':
+        bot_response = compact_reply(bot_response)
     
     return jsonify({
         'user_message': user_message,
@@ -198,258 +395,561 @@ def api_chat():
         'timestamp': datetime.utcnow().isoformat()
     })
 
-def process_chat_message(message, user_id):
+@route('/api/chat/stream', methods=['POST'])
+def api_chat_stream():
+    """
+    Streaming variant of /api/chat using Server-Sent Events.
+    
+    Events, in order:
+        intent: {'type', 'message'} acknowledgement sent before any DB work
+        text: {'message'} intro line of a product reply
+        product: one per product, its summary plus the markdown 'card'
+        done: same payload as /api/chat
+    
+    The conversation turn is saved after the stream finishes.
+    
+    Returns:
+        text/event-stream response
+        401 if not authenticated, 400 if message is empty
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json()
+    user_message = data.get('message', '').strip()
+    
+    if not user_message:
+        return jsonify({'error': 'Empty message'}), 400
+    
+    # Get current chat session, creating it on the first message
+    chat_session_id = chat_sessions.resolve(session.get('chat_token'), session['user_id'], create=True)
+    
+    if chat_session_id is None:
+        return jsonify({'error': 'No chat session found'}), 400
+    
+    stream = stream_chat_reply(chat_session_id, user_message, session['user_id'])
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+    })
+
+def stream_chat_reply(chat_session_id, user_message, user_id):
+    """Generate the SSE events for one chat turn, then persist the turn"""
+    with span('classify'):
+        intent = classify(user_message)
+    yield sse_event('intent', {'type': intent.name, 'message': INTENT_ACKNOWLEDGEMENTS.get(intent.name, '')})
+    
+    bot_response = None
+    try:
+        bot_response = respond_to_intent(intent, user_id, chat_session_id)
+        if bot_response['type'] == 'products':
+            yield sse_event('text', {'message': bot_response['intro']})
+            for product in bot_response['products']:
+                yield sse_event('product', dict(product, card=product_card(product)))
+        
+        yield sse_event('done', {
+            'user_message': user_message,
+            'bot_response': bot_response,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    finally:
+        # Commit once the client has the whole reply (or has gone away)
+        if bot_response is not None:
+            save_chat_turn(chat_session_id, user_message, bot_response['message'])
+
+def sse_event(event, payload):
+    """Encode one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+# Shown by streaming clients while the reply is being prepared
+INTENT_ACKNOWLEDGEMENTS = {
+    'search': "🔎 Searching the catalog...",
+    'category': "📦 Browsing the category...",
+    'price': "💰 Filtering by price...",
+    'cart': "🛒 Checking your cart...",
+}
+
+def save_chat_turn(chat_session_id, user_message, bot_message):
+    """Persist a user message and the bot reply, through the write-behind queue when enabled"""
+    with span('persist'):
+        if chat_writer.enabled:
+            # Buffer both messages; the write-behind queue inserts them in batches
+            chat_writer.enqueue(chat_session_id, user_message, 'user')
+            chat_writer.enqueue(chat_session_id, bot_message, 'bot')
+            if chat_writer.group_commit:
+                # Other workers can't flush this buffer: commit before replying
+                chat_writer.flush()
+            return
+        
+        db.session.add(ChatMessage(session_id=chat_session_id, message=user_message, sender='user'))
+        db.session.add(ChatMessage(session_id=chat_session_id, message=bot_message, sender='bot'))
+        db.session.commit()
+
+def process_chat_message(message, user_id, chat_session_id=None):
     """Process user message and return appropriate bot response"""
-    message_lower = message.lower()
+    with span('classify'):
+        intent = classify(message)
+    return respond_to_intent(intent, user_id, chat_session_id)
+
+# Intents whose product replies follow-up filters can refine
+LISTING_INTENTS = ('search', 'category', 'price', 'default')
+
+def respond_to_intent(intent, user_id, chat_session_id=None):
+    """
+    Build the bot response for a classified message.
+    
+    Within a chat session, a message that only adds filters ("now under $50")
+    refines the session's last product listing (see conversation.py), and
+    every product listing is remembered for such follow-ups.
+    
+    Args:
+        intent (Intent): Result of intents.classify
+        user_id (int): ID of the user chatting
+        chat_session_id (int): ChatSession.id, or None to answer without context
+        
+    Returns:
+        dict: Bot response
+    """
+    if chat_session_id is None:
+        return answer_intent(intent, user_id)
+    
+    context = conversations.get(chat_session_id)
+    if context is not None and is_refinement(intent):
+        response = refine_listing(chat_session_id, context, intent.slots)
+        if response is not None:
+            return response
+    
+    response = answer_intent(intent, user_id)
+    if response['type'] == 'products' and intent.name in LISTING_INTENTS:
+        conversations.remember(chat_session_id, ConversationContext(
+            intent.name, intent.slots, [product['id'] for product in response['products']]))
+    return response
+
+def answer_intent(intent, user_id):
+    """Build the bot response for a classified message on its own"""
+    slots = intent.slots
     
     # Greeting patterns
-    if any(word in message_lower for word in ['hello', 'hi', 'hey', 'start']):
+    if intent.name == 'greeting':
         return {
             'message': "Hi there! 👋 Welcome to ShopMate AI! I'm here to help you find amazing products. You can try:\n\n• 'Show me electronics'\n• 'Find books under $20'\n• 'Search for headphones'\n• 'Show my cart'\n\nWhat are you looking for today?",
             'type': 'greeting'
         }
     
-    # Search patterns
-    if any(word in message_lower for word in ['show', 'find', 'search', 'looking', 'want']):
-        return search_products(message_lower, user_id)
-    
-    # Cart patterns
-    if any(word in message_lower for word in ['cart', 'basket', 'added']):
-        return show_cart(user_id)
-    
     # Add to cart patterns - handled via frontend addToCart function
-    if 'add to cart' in message_lower:
+    if intent.name == 'add_to_cart':
         return {
             'message': "I can help you add items to your cart! When I show you products, just click the 'Add to Cart' button on any item you like.",
             'type': 'help'
         }
     
+    # Cart patterns
+    if intent.name == 'cart':
+        return show_cart(user_id)
+    
     # Price filter patterns
-    if any(word in message_lower for word in ['under', 'below', 'less than', 'cheaper']):
-        return filter_by_price(message_lower, user_id)
+    if intent.name == 'price':
+        return filter_by_price(slots, user_id)
+    
+    # Search patterns
+    if intent.name == 'search':
+        return search_products(slots, user_id)
     
     # Category patterns
-    categories = ['electronics', 'books', 'textiles', 'clothing', 'accessories']
-    for category in categories:
-        if category in message_lower:
-            return get_products_by_category(category, user_id)
+    if intent.name == 'category':
+        return get_products_by_category(slots, user_id)
     
     # Help patterns
-    if any(word in message_lower for word in ['help', 'what can you do', 'commands']):
+    if intent.name == 'help':
         return {
             'message': "I can help you with:\n\n🛍️ **Product Search:**\n• 'Show me electronics'\n• 'Find books under $25'\n• 'Search for wireless headphones'\n\n🛒 **Shopping Cart:**\n• 'Show my cart'\n• 'Add [product] to cart'\n\n📊 **Filters & Sorting:**\n• 'Sort by price low to high'\n• 'Filter electronics under $100'\n\n💬 **Other Commands:**\n• 'Clear chat' - Start fresh\n• 'Help' - Show this menu\n\nJust tell me what you're looking for!",
             'type': 'help'
         }
     
+    # No trigger words: try meaning-based retrieval ("something to listen to music")
+    if slots['keywords'] and semantic_index is not None and semantic_index.ready:
+        with span('product_query'):
+            hits = semantic_index.search(' '.join(slots['keywords']), limit=6, min_score=current_app.config["SEMANTIC_MIN_SCORE"])
+            products = load_products_by_id([product_id for product_id, _ in hits])
+        if products:
+            return products_response("Here are some products that might be what you're after:", products)
+    
     # Default response
     return {
         'message': "I'm not sure I understand that. Try asking me to:\n• Show products by category\n• Search for specific items\n• Check your cart\n• Filter by price\n\nType 'help' for more options!",
         'type': 'default'
     }
 
-def search_products(query, user_id):
+def search_products(slots, user_id):
     """
-    Search products based on user query using keyword matching and category filters.
+    Search products based on the classified message using keyword matching and category filters.
     
     Args:
-        query (str): User's search query in lowercase
+        slots (dict): Slots extracted by intents.classify (category, keywords)
         user_id (int): ID of the user making the search
         
     Returns:
         dict: Response containing search results or error message
     """
-    # Extract search terms from the query
-    search_terms = re.findall(r'\b\w+\b', query)
-    
-    # Start with base query - get all products
-    products_query = Product.query
-    category_found = False
-    search_applied = False
-    
-    # Apply category filters first
-    for term in search_terms:
-        if term in ['electronics', 'electronic', 'tech', 'gadget', 'gadgets']:
-            products_query = products_query.filter(Product.category == 'Electronics')
-            category_found = True
-            search_applied = True
-            break
-        elif term in ['books', 'book', 'reading', 'novel', 'textbook']:
-            products_query = products_query.filter(Product.category == 'Books')
-            category_found = True
-            search_applied = True
-            break
-        elif term in ['textiles', 'textile', 'clothing', 'clothes', 'shirt', 'jacket', 'scarf']:
-            products_query = products_query.filter(Product.category == 'Textiles')
-            category_found = True
-            search_applied = True
-            break
-    
-    # If no category found, search by product title keywords
-    if not category_found:
-        title_conditions = []
-        for term in search_terms:
-            # Skip common words that don't help with product search
-            if term not in ['show', 'me', 'find', 'search', 'for', 'the', 'a', 'an', 'get', 'want', 'need', 'looking', 'some']:
-                title_conditions.append(Product.title.ilike(f'%{term}%'))
-                search_applied = True
+    # Category listings and unfiltered searches only depend on the catalog
+    cache_key = None
+    if slots['category'] or not slots['keywords']:
+        cache_key = ('search', slots['category'], slots['min_rating'], slots['in_stock'])
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            return cached
+    
+    with span('product_query'):
+        # Apply category filters first
+        if slots['category']:
+            products = filter_catalog(slots['category'], min_rating=slots['min_rating'], in_stock=slots['in_stock'])
         
-        # Apply title search conditions with OR logic
-        if title_conditions:
-            from sqlalchemy import or_
-            products_query = products_query.filter(or_(*title_conditions))
-    
-    # If no search terms applied, show random products
-    if not search_applied:
-        products = Product.query.limit(6).all()
-    else:
-        products = products_query.limit(6).all()
+        # If no category found, search by product keywords
+        elif slots['keywords']:
+            if product_index.ready:
+                # Ranked lookup in the in-memory indexes
+                products = load_products_by_id(rank_products(slots['keywords']))
+            else:
+                # Fall back to title substring matching with OR logic
+                products = Product.query.filter(or_(*[Product.title.ilike(f'%{term}%') for term in slots['keywords']])).limit(6).all()
+        
+        # If no search terms applied, show random products
+        else:
+            products = Product.query.limit(6).all()
     
     # Return results
     if products:
-        products_html = format_products_html(products)
-        return {
-            'message': f"Here are some great products I found for you:\n\n{products_html}",
-            'type': 'products',
-            'products': [{'id': p.id, 'title': p.title, 'price': p.price} for p in products]
-        }
+        response = products_response("Here are some great products I found for you:", products)
     else:
-        return {
+        response = {
             'message': "Sorry, I couldn't find any products matching your search. Try:\n• 'Show me electronics'\n• 'Find books'\n• 'Search for textiles'",
             'type': 'no_results'
         }
-
-def get_products_by_category(category, user_id):
-    """Get products by category"""
-    category_map = {
-        'electronics': 'Electronics',
-        'books': 'Books',
-        'textiles': 'Textiles',
-        'clothing': 'Textiles',
-        'accessories': 'Textiles'
-    }
     
-    db_category = category_map.get(category, category.title())
-    products = Product.query.filter_by(category=db_category).limit(6).all()
+    if cache_key is not None:
+        catalog_cache.set(cache_key, response)
+    return response
+
+def get_products_by_category(slots, user_id):
+    """Get products by category, best rated first"""
+    category = slots['category_term']
+    cache_key = ('category', category, slots['min_rating'], slots['in_stock'])
+    cached = catalog_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    db_category = CATEGORY_SYNONYMS.get(category, category.title())
+    with span('product_query'):
+        products = filter_catalog(db_category, min_rating=slots['min_rating'], in_stock=slots['in_stock'])
     
     if products:
-        products_html = format_products_html(products)
-        return {
-            'message': f"Here are some great {category} for you:\n\n{products_html}",
-            'type': 'products',
-            'products': [{'id': p.id, 'title': p.title, 'price': p.price} for p in products]
-        }
+        response = products_response(f"Here are some great {category} for you:", products)
     else:
-        return {
+        response = {
             'message': f"Sorry, no {category} available right now. Try browsing other categories!",
             'type': 'no_results'
         }
+    return catalog_cache.set(cache_key, response)
 
-def filter_by_price(query, user_id):
-    """Filter products by price"""
-    # Extract price from query
-    price_match = re.search(r'\$?(\d+)', query)
-    if price_match:
-        max_price = float(price_match.group(1))
-        products = Product.query.filter(Product.price <= max_price).limit(6).all()
+def filter_by_price(slots, user_id):
+    """Filter products by price, narrowed to the requested category if any"""
+    max_price = slots['max_price']
+    if max_price is not None:
+        cache_key = ('price', max_price, slots['category'], slots['category_term'], slots['min_rating'], slots['in_stock'])
+        cached = catalog_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        label = slots['category_term'] if slots['category'] else 'products'
+        with span('product_query'):
+            products = filter_catalog(slots['category'], max_price=max_price,
+                                      min_rating=slots['min_rating'], in_stock=slots['in_stock'])
         
         if products:
-            products_html = format_products_html(products)
-            return {
-                'message': f"Here are products under ${max_price}:\n\n{products_html}",
-                'type': 'products',
-                'products': [{'id': p.id, 'title': p.title, 'price': p.price} for p in products]
-            }
+            return catalog_cache.set(cache_key, products_response(f"Here are {label} under ${max_price}:", products))
     
     return {
         'message': "I couldn't understand the price range. Try: 'Show me products under $50'",
         'type': 'error'
     }
 
-def format_products_html(products):
-    """Format products for display in chat"""
-    html = ""
-    for product in products:
-        html += f"🛍️ **{product.title}**\n"
-        html += f"💰 ${product.price:.2f} | ⭐ {product.rating}/5\n"
-        html += f"📦 {product.category}\n"
-        html += f"[Add to Cart](javascript:addToCart({product.id}))\n\n"
-    return html
+def refine_listing(chat_session_id, context, slots, limit=6):
+    """
+    Answer a filter-only follow-up from the session's last listing.
+    
+    The listing's candidates are loaded on the first refinement and filtered
+    in memory from then on. A candidate set cut off at CONVERSATION_CANDIDATES
+    that leaves fewer than limit products falls back to a catalog query for
+    category listings.
+    
+    Args:
+        chat_session_id (int): ChatSession.id owning the context
+        context (ConversationContext): The session's last listing
+        slots (dict): Slots of the follow-up message
+        limit (int): Products shown
+        
+    Returns:
+        dict: Bot response, or None to answer the message on its own
+    """
+    merged = context.merge(slots)
+    with span('refine'):
+        if context.candidates is None:
+            context.candidates, context.complete = listing_candidates(context.intent, context.slots, conversations.max_candidates)
+        ids = refine(context.candidates, merged)
+    
+    with span('product_query'):
+        if len(ids) < limit and not context.complete and (merged['category'] or not merged['keywords']):
+            products = filter_catalog(merged['category'], merged['max_price'], merged['min_rating'], merged['in_stock'], limit)
+        else:
+            products = load_products_by_id(ids[:limit])
+    conversations.refinements += 1
+    conversations.remember(chat_session_id, context.refined(merged, [product.id for product in products]))
+    
+    if not products:
+        return {
+            'message': "None of those match. Try a higher price limit or a lower rating, or start a new search!",
+            'type': 'no_results'
+        }
+    return products_response(f"Here are {listing_label(merged)}:", products)
+
+def listing_label(slots):
+    """Describe a refined listing, e.g. "electronics under $50 rated 4+ in stock" """
+    if slots['category_term']:
+        label = slots['category_term']
+    elif slots['keywords']:
+        label = f"matches for '{' '.join(slots['keywords'])}'"
+    else:
+        label = 'products'
+    if slots['max_price'] is not None:
+        label += f" under ${slots['max_price']:g}"
+    if slots['min_rating'] is not None:
+        label += f" rated {slots['min_rating']:g}+"
+    if slots['in_stock']:
+        label += " in stock"
+    return label
+
+def listing_candidates(intent_name, slots, limit):
+    """
+    Load the candidates of a listing: the best products of its category or
+    search words, ignoring the price, rating and stock filters, which are
+    applied in memory.
+    
+    Args:
+        intent_name (str): Intent that produced the listing
+        slots (dict): Slots of the listing
+        limit (int): Maximum number of candidates
+        
+    Returns:
+        tuple: (list of Candidate rows best first, True if no product was cut off)
+    """
+    columns = (Product.id, Product.price, Product.rating, Product.stock)
+    if slots['category'] or not slots['keywords']:
+        if catalog_snapshot is not None and catalog_snapshot.ready:
+            ids = catalog_snapshot.filter(slots['category'], limit=limit)
+        else:
+            # One query for the ranking and the columns
+            query = select(*columns).order_by(Product.rating.desc().nulls_last(), Product.id).limit(limit)
+            if slots['category']:
+                query = query.where(Product.category == slots['category'])
+            rows = db.session.execute(query).all()
+            return [Candidate(*row) for row in rows], len(rows) < limit
+    elif intent_name == 'default' and semantic_index is not None and semantic_index.ready:
+        hits = semantic_index.search(' '.join(slots['keywords']), limit=limit, min_score=current_app.config["SEMANTIC_MIN_SCORE"])
+        ids = [product_id for product_id, _ in hits]
+    elif product_index.ready:
+        ids = rank_products(slots['keywords'], limit=limit)
+    else:
+        ids = [product.id for product in Product.query.filter(or_(*[Product.title.ilike(f'%{term}%') for term in slots['keywords']])).limit(limit)]
+    
+    # Cart holds change stock without patching the snapshot, so read it from the database then
+    if catalog_snapshot is not None and catalog_snapshot.ready and not stock_reservations.enabled:
+        rows = catalog_snapshot.rows(ids)
+    else:
+        by_id = {row.id: row for row in db.session.execute(select(*columns).where(Product.id.in_(ids)))}
+        rows = [by_id[product_id] for product_id in ids if product_id in by_id]
+    return [Candidate(*row) for row in rows], len(ids) < limit
+
+def filter_catalog(category=None, max_price=None, min_rating=None, in_stock=False, limit=6):
+    """
+    Find the best rated products matching every given filter.
+    
+    Uses the in-memory columnar snapshot when it is loaded and falls back to
+    an equivalent database query otherwise, and for stock filters while cart
+    holds keep the snapshot's stock stale. Both order by rating (highest
+    first, missing ratings last) and then by id.
+    
+    Args:
+        category (str): Product.category value, or None for all categories
+        max_price (float): Inclusive upper price bound
+        min_rating (float): Inclusive lower rating bound
+        in_stock (bool): Only products with stock left
+        limit (int): Maximum number of products
+        
+    Returns:
+        list: Product rows in result order
+    """
+    if catalog_snapshot is not None and catalog_snapshot.ready and not (in_stock and stock_reservations.enabled):
+        ids = catalog_snapshot.filter(category, max_price, min_rating, in_stock, limit=limit)
+        return load_products_by_id(ids)
+    
+    products_query = Product.query
+    if category is not None:
+        products_query = products_query.filter(Product.category == category)
+    if max_price is not None:
+        products_query = products_query.filter(Product.price <= max_price)
+    if min_rating is not None:
+        products_query = products_query.filter(Product.rating >= min_rating)
+    if in_stock:
+        products_query = products_query.filter(Product.stock > 0)
+    return products_query.order_by(Product.rating.desc().nulls_last(), Product.id).limit(limit).all()
+
+def rank_products(keywords, limit=6):
+    """
+    Rank products for a keyword search.
+    
+    BM25 keyword hits are blended with semantic nearest neighbours when the
+    semantic index is loaded, so related products without a shared word
+    still qualify.
+    
+    Args:
+        keywords (list): Search keywords
+        limit (int): Maximum number of ids
+        
+    Returns:
+        list: Product ids, best first
+    """
+    if semantic_index is None or not semantic_index.ready:
+        return product_index.search(keywords, limit=limit)
+    
+    keyword_hits = product_index.search_scores(keywords, limit=limit * 3)
+    semantic_hits = semantic_index.search(' '.join(keywords), limit=limit * 3)
+    return blend(keyword_hits, semantic_hits, current_app.config["SEMANTIC_SEARCH_WEIGHT"], limit)
+
+def load_products_by_id(product_ids):
+    """Load products in one query, keeping the order of product_ids"""
+    if not product_ids:
+        return []
+    by_id = {p.id: p for p in Product.query.filter(Product.id.in_(product_ids)).all()}
+    return [by_id[product_id] for product_id in product_ids if product_id in by_id]
+
+def products_response(intro, products):
+    """
+    Build a 'products' bot response.
+    
+    The message is the intro line, a blank line and then one markdown card per
+    product; cards come from the reply_templates card cache.
+    
+    Args:
+        intro (str): Single-line introduction
+        products (list): Product rows to show
+        
+    Returns:
+        dict: Response with message, intro, type and product summaries
+    """
+    with span('format'):
+        summaries = [product_summary(p) for p in products]
+        return {
+            'message': products_reply(intro, summaries),
+            'intro': intro,
+            'type': 'products',
+            'products': summaries
+        }
 
 def show_cart(user_id):
     """Show user's cart contents"""
-    cart_items = db.session.query(CartItem, Product).join(Product).filter(CartItem.user_id == user_id).all()
+    with span('cart_query'):
+        snapshot = cart_snapshot(user_id)
     
-    if not cart_items:
+    message = cart_reply(snapshot)
+    if not snapshot['items']:
         return {
-            'message': "Your cart is empty! 🛒\n\nStart shopping by asking me to show you products:\n• 'Show me electronics'\n• 'Find books'\n• 'Search for headphones'",
+            'message': message,
             'type': 'empty_cart'
         }
     
-    total = sum(item.CartItem.quantity * item.Product.price for item in cart_items)
-    cart_html = "🛒 **Your Cart:**\n\n"
-    
-    for item in cart_items:
-        cart_html += f"• {item.Product.title} x{item.CartItem.quantity} - ${item.Product.price * item.CartItem.quantity:.2f}\n"
-    
-    cart_html += f"\n💰 **Total: ${total:.2f}**\n\n"
-    cart_html += "Ready to checkout? Just let me know!"
-    
     return {
-        'message': cart_html,
+        'message': message,
         'type': 'cart',
-        'total': total
+        'total': snapshot['total']
     }
 
-@app.route('/api/add-to-cart', methods=['POST'])
+@route('/api/add-to-cart', methods=['POST'])
 def add_to_cart():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    data = request.get_json()
-    product_id = data.get('product_id')
-    quantity = data.get('quantity', 1)
-    
-    # Check if product exists
-    product = Product.query.get(product_id)
-    if not product:
-        return jsonify({'error': 'Product not found'}), 404
-    
-    # Check if item already in cart
-    existing_item = CartItem.query.filter_by(
-        user_id=session['user_id'],
-        product_id=product_id
-    ).first()
-    
-    if existing_item:
-        existing_item.quantity += quantity
-    else:
-        cart_item = CartItem(
-            user_id=session['user_id'],
-            product_id=product_id,
-            quantity=quantity
-        )
-        db.session.add(cart_item)
-    
-    db.session.commit()
+    data = request.get_json(silent=True) or {}
     
-    # Get updated cart count
-    cart_count = CartItem.query.filter_by(user_id=session['user_id']).count()
+    # A one-operation batch: upsert, stock check and count refresh in one transaction
+    try:
+        operations = parse_operations([{'op': 'add', 'product_id': data.get('product_id'), 'quantity': data.get('quantity', 1)}])
+        snapshot = apply_operations(session['user_id'], operations)
+    except CartError as error:
+        return jsonify(error.to_dict()), error.status
     
+    # The line can already be gone again (a concurrent removal or a lapsed hold)
+    title = next((item['title'] for item in snapshot['items'] if item['product_id'] == operations[0][1]), None)
     return jsonify({
         'success': True,
-        'message': f'{product.title} added to cart!',
-        'cart_count': cart_count
+        'message': f'{title} added to cart!' if title else 'Added to cart!',
+        'cart_count': snapshot['count']
     })
 
-@app.route('/api/cart-count')
+@route('/api/cart', methods=['GET', 'POST'])
+def cart():
+    """
+    Cart snapshot (GET) or a batch of cart operations (POST).
+    
+    POST body: {"operations": [{"op": "add"|"remove"|"set", "product_id": 1, "quantity": 2}, ...]}
+    All operations succeed or none is applied (404 unknown product, 409 not enough stock).
+    
+    Returns:
+        JSON cart snapshot: items, count (lines), quantity (units) and total
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    if request.method == 'GET':
+        return jsonify(cart_snapshot(session['user_id']))
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        operations = parse_operations(data.get('operations'), current_app.config["CART_MAX_OPERATIONS"])
+        snapshot = apply_operations(session['user_id'], operations)
+    except CartError as error:
+        return jsonify(error.to_dict()), error.status
+    
+    return jsonify({'success': True, 'cart': snapshot})
+
+@route('/api/cart-count')
 def get_cart_count():
     if 'user_id' not in session:
         return jsonify({'count': 0})
     
-    count = CartItem.query.filter_by(user_id=session['user_id']).count()
-    return jsonify({'count': count})
+    count = get_cached_cart_count(session['user_id'])
+    
+    # Polling clients revalidate with If-None-Match and get an empty 304 when nothing changed
+    response = jsonify({'count': count})
+    response.set_etag(cart_count_etag(session['user_id'], count))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def load_cart_count(user_id):
+    """Read the denormalized cart count with a primary-key lookup on User"""
+    return db.session.scalar(db.select(User.cart_count).where(User.id == user_id)) or 0
 
-@app.route('/api/clear-chat', methods=['POST'])
+def get_cached_cart_count(user_id):
+    """Return the number of cart items for a user, served from cart_cache when possible"""
+    count = cart_cache.get(user_id)
+    if count is None:
+        count = cart_cache.set(user_id, load_cart_count(user_id))
+    return count
+
+def cart_count_etag(user_id, count):
+    """Entity tag for a cart-count response; changes whenever the count does"""
+    return f'cart-{user_id}-{count}'
+
+@route('/api/clear-chat', methods=['POST'])
 def clear_chat():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
@@ -457,9 +957,14 @@ def clear_chat():
     # Clear current chat session messages
     session_token = session.get('chat_token')
     if session_token:
-        chat_session = ChatSession.query.filter_by(session_token=session_token).first()
-        if chat_session:
-            ChatMessage.query.filter_by(session_id=chat_session.id).delete()
-            db.session.commit()
+        # Flush buffered messages first so none of them survive the clear
+        if chat_writer.enabled:
+            chat_writer.flush()
+        
+        # Hide the history now; chat_retention deletes the rows in batches later
+        chat_session_id = chat_sessions.resolve(session_token, session['user_id'])
+        if chat_session_id is not None:
+            chat_retention.clear_session(chat_session_id)
+            conversations.forget(chat_session_id)
     
     return jsonify({'success': True})
@@ -0,0 +1,244 @@
+"""
+In-memory product search index for ShopMate AI
+
+This module keeps a tokenized inverted index over the product catalog:
+- Tokenizes Product.title, description and category (title weighted highest)
+- Ranks matches with Okapi BM25
+- Answers top-k queries with impact-ordered postings and early termination
+- Is built once at startup and patched through SQLAlchemy mapper events once
+  the change commits; other processes follow through catalog_sync.py
+"""
+
+import heapq
+import math
+import re
+import threading
+from sqlalchemy import event, select
+from app import db
+from models import Product
+from commit_hooks import on_commit
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Each occurrence in a field counts this many times towards the term frequency
+FIELD_WEIGHTS = (('title', 3), ('category', 2), ('description', 1))
+
+
+def tokenize(text):
+    """
+    Split text into lowercase index terms.
+
+    Plural forms are folded onto their singular ("headphones" -> "headphone")
+    so that the index matches the substring behaviour of the old ILIKE search.
+    Words of four letters or fewer are left alone ("this", "plus", "bags").
+
+    Args:
+        text (str): Raw text to tokenize
+
+    Returns:
+        list: Normalized tokens in order of appearance
+    """
+    tokens = []
+    for token in TOKEN_PATTERN.findall((text or '').lower()):
+        if len(token) > 4 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class ProductSearchIndex:
+    """
+    BM25-ranked inverted index mapping terms to product ids.
+
+    Postings store raw (field weighted) term frequencies. For every term a
+    list of documents sorted by their BM25 term weight is built lazily, which
+    lets search() stop as soon as no unseen document can beat the current
+    top-k (threshold algorithm), so popular terms cost a few dozen lookups
+    instead of a scan over the whole posting list.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ready = False
+        self._lock = threading.RLock()
+        self._postings = {}     # term -> {product_id: tf}
+        self._doc_terms = {}    # product_id -> {term: tf}
+        self._doc_lengths = {}  # product_id -> weighted token count
+        self._total_length = 0
+        self._avg_length = 1.0  # Frozen at build() so cached impacts stay consistent
+        self._impacts = {}      # term -> [(weight, product_id), ...] best first
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def build(self, rows):
+        """
+        Replace the index contents with the given catalog rows. The new
+        contents are built aside and swapped in, so searches keep using the
+        current ones meanwhile.
+
+        Args:
+            rows (iterable): (id, title, description, category) tuples
+        """
+        fresh = ProductSearchIndex(self.k1, self.b)
+        for product_id, title, description, category in rows:
+            fresh._add(product_id, title, description, category)
+        with self._lock:
+            self._postings, self._doc_terms, self._doc_lengths = fresh._postings, fresh._doc_terms, fresh._doc_lengths
+            self._total_length = fresh._total_length
+            self._avg_length = self._total_length / len(self._doc_lengths) if self._doc_lengths else 1.0
+            self._impacts = {}
+            self.ready = True
+
+    def add(self, product_id, title, description, category):
+        """Index a product, replacing any previous entry with the same id."""
+        with self._lock:
+            self._remove(product_id)
+            self._add(product_id, title, description, category)
+
+    def remove(self, product_id):
+        """Drop a product from the index if present."""
+        with self._lock:
+            self._remove(product_id)
+
+    def search(self, terms, limit=6):
+        """
+        Return the ids of the best matching products.
+
+        Args:
+            terms (list): Query keywords (any document matching one of them qualifies)
+            limit (int): Maximum number of ids to return
+
+        Returns:
+            list: Product ids ordered by descending BM25 score
+        """
+        return [product_id for product_id, _ in self.search_scores(terms, limit)]
+
+    def search_scores(self, terms, limit=6):
+        """
+        Like search(), but with the scores.
+
+        Returns:
+            list: (product_id, BM25 score) pairs, best first
+        """
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            query = {}
+            for term in terms:
+                for token in tokenize(term):
+                    postings = self._postings.get(token)
+                    if postings and token not in query:
+                        df = len(postings)
+                        query[token] = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            if not query:
+                return []
+
+            lists = [(idf, self._impact_list(term)) for term, idf in query.items()]
+            seen = set()
+            top = []  # Min-heap of (score, -product_id)
+            depth = 0
+            while True:
+                threshold = 0.0
+                advanced = False
+                for idf, impacts in lists:
+                    if depth >= len(impacts):
+                        continue
+                    weight, product_id = impacts[depth]
+                    threshold += idf * weight
+                    advanced = True
+                    if product_id in seen:
+                        continue
+                    seen.add(product_id)
+                    entry = (self._score(product_id, query), -product_id)
+                    if len(top) < limit:
+                        heapq.heappush(top, entry)
+                    elif entry > top[0]:
+                        heapq.heapreplace(top, entry)
+                if not advanced or (len(top) >= limit and top[0][0] >= threshold):
+                    break
+                depth += 1
+
+            return [(-neg_id, score) for score, neg_id in sorted(top, reverse=True)]
+
+    def _add(self, product_id, title, description, category):
+        fields = {'title': title, 'description': description, 'category': category}
+        terms = {}
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(fields[field]):
+                terms[token] = terms.get(token, 0) + weight
+        length = sum(terms.values())
+
+        self._doc_terms[product_id] = terms
+        self._doc_lengths[product_id] = length
+        self._total_length += length
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[product_id] = tf
+            self._impacts.pop(term, None)
+
+    def _remove(self, product_id):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_lengths.pop(product_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[product_id]
+            if not postings:
+                del self._postings[term]
+            self._impacts.pop(term, None)
+
+    def _term_weight(self, tf, length):
+        norm = self.k1 * (1 - self.b + self.b * length / self._avg_length)
+        return tf * (self.k1 + 1) / (tf + norm)
+
+    def _impact_list(self, term):
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            lengths = self._doc_lengths
+            impacts = sorted(
+                ((self._term_weight(tf, lengths[product_id]), product_id)
+                 for product_id, tf in self._postings[term].items()),
+                key=lambda item: (-item[0], item[1])
+            )
+            self._impacts[term] = impacts
+        return impacts
+
+    def _score(self, product_id, query):
+        terms = self._doc_terms[product_id]
+        length = self._doc_lengths[product_id]
+        score = 0.0
+        for term, idf in query.items():
+            tf = terms.get(term)
+            if tf:
+                score += idf * self._term_weight(tf, length)
+        return score
+
+
+# Process-wide index used by routes.search_products
+product_index = ProductSearchIndex()
+
+
+def build_product_index():
+    """
+    Load the whole catalog into product_index.
+    Must be called inside an application context.
+    """
+    rows = db.session.execute(
+        select(Product.id, Product.title, Product.description, Product.category)
+        .execution_options(yield_per=10000)
+    )
+    product_index.build(rows)
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+def _index_product(mapper, connection, target):
+    """Keep the index in sync when products are created or edited."""
+    on_commit(target, product_index.add, target.id, target.title, target.description, target.category)
+
+
+@event.listens_for(Product, 'after_delete')
+def _unindex_product(mapper, connection, target):
+    """Remove deleted products from the index."""
+    on_commit(target, product_index.remove, target.id)
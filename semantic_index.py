@@ -0,0 +1,542 @@
+"""
+Semantic product search for ShopMate AI
+
+Keyword search only finds products that share words with the query. This
+module adds a meaning-based retrieval path that runs on the CPU with NumPy:
+- Products and queries are embedded as signed hashed TF-IDF vectors over their
+  tokens plus related terms from a small shopping concept lexicon, so
+  "something to listen to music" lands near headphones and speakers
+- Vectors live in a float32 matrix memory-mapped from SEMANTIC_INDEX_PATH
+- Approximate nearest-neighbour search uses an inverted file (IVF): spherical
+  k-means centroids partition the catalog and a query only scans the nprobe
+  closest partitions; small catalogs are scanned exactly
+- blend() merges semantic hits with BM25 keyword scores
+
+Products changed after the build are kept in a small exactly-scanned delta
+through SQLAlchemy mapper events once the change commits; other processes
+follow through catalog_sync.py, and bulk imports rebuild the index everywhere.
+Only edits to the title, description or category are embedded again. Once
+the delta outgrows DELTA_COMPACT_SIZE (or a tenth of the catalog) it is
+folded into the main matrix and assigned to the existing partitions.
+
+Enabled with app.config["SEMANTIC_SEARCH_ENABLED"] when NumPy is installed
+(the "numpy" extra).
+"""
+
+import math
+import os
+import threading
+import zlib
+from sqlalchemy import event, select, inspect
+from app import db
+from models import Product
+from search_index import tokenize
+from commit_hooks import on_commit
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency
+    np = None
+
+# Shopping concepts mapped to catalog vocabulary. A word on the left also
+# contributes the words on the right at CONCEPT_WEIGHT.
+CONCEPTS = {
+    'music': ['headphones', 'speaker', 'earbuds', 'audio', 'bluetooth'],
+    'listen': ['headphones', 'speaker', 'earbuds', 'audio'],
+    'song': ['headphones', 'speaker', 'audio'],
+    'audio': ['headphones', 'speaker', 'earbuds'],
+    'sound': ['headphones', 'speaker', 'audio'],
+    'podcast': ['headphones', 'earbuds', 'microphone'],
+    'call': ['microphone', 'webcam'],
+    'meeting': ['webcam', 'microphone', 'headphones'],
+    'video': ['webcam', 'camera', 'monitor'],
+    'photo': ['camera', 'webcam'],
+    'picture': ['camera', 'webcam'],
+    'charge': ['charger', 'usb', 'battery', 'power'],
+    'battery': ['charger', 'power'],
+    'phone': ['charger', 'usb', 'earbuds'],
+    'desk': ['laptop', 'stand', 'keyboard', 'monitor', 'mouse'],
+    'laptop': ['stand', 'charger', 'mouse', 'keyboard'],
+    'typing': ['keyboard'],
+    'game': ['gaming', 'mouse', 'keyboard', 'headphones'],
+    'play': ['gaming', 'mouse', 'keyboard'],
+    'time': ['watch', 'smart'],
+    'fitness': ['watch', 'athletic', 'shorts'],
+    'workout': ['athletic', 'shorts', 'watch'],
+    'gym': ['athletic', 'shorts', 'shirt'],
+    'run': ['athletic', 'shorts', 'watch'],
+    'runner': ['athletic', 'shorts', 'watch'],
+    'running': ['athletic', 'shorts', 'watch'],
+    'exercise': ['athletic', 'shorts', 'watch'],
+    'read': ['book', 'novel', 'guide', 'handbook'],
+    'learn': ['book', 'guide', 'handbook', 'textbook', 'fundamentals'],
+    'study': ['book', 'textbook', 'handbook', 'guide'],
+    'code': ['programming', 'development', 'python', 'book'],
+    'coding': ['programming', 'development', 'python', 'book'],
+    'software': ['programming', 'development', 'book'],
+    'data': ['science', 'machine', 'learning', 'handbook'],
+    'ai': ['machine', 'learning', 'book'],
+    'cook': ['cookbook'],
+    'cooking': ['cookbook'],
+    'wear': ['shirt', 'jacket', 'scarf', 'shorts', 'hoodie'],
+    'outfit': ['shirt', 'jacket', 'denim', 'dress'],
+    'cold': ['scarf', 'jacket', 'wool', 'winter', 'sweater'],
+    'warm': ['scarf', 'jacket', 'wool', 'sweater', 'hoodie'],
+    'winter': ['scarf', 'jacket', 'wool', 'sweater'],
+    'summer': ['shorts', 'cotton', 'linen', 'shirt'],
+    'gift': ['watch', 'scarf', 'book', 'headphones'],
+}
+CONCEPT_WEIGHT = 0.6
+
+# Function words (and, in expand_terms, bare numbers) carry no product meaning
+STOP_WORDS = frozenset(['a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'i', 'in', 'is', 'it',
+                        'me', 'my', 'of', 'on', 'or', 'something', 'some', 'that', 'the', 'this', 'to',
+                        'want', 'need', 'with', 'you', 'your', 'all', 'any', 'perfect', 'great'])
+
+# Each occurrence in a field counts this many times towards the term frequency
+FIELD_WEIGHTS = (('title', 2.0), ('category', 1.0), ('description', 1.0))
+
+EXACT_SEARCH_LIMIT = 20000  # Catalogs up to this size are scanned without IVF
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE_PER_LIST = 64
+BUILD_BATCH = 10000
+DELTA_COMPACT_SIZE = 1000  # Delta entries (at least) before they are folded into the main matrix
+
+# Attributes replaced together when a new build is swapped in
+STATE = ('_idf', '_default_idf', '_ids', '_vectors', '_alive', '_rows', '_centroids', '_list_offsets',
+         '_list_rows', '_delta', '_delta_matrix')
+
+
+def _normalize_concepts(concepts):
+    # Concepts are matched against tokenize() output, so fold both sides the same way
+    normalized = {}
+    for word, related in concepts.items():
+        for key in tokenize(word):
+            normalized.setdefault(key, []).extend(token for term in related for token in tokenize(term))
+    return normalized
+
+
+CONCEPT_TOKENS = _normalize_concepts(CONCEPTS)
+
+
+def expand_terms(text, weight=1.0):
+    """
+    Tokenize text and add related concept terms.
+
+    Args:
+        text (str): Raw text
+        weight (float): Weight of each direct token
+
+    Returns:
+        dict: term -> weighted count
+    """
+    terms = {}
+    for token in tokenize(text):
+        if token in STOP_WORDS or token.isdigit():
+            continue
+        terms[token] = terms.get(token, 0.0) + weight
+        for related in CONCEPT_TOKENS.get(token, ()):
+            terms[related] = terms.get(related, 0.0) + weight * CONCEPT_WEIGHT
+    return terms
+
+
+def product_terms(title, description, category):
+    """Weighted, concept-expanded terms of a product."""
+    terms = {}
+    fields = {'title': title, 'description': description, 'category': category}
+    for field, weight in FIELD_WEIGHTS:
+        for term, count in expand_terms(fields[field], weight).items():
+            terms[term] = terms.get(term, 0.0) + count
+    return terms
+
+
+class SemanticProductIndex:
+    """
+    Hashed TF-IDF embeddings with an IVF approximate nearest-neighbour index.
+
+    Args:
+        dimensions (int): Embedding width (hash buckets)
+        nprobe (int): IVF partitions scanned per query
+        path (str): File backing the vector matrix; None keeps it in memory
+    """
+
+    def __init__(self, dimensions=256, nprobe=12, path=None):
+        self.dimensions = dimensions
+        self.nprobe = nprobe
+        self.path = path
+        self.ready = False
+        self._lock = threading.RLock()
+        self._compacting = threading.Lock()
+        self._buckets = {}    # term -> (bucket, sign)
+        self._idf = {}        # term -> idf, frozen at build()
+        self._default_idf = 1.0
+        self._generation = 0  # Bumped by every change, so compact() can tell it was overtaken
+        self._reset()
+
+    def _reset(self):
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._vectors = np.zeros((0, self.dimensions), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows = {}            # product_id -> row in _vectors
+        self._centroids = None     # (n_lists, dimensions) or None for exact search
+        self._list_offsets = None  # Row order grouped by partition, with offsets
+        self._list_rows = None
+        self._delta = {}           # product_id -> vector added or changed since build()
+        self._delta_matrix = None  # (ids, stacked vectors) of _delta, built on the next search
+
+    def __len__(self):
+        return len(self._rows) + len(self._delta)
+
+    def configure(self, dimensions=None, nprobe=None, path=None):
+        """Change settings; dimensions and path take effect at the next build()."""
+        with self._lock:
+            if dimensions and dimensions != self.dimensions:
+                self.dimensions = dimensions
+                self._buckets.clear()
+            self.nprobe = nprobe or self.nprobe
+            self.path = path or None
+
+    def build(self, documents):
+        """
+        Replace the index contents.
+
+        Args:
+            documents (callable): Returns a fresh iterable of
+                (id, title, description, category) tuples; called twice,
+                once for document frequencies and once for vectors
+        """
+        document_count = 0
+        frequencies = {}
+        for _, title, description, category in documents():
+            document_count += 1
+            for term in product_terms(title, description, category):
+                frequencies[term] = frequencies.get(term, 0) + 1
+
+        idf = {term: math.log((document_count + 1) / (df + 1)) + 1 for term, df in frequencies.items()}
+
+        # Embed into a new index and swap it in, so queries keep using the current one meanwhile
+        fresh = SemanticProductIndex(self.dimensions, self.nprobe, self.path)
+        fresh._buckets = self._buckets
+        fresh._idf, fresh._default_idf = idf, math.log(document_count + 1) + 1
+        ids = np.zeros(document_count, dtype=np.int64)
+        vectors = fresh._allocate(document_count)
+        row = 0
+        batch_ids, batch_terms = [], []
+        for product_id, title, description, category in documents():
+            batch_ids.append(product_id)
+            batch_terms.append(product_terms(title, description, category))
+            if len(batch_ids) == BUILD_BATCH:
+                vectors[row:row + len(batch_ids)] = fresh._embed_many(batch_terms)
+                ids[row:row + len(batch_ids)] = batch_ids
+                row += len(batch_ids)
+                batch_ids, batch_terms = [], []
+        if batch_ids:
+            vectors[row:row + len(batch_ids)] = fresh._embed_many(batch_terms)
+            ids[row:row + len(batch_ids)] = batch_ids
+            row += len(batch_ids)
+
+        fresh._ids = ids[:row]
+        fresh._vectors = fresh._persist(vectors[:row])
+        fresh._alive = np.ones(row, dtype=bool)
+        fresh._rows = {int(product_id): position for position, product_id in enumerate(fresh._ids)}
+        if row > EXACT_SEARCH_LIMIT:
+            fresh._train_partitions()
+
+        with self._lock:
+            for name in STATE:
+                setattr(self, name, getattr(fresh, name))
+            self._generation += 1
+            self.ready = True
+
+    def add(self, product_id, title, description, category):
+        """Index or re-index a product in the delta; an unchanged embedding is left in place."""
+        vector = self._embed_many([product_terms(title, description, category)])[0]
+        with self._lock:
+            current = self._delta.get(product_id)
+            if current is None and product_id in self._rows:
+                current = self._vectors[self._rows[product_id]]
+            if current is not None and np.allclose(current, vector, atol=1e-6):
+                return
+            self._tombstone(product_id)
+            self._delta[product_id] = vector
+            self._delta_changed()
+            compact = len(self._delta) > max(DELTA_COMPACT_SIZE, len(self._rows) // 10)
+        if compact:
+            self.compact()
+
+    def remove(self, product_id):
+        """Drop a product if present."""
+        with self._lock:
+            self._tombstone(product_id)
+            if self._delta.pop(product_id, None) is not None:
+                self._delta_changed()
+
+    def compact(self):
+        """
+        Fold the delta into the main matrix and drop deleted rows. The new
+        matrix is assembled outside the lock; if the index changed meanwhile
+        the result is discarded and the next add() tries again.
+
+        Returns:
+            bool: True if the compacted matrix was swapped in
+        """
+        # One compaction at a time; the others' adds stay in the delta meanwhile
+        if not self._compacting.acquire(blocking=False):
+            return False
+        try:
+            return self._compact()
+        finally:
+            self._compacting.release()
+
+    def _compact(self):
+        with self._lock:
+            generation = self._generation
+            ids, vectors, alive, centroids = self._ids, self._vectors, self._alive, self._centroids
+            delta_ids, delta_vectors = self._stacked_delta()
+
+        live = np.flatnonzero(alive)
+        ids = np.concatenate([ids[live], delta_ids])
+        vectors = self._persist(np.concatenate([vectors[live], delta_vectors]))
+        partitions = (None, None) if centroids is None else self._assign(vectors, centroids)
+
+        with self._lock:
+            if generation != self._generation:
+                return False
+            self._ids, self._vectors = ids, vectors
+            self._alive = np.ones(len(ids), dtype=bool)
+            self._rows = {int(product_id): position for position, product_id in enumerate(ids)}
+            self._list_rows, self._list_offsets = partitions
+            self._delta = {}
+            self._delta_changed()
+            return True
+
+    def embed(self, text):
+        """Embed a query as a unit-length float32 vector."""
+        return self._embed_many([expand_terms(text)], known_only=True)[0]
+
+    def search(self, text, limit=6, min_score=0.0):
+        """
+        Return the products closest in meaning to text.
+
+        Args:
+            text (str): Query
+            limit (int): Maximum number of hits
+            min_score (float): Cosine similarity a hit must reach
+
+        Returns:
+            list: (product_id, similarity) pairs, best first
+        """
+        return self.search_batch([text], limit, min_score)[0]
+
+    def search_batch(self, texts, limit=6, min_score=0.0):
+        """
+        Answer several queries with one centroid scoring pass.
+
+        Returns:
+            list: One search() result per query
+        """
+        queries = self._embed_many([expand_terms(text) for text in texts], known_only=True)
+        with self._lock:
+            probes = None
+            if self._centroids is not None:
+                centroid_scores = queries @ self._centroids.T
+                nprobe = min(self.nprobe, len(self._centroids))
+                probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+            delta_ids, delta_vectors = self._stacked_delta()
+
+            results = []
+            for number, query in enumerate(queries):
+                if probes is None:
+                    rows = np.flatnonzero(self._alive)
+                else:
+                    rows = np.concatenate([
+                        self._list_rows[self._list_offsets[partition]:self._list_offsets[partition + 1]]
+                        for partition in probes[number]
+                    ])
+                    rows = rows[self._alive[rows]]
+                ids = np.concatenate([self._ids[rows], delta_ids])
+                scores = np.concatenate([self._vectors[rows] @ query, delta_vectors @ query])
+                results.append(self._top(ids, scores, limit, min_score))
+            return results
+
+    def _top(self, ids, scores, limit, min_score):
+        keep = scores > min_score
+        ids, scores = ids[keep], scores[keep]
+        if len(scores) > limit:
+            best = np.argpartition(-scores, limit - 1)[:limit]
+            ids, scores = ids[best], scores[best]
+        order = np.lexsort((ids, -scores))
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def _tombstone(self, product_id):
+        row = self._rows.pop(product_id, None)
+        if row is not None:
+            self._alive[row] = False
+            self._generation += 1
+
+    def _delta_changed(self):
+        # Caller holds _lock
+        self._delta_matrix = None
+        self._generation += 1
+
+    def _stacked_delta(self):
+        # Caller holds _lock. Stacked once per delta change instead of on every query
+        if self._delta_matrix is None:
+            self._delta_matrix = (
+                np.fromiter(self._delta.keys(), dtype=np.int64, count=len(self._delta)),
+                np.array(list(self._delta.values()), dtype=np.float32).reshape(-1, self.dimensions),
+            )
+        return self._delta_matrix
+
+    def _bucket(self, term):
+        bucket = self._buckets.get(term)
+        if bucket is None:
+            digest = zlib.crc32(term.encode('utf-8'))
+            bucket = self._buckets[term] = (digest % self.dimensions, 1.0 if digest & 0x80000000 else -1.0)
+        return bucket
+
+    def _embed_many(self, term_maps, known_only=False):
+        # Query terms absent from the catalog could only match through hash collisions
+        vectors = np.zeros((len(term_maps), self.dimensions), dtype=np.float32)
+        for row, terms in enumerate(term_maps):
+            vector = vectors[row]
+            for term, count in terms.items():
+                idf = self._idf.get(term)
+                if idf is None:
+                    if known_only:
+                        continue
+                    idf = self._default_idf
+                bucket, sign = self._bucket(term)
+                # Sublinear tf, idf from the build
+                vector[bucket] += sign * (1 + math.log(count) if count >= 1 else count) * idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _allocate(self, rows):
+        return np.zeros((rows, self.dimensions), dtype=np.float32)
+
+    def _persist(self, vectors):
+        """Write the matrix to self.path and return a read-only memory map of it."""
+        if not self.path:
+            return vectors
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as handle:
+            np.save(handle, vectors)
+        # Atomic swap; maps opened by other workers keep the old file alive
+        os.replace(temporary, self.path)
+        return np.load(self.path, mmap_mode='r')
+
+    def _train_partitions(self):
+        """Spherical k-means on a sample, then assign every row to its closest centroid."""
+        count = len(self._ids)
+        n_lists = max(16, int(math.sqrt(count)))
+        rng = np.random.default_rng(0)
+        sample = self._vectors[np.sort(rng.choice(count, min(count, n_lists * KMEANS_SAMPLE_PER_LIST), replace=False))]
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            # Re-seed empty partitions from random sample rows
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            norms[empty] = 1.0
+            centroids = sums / norms
+
+        self._centroids = centroids.astype(np.float32)
+        self._list_rows, self._list_offsets = self._assign(self._vectors, self._centroids)
+
+    def _assign(self, vectors, centroids):
+        """Group rows by their closest centroid; returns (row order, partition offsets)."""
+        assignment = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), BUILD_BATCH * 5):
+            block = vectors[start:start + BUILD_BATCH * 5]
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        list_rows = np.argsort(assignment, kind='stable')
+        return list_rows, np.searchsorted(assignment[list_rows], np.arange(len(centroids) + 1))
+
+
+def blend(keyword_hits, semantic_hits, weight, limit=6):
+    """
+    Merge keyword and semantic rankings.
+
+    BM25 scores are scaled by the best keyword score so both inputs lie in
+    [0, 1]; each product's blended score is (1 - weight) * keyword + weight * semantic.
+
+    Args:
+        keyword_hits (list): (product_id, BM25 score) pairs, best first
+        semantic_hits (list): (product_id, cosine similarity) pairs
+        weight (float): Share of the semantic score, 0 to 1
+        limit (int): Maximum number of ids
+
+    Returns:
+        list: Product ids, best first
+    """
+    scores = {}
+    if keyword_hits:
+        best = keyword_hits[0][1] or 1.0
+        for product_id, score in keyword_hits:
+            scores[product_id] = (1 - weight) * score / best
+    for product_id, score in semantic_hits:
+        scores[product_id] = scores.get(product_id, 0.0) + weight * score
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return [product_id for product_id, _ in ranked[:limit]]
+
+
+# Process-wide index used by routes.rank_products
+semantic_index = SemanticProductIndex() if np is not None else None
+
+
+def build_semantic_index():
+    """
+    Embed the whole catalog into semantic_index.
+    Must be called inside an application context.
+    """
+    if semantic_index is None:
+        return
+
+    def documents():
+        return db.session.execute(
+            select(Product.id, Product.title, Product.description, Product.category)
+            .execution_options(yield_per=10000)
+        )
+
+    semantic_index.build(documents)
+
+
+def init_app(app):
+    """
+    Configure and build the index if SEMANTIC_SEARCH_ENABLED is set and NumPy is available.
+    Must be called inside an application context.
+
+    Args:
+        app (Flask): Application providing SEMANTIC_* settings
+    """
+    if semantic_index is None or not app.config.get("SEMANTIC_SEARCH_ENABLED", True):
+        return
+    semantic_index.configure(app.config.get("SEMANTIC_DIMENSIONS"), app.config.get("SEMANTIC_NPROBE"),
+                             app.config.get("SEMANTIC_INDEX_PATH"))
+    build_semantic_index()
+
+
+@event.listens_for(Product, 'after_insert')
+@event.listens_for(Product, 'after_update')
+def _embed_product(mapper, connection, target):
+    """Keep the index in sync when products are created, renamed or re-described."""
+    if semantic_index is None or not semantic_index.ready:
+        return
+    attributes = inspect(target).attrs
+    # Price, stock and rating edits don't change the embedding
+    if not any(attributes[name].history.has_changes() for name in ('title', 'description', 'category')):
+        return
+    on_commit(target, semantic_index.add, target.id, target.title, target.description, target.category)
+
+
+@event.listens_for(Product, 'after_delete')
+def _unembed_product(mapper, connection, target):
+    """Remove deleted products from the index."""
+    if semantic_index is not None and semantic_index.ready:
+        on_commit(target, semantic_index.remove, target.id)
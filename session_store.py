@@ -0,0 +1,206 @@
+"""
+Server-side chat session store for ShopMate AI
+
+Maps the chat token kept in the signed session cookie to its ChatSession so
+chat calls don't need a database lookup to find their session:
+- Entries ({'id', 'user_id'}) are kept in the "chat_session" Cache namespace
+  and use the configured cache backend, so they live in a process-local LRU
+  or in the SQLite/Redis store shared by all workers
+- ChatSession rows are created lazily by the first message of a
+  conversation. Opening the chat page only issues a token
+- Writes (resolve(create=True)) check a cached id against the database: the
+  sweep only drops the entries of the worker that ran it, so with the
+  "memory" backend the others may still map a token to a deleted session
+- A background thread deletes sessions idle for longer than
+  CHAT_SESSION_MAX_IDLE together with their messages, in batches, after
+  chat_retention has archived the messages
+"""
+
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete, exists, insert
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import ChatSession, ChatMessage
+from cache import Cache
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSessionStore:
+    """
+    Token -> ChatSession id lookups backed by the cache layer, plus the
+    idle-session sweep. Configured by init_app().
+    """
+
+    def __init__(self):
+        self.cache = Cache('chat_session', ttl=3600)
+        self.max_idle = timedelta(days=30)
+        self.sweep_interval = 3600.0
+        self.sweep_batch_size = 500
+        self.swept = 0
+        self._app = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        """
+        Configure TTL, idle limit and sweep schedule from app.config.
+
+        Args:
+            app (Flask): Application providing CHAT_SESSION_* settings
+        """
+        self._app = app
+        self.cache.ttl = app.config.get("CHAT_SESSION_CACHE_TTL", self.cache.ttl)
+        self.max_idle = timedelta(seconds=app.config.get("CHAT_SESSION_MAX_IDLE", self.max_idle.total_seconds()))
+        self.sweep_interval = app.config.get("CHAT_SESSION_SWEEP_INTERVAL", self.sweep_interval)
+        self.sweep_batch_size = app.config.get("CHAT_SESSION_SWEEP_BATCH_SIZE", self.sweep_batch_size)
+
+    @staticmethod
+    def new_token():
+        """Return a fresh chat token for the session cookie."""
+        return str(uuid.uuid4())
+
+    def get(self, token, user_id):
+        """
+        Look up a cached session id without touching the database.
+
+        Returns:
+            int: ChatSession.id, or None on a miss or when the token belongs to another user
+        """
+        self._ensure_sweeper()
+        entry = self.cache.get(token) if token else None
+        if entry is None or entry['user_id'] != user_id:
+            return None
+        return entry['id']
+
+    def remember(self, token, chat_session_id, user_id):
+        """Cache the session id of a token."""
+        self.cache.set(token, {'id': chat_session_id, 'user_id': user_id})
+
+    def forget(self, token):
+        """Drop the cached entry of a token."""
+        self.cache.delete(token)
+
+    def resolve(self, token, user_id, create=False):
+        """
+        Return the ChatSession id for a token, reading the database only on a cache miss.
+
+        With create=True the caller is about to write messages, so a cached id
+        is checked to still exist; a swept session is created again.
+
+        Args:
+            token (str): Chat token from the session cookie
+            user_id (int): Logged-in user; tokens of other users resolve to None
+            create (bool): Insert the ChatSession row if it doesn't exist yet
+
+        Returns:
+            int: ChatSession.id, or None if there is none (and create is False)
+        """
+        if not token:
+            return None
+        chat_session_id = self.get(token, user_id)
+        if chat_session_id is not None:
+            if not create or db.session.scalar(select(ChatSession.id).filter_by(id=chat_session_id)) is not None:
+                return chat_session_id
+            # Swept by another worker after this one cached it
+            self.forget(token)
+
+        row = db.session.execute(
+            select(ChatSession.id, ChatSession.user_id).filter_by(session_token=token)
+        ).first()
+        if row is None and create:
+            try:
+                db.session.execute(insert(ChatSession).values(
+                    user_id=user_id, session_token=token, created_at=datetime.utcnow()))
+                db.session.commit()
+            except IntegrityError:
+                # A concurrent request created it first
+                db.session.rollback()
+            row = db.session.execute(
+                select(ChatSession.id, ChatSession.user_id).filter_by(session_token=token)
+            ).first()
+        if row is None or row.user_id != user_id:
+            return None
+
+        self.remember(token, row.id, user_id)
+        return row.id
+
+    def sweep(self, now=None):
+        """
+        Delete sessions with no message since CHAT_SESSION_MAX_IDLE ago.
+
+        Works in batches of sweep_batch_size sessions, one transaction each.
+        Messages are archived first (chat_retention) and the sessions' cache
+        entries are dropped. Requires an app context.
+
+        Returns:
+            int: Number of sessions deleted
+        """
+        from message_queue import chat_writer
+        from chat_retention import chat_retention
+        if chat_writer.enabled:
+            # Buffered messages count as activity
+            chat_writer.flush()
+
+        cutoff = (now or datetime.utcnow()) - self.max_idle
+        recent_message = exists().where(ChatMessage.session_id == ChatSession.id, ChatMessage.timestamp >= cutoff)
+        deleted = 0
+        with chat_retention.exclusive() as acquired:
+            # Another worker is sweeping or archiving; its pass covers these sessions
+            if not acquired:
+                return 0
+            while True:
+                rows = db.session.execute(
+                    select(ChatSession.id, ChatSession.session_token)
+                    .where(ChatSession.created_at < cutoff, ~recent_message)
+                    .limit(self.sweep_batch_size)
+                ).all()
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                chat_retention.archive_sessions(ids)
+                db.session.execute(delete(ChatMessage).where(ChatMessage.session_id.in_(ids)))
+                db.session.execute(delete(ChatSession).where(ChatSession.id.in_(ids)))
+                db.session.commit()
+                for row in rows:
+                    self.forget(row.session_token)
+                deleted += len(rows)
+                if len(rows) < self.sweep_batch_size:
+                    break
+        self.swept += deleted
+        return deleted
+
+    def close(self):
+        """Stop the sweep thread."""
+        self._stopped.set()
+
+    def _ensure_sweeper(self):
+        # Threads don't survive fork, so start one lazily in every worker process
+        if self._app is None or self.sweep_interval <= 0 or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='chat-session-sweeper', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.sweep_interval):
+            try:
+                with self._app.app_context():
+                    deleted = self.sweep()
+                if deleted:
+                    logger.info('Swept %d idle chat sessions', deleted)
+            except Exception:
+                logger.exception('Chat session sweep failed')
+
+
+# Process-wide store used by the chat routes and the ASGI API
+chat_sessions = ChatSessionStore()
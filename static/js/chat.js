@@ -5,6 +5,8 @@ let messageInput;
 let sendButton;
 let typingIndicator;
 let isProcessing = false;
+let historyCursor = null;
+let isLoadingHistory = false;
 
 // Initialize chat functionality
 function initializeChat() {
@@ -14,12 +16,22 @@ function initializeChat() {
     sendButton = document.getElementById('sendBtn');
     typingIndicator = document.getElementById('typingIndicator');
     
+    // Cursor for the next page of older messages (empty when all are shown)
+    historyCursor = chatContainer.dataset.historyCursor || null;
+    
     // Set up event listeners
     setupEventListeners();
     
     // Scroll to bottom of chat
     scrollToBottom();
     
+    // Fill the view if the first page is too short to scroll
+    setTimeout(() => {
+        if (chatContainer.scrollHeight <= chatContainer.clientHeight) {
+            loadOlderMessages();
+        }
+    }, 150);
+    
     // Focus on input
     messageInput.focus();
     
@@ -45,6 +57,13 @@ function setupEventListeners() {
         this.style.height = this.scrollHeight + 'px';
     });
     
+    // Load older messages when scrolled near the top
+    chatContainer.addEventListener('scroll', function() {
+        if (chatContainer.scrollTop < 80) {
+            loadOlderMessages();
+        }
+    });
+    
     // Voice input button (placeholder for future implementation)
     const voiceBtn = document.getElementById('voiceBtn');
     if (voiceBtn) {
@@ -71,27 +90,33 @@ async function handleMessageSubmit(e) {
     showTypingIndicator();
     
     try {
-        // Send message to backend
-        const response = await fetch('/api/chat', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ message: message })
-        });
+        // Stream the reply; fall back to the plain JSON endpoint if streaming is unavailable
+        const streamed = window.ReadableStream && window.TextDecoder ? await streamChatMessage(message) : false;
         
-        if (!response.ok) {
-            throw new Error(`HTTP error! status: ${response.status}`);
+        if (!streamed) {
+            // Send message to backend
+            const response = await fetch('/api/chat', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                // Compact replies: intro text plus product summaries, cards are drawn here
+                body: JSON.stringify({ message: message, format: 'compact' })
+            });
+            
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            
+            const data = await response.json();
+            
+            // Hide typing indicator
+            hideTypingIndicator();
+            
+            // Add bot response to chat
+            addBotResponseToChat(data.bot_response);
         }
         
-        const data = await response.json();
-        
-        // Hide typing indicator
-        hideTypingIndicator();
-        
-        // Add bot response to chat
-        addBotResponseToChat(data.bot_response);
-        
         // Update cart count if needed
         updateCartCount();
         
@@ -115,15 +140,111 @@ async function handleMessageSubmit(e) {
     setProcessingState(false);
 }
 
-function addMessageToChat(message, sender, type = 'normal') {
-    const messageContainer = document.createElement('div');
-    messageContainer.className = `message ${sender}-message`;
+// Send a message to /api/chat/stream and render the reply as its events arrive.
+// Returns false if the stream could not be opened, so the caller can fall back.
+async function streamChatMessage(message) {
+    let response;
+    try {
+        response = await fetch('/api/chat/stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+            },
+            body: JSON.stringify({ message: message })
+        });
+    } catch (error) {
+        return false;
+    }
+    
+    if (!response.ok || !response.body) {
+        return false;
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let bubble = null;
+    let streamedText = '';
+    
+    // Show partial text in a bot bubble that is replaced by the final reply
+    const showPartial = (text) => {
+        hideTypingIndicator();
+        if (!bubble) {
+            const timestamp = new Date().toLocaleTimeString('en-US', {
+                hour: '2-digit',
+                minute: '2-digit'
+            });
+            bubble = createMessageElement('', 'bot', 'normal', timestamp);
+            chatContainer.appendChild(bubble);
+        }
+        bubble.querySelector('.prose').innerHTML = formatBotMessage({ message: text });
+        scrollToBottom();
+    };
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const event = parseServerSentEvent(buffer.slice(0, boundary));
+            buffer = buffer.slice(boundary + 2);
+            
+            if (event.type === 'intent' && event.data.message) {
+                showPartial(event.data.message);
+            } else if (event.type === 'text') {
+                streamedText = event.data.message + '\n\n';
+                showPartial(streamedText);
+            } else if (event.type === 'product') {
+                streamedText += event.data.card;
+                showPartial(streamedText);
+            } else if (event.type === 'done') {
+                if (bubble) {
+                    bubble.remove();
+                }
+                hideTypingIndicator();
+                addBotResponseToChat(event.data.bot_response);
+                return true;
+            }
+        }
+    }
     
+    throw new Error('Chat stream ended before the reply was complete');
+}
+
+function parseServerSentEvent(block) {
+    const event = { type: 'message', data: null };
+    const dataLines = [];
+    block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event.type = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            dataLines.push(line.slice(5).trim());
+        }
+    });
+    event.data = dataLines.length ? JSON.parse(dataLines.join('\n')) : {};
+    return event;
+}
+
+function addMessageToChat(message, sender, type = 'normal') {
     const timestamp = new Date().toLocaleTimeString('en-US', {
         hour: '2-digit',
         minute: '2-digit'
     });
     
+    chatContainer.appendChild(createMessageElement(message, sender, type, timestamp));
+    scrollToBottom();
+}
+
+function createMessageElement(message, sender, type, timestamp) {
+    const messageContainer = document.createElement('div');
+    messageContainer.className = `message ${sender}-message`;
+    
     if (sender === 'user') {
         messageContainer.innerHTML = `
             <div class="flex justify-end">
@@ -155,8 +276,40 @@ function addMessageToChat(message, sender, type = 'normal') {
         `;
     }
     
-    chatContainer.appendChild(messageContainer);
-    scrollToBottom();
+    return messageContainer;
+}
+
+async function loadOlderMessages() {
+    if (!historyCursor || isLoadingHistory) {
+        return;
+    }
+    isLoadingHistory = true;
+    
+    try {
+        const response = await fetch(`/api/chat-history?before=${encodeURIComponent(historyCursor)}`);
+        
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        const data = await response.json();
+        
+        // Prepend the page and keep the viewport on the message the user was reading
+        const previousHeight = chatContainer.scrollHeight;
+        const fragment = document.createDocumentFragment();
+        data.messages.forEach(item => {
+            fragment.appendChild(createMessageElement(item.message, item.sender, 'normal', item.time));
+        });
+        chatContainer.insertBefore(fragment, chatContainer.firstChild);
+        chatContainer.scrollTop += chatContainer.scrollHeight - previousHeight;
+        
+        historyCursor = data.next_cursor;
+        
+    } catch (error) {
+        console.error('Error loading chat history:', error);
+    }
+    
+    isLoadingHistory = false;
 }
 
 function addBotResponseToChat(response) {
@@ -207,14 +360,14 @@ function formatBotMessage(response) {
     return message;
 }
 
-function addProductCards(products) {
-    const productsContainer = document.createElement('div');
-    productsContainer.className = 'products-grid mt-4';
-    
-    products.forEach(product => {
-        const productCard = document.createElement('div');
-        productCard.className = 'product-card';
-        productCard.innerHTML = `
+// Rendered card markup keyed by "id:version", reused when a product shows up again
+const productCardCache = new Map();
+
+function renderProductCard(product) {
+    const key = `${product.id}:${product.version}`;
+    let html = productCardCache.get(key);
+    if (html === undefined) {
+        html = `
             <div class="bg-white border rounded-lg p-4 shadow-sm hover:shadow-md transition-shadow duration-200">
                 <h4 class="font-medium text-gray-900 mb-2">${escapeHtml(product.title)}</h4>
                 <p class="text-lg font-bold text-indigo-600 mb-3">$${product.price.toFixed(2)}</p>
@@ -224,6 +377,22 @@ function addProductCards(products) {
                 </button>
             </div>
         `;
+        if (productCardCache.size >= 500) {
+            productCardCache.delete(productCardCache.keys().next().value);
+        }
+        productCardCache.set(key, html);
+    }
+    return html;
+}
+
+function addProductCards(products) {
+    const productsContainer = document.createElement('div');
+    productsContainer.className = 'products-grid mt-4';
+    
+    products.forEach(product => {
+        const productCard = document.createElement('div');
+        productCard.className = 'product-card';
+        productCard.innerHTML = renderProductCard(product);
         productsContainer.appendChild(productCard);
     });
     
@@ -257,12 +426,19 @@ async function addToCart(productId) {
             })
         });
         
+        const data = await response.json();
+        
+        if (response.status === 409) {
+            // Not enough stock; nothing was added
+            if (window.ShopMateApp) {
+                window.ShopMateApp.showNotification(data.error, 'error');
+            }
+            return;
+        }
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
         }
         
-        const data = await response.json();
-        
         if (data.success) {
             // Update cart count
             updateCartCount();
@@ -409,6 +585,7 @@ async function clearChatHistory() {
             // Clear messages from DOM
             const messages = chatContainer.querySelectorAll('.message');
             messages.forEach(msg => msg.remove());
+            historyCursor = null;
             
             // Add welcome message
             addMessageToChat(
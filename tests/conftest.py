@@ -0,0 +1,41 @@
+"""Shared fixtures: an app on a throwaway SQLite database with the schema applied"""
+
+import pytest
+
+from app import create_app, db
+import migrations
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    """Factory for apps on a fresh SQLite file; settings override the defaults."""
+    apps = []
+
+    def make(**settings):
+        config = {
+            'TESTING': True,
+            'SECRET_KEY': 'test',
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'shopmate.db'}",
+            'CACHE_BACKEND': 'memory',
+            'DATABASE_REPLICA_URLS': '',
+            'PASSWORD_HASH_WORKERS': 0,
+            'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+            'CHAT_WRITE_FLUSH_INTERVAL': 60.0,
+        }
+        config.update(settings)
+        app = create_app(config)
+        with app.app_context():
+            migrations.migrate()
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.engine.dispose()
+
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
@@ -0,0 +1,73 @@
+"""Tests for the asyncio chat API: the Flask request hooks around its routes"""
+
+import asyncio
+import json
+
+import pytest
+
+from app import db
+from models import User, Product
+from replicas import copy_sqlite
+
+async_api = pytest.importorskip('async_api')
+
+
+@pytest.fixture
+def replicated(make_app, tmp_path):
+    """App with a SQLite replica holding a shopper and a product; yields (app, api, client, cookie, product_id)."""
+    app = make_app(DATABASE_REPLICA_URLS=f"sqlite:///{tmp_path / 'replica.db'}",
+                   CACHE_BACKEND=f"sqlite:///{tmp_path / 'cache.db'}", SEMANTIC_SEARCH_ENABLED=False)
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com')
+        product = Product(title='Desk Lamp', price=20.0, category='Electronics', stock=3)
+        db.session.add_all([user, product])
+        db.session.commit()
+        user_id, product_id = user.id, product.id
+        copy_sqlite(db.engine.url.database, str(tmp_path / 'replica.db'))
+
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+    cookie = client.get_cookie(app.config['SESSION_COOKIE_NAME']).value
+
+    api = async_api.AsyncChatAPI(app)
+    yield app, api, client, cookie, product_id
+    asyncio.run(api.engine.dispose())
+    api.executor.shutdown()
+
+
+def call(api, method, path, cookie, body=None):
+    """Send one HTTP request through the ASGI app; returns (status, JSON payload)."""
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+             'headers': [(b'cookie', f'session={cookie}'.encode()), (b'content-type', b'application/json')]}
+    messages = [{'type': 'http.request', 'body': json.dumps(body).encode() if body is not None else b''}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(api(scope, receive, send))
+    return sent[0]['status'], json.loads(sent[1]['body'])
+
+
+def test_async_write_then_sync_read_sees_it(replicated):
+    app, api, client, cookie, product_id = replicated
+    status, payload = call(api, 'POST', '/api/add-to-cart', cookie, {'product_id': product_id})
+    assert status == 200
+    assert payload['cart_count'] == 1
+
+    # The replica still has the empty cart; the sync read must go to the primary
+    cart = client.get('/api/cart').get_json()
+    assert [item['product_id'] for item in cart['items']] == [product_id]
+
+
+def test_before_request_hooks_run(replicated):
+    app, api, _, cookie, _ = replicated
+    assert not app.extensions.get('shopmate_warm')
+    status, _ = call(api, 'GET', '/api/cart-count', cookie)
+    assert status == 200
+    # The lazy warm-up is one of the sync app's before_request hooks
+    assert app.extensions.get('shopmate_warm')
@@ -0,0 +1,175 @@
+"""Tests for the cache layer on a Redis-protocol backend (fakeredis), its invalidation hooks and the reply card cache"""
+
+import time
+
+import fakeredis
+import pytest
+import redis
+
+import cache
+import reply_templates
+from app import db
+from cache import Cache, MemoryBackend, RedisBackend, SQLiteBackend, catalog_cache, cart_cache, login_miss_cache
+from models import User, Product, CartItem
+from reply_templates import product_card, product_summary
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """One fake Redis server shared by every client, like workers sharing a real one."""
+    fake_server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url',
+                        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=fake_server)))
+    return fake_server
+
+
+@pytest.fixture
+def redis_app(make_app, server):
+    app = make_app(CACHE_BACKEND='redis://localhost:6379/0')
+    assert isinstance(Cache.backend, RedisBackend)
+    yield app
+    cache.Cache.backend = cache.MemoryBackend()
+
+
+def test_round_trip_and_namespaces(redis_app):
+    catalog_cache.set(('search', 'lamp'), {'message': 'lamps'})
+    cart_cache.set(7, 3)
+    assert catalog_cache.get(('search', 'lamp')) == {'message': 'lamps'}
+    assert cart_cache.get(7) == 3
+
+    catalog_cache.invalidate()
+    assert catalog_cache.get(('search', 'lamp')) is None
+    assert cart_cache.get(7) == 3
+
+
+def test_entries_expire(redis_app):
+    short = Cache('short', ttl=0.05)
+    short.set('key', 'value')
+    assert short.get('key') == 'value'
+    time.sleep(0.1)
+    assert short.get('key') is None
+
+
+def test_other_workers_see_invalidation(redis_app):
+    other_worker = RedisBackend('redis://localhost:6379/0')
+    cart_cache.set(1, 5)
+    assert other_worker.get(cart_cache._key(1)) == 5
+    cart_cache.delete(1)
+    assert other_worker.get(cart_cache._key(1)) is None
+
+
+def test_product_change_invalidates_after_commit(redis_app):
+    with redis_app.app_context():
+        product = Product(title='Desk Lamp', price=20.0, category='Electronics')
+        db.session.add(product)
+        db.session.commit()
+
+        catalog_cache.set(('search', 'lamp'), 'cached')
+        product.price = 18.0
+        db.session.flush()
+        # Not committed yet: other requests still read the old price
+        assert catalog_cache.get(('search', 'lamp')) == 'cached'
+        db.session.commit()
+        assert catalog_cache.get(('search', 'lamp')) is None
+
+
+def test_rolled_back_change_keeps_cache(redis_app):
+    with redis_app.app_context():
+        user = User(username='shopper', email='shopper@example.com')
+        product = Product(title='Notebook', price=5.0, category='Books')
+        db.session.add_all([user, product])
+        db.session.commit()
+
+        cart_cache.set(user.id, 0)
+        db.session.add(CartItem(user_id=user.id, product_id=product.id))
+        db.session.flush()
+        db.session.rollback()
+        assert cart_cache.get(user.id) == 0
+
+        db.session.add(CartItem(user_id=user.id, product_id=product.id))
+        db.session.commit()
+        assert cart_cache.get(user.id) is None
+
+
+def test_login_miss_cache_needs_a_shared_backend(make_app, tmp_path):
+    make_app()
+    assert not login_miss_cache.enabled
+
+    make_app(CACHE_BACKEND=f"sqlite:///{tmp_path / 'cache.db'}")
+    assert login_miss_cache.enabled
+    assert isinstance(login_miss_cache.store, SQLiteBackend)
+    assert login_miss_cache.store.table != Cache.backend.table
+
+
+def test_login_misses_cannot_evict_other_entries(make_app):
+    make_app(LOGIN_MISS_CACHE_ENABLED=True, CACHE_MAX_ENTRIES=4, LOGIN_MISS_CACHE_MAX_ENTRIES=8)
+    catalog_cache.set(('search', 'lamp'), 'cached')
+    for attempt in range(100):
+        login_miss_cache.set(f'made-up-{attempt}', True)
+    assert catalog_cache.get(('search', 'lamp')) == 'cached'
+    assert len(login_miss_cache.store) == 8
+    assert len(Cache.backend) == 1
+
+
+def test_registration_clears_login_miss(make_app, tmp_path):
+    app = make_app(CACHE_BACKEND=f"sqlite:///{tmp_path / 'cache.db'}")
+    client = app.test_client()
+    client.post('/login', data={'username': 'newcomer', 'password': 'secret'})
+    assert login_miss_cache.get('newcomer')
+
+    client.post('/register', data={'username': 'newcomer', 'email': 'newcomer@example.com', 'password': 'secret'})
+    assert login_miss_cache.get('newcomer') is None
+
+
+@pytest.fixture
+def cards(monkeypatch):
+    """Fresh card cache, with PRODUCT_CARD wrapped to count renders; yields the list of rendered ids."""
+    monkeypatch.setattr(reply_templates, 'card_cache', MemoryBackend(max_entries=2))
+    rendered = []
+    template = reply_templates.PRODUCT_CARD
+
+    def counting(**summary):
+        rendered.append(summary['id'])
+        return template(**summary)
+
+    monkeypatch.setattr(reply_templates, 'PRODUCT_CARD', counting)
+    return rendered
+
+
+def test_card_is_rendered_once_per_version(app, cards):
+    with app.app_context():
+        product = Product(title='Desk Lamp', price=20.0, rating=4.5, category='Electronics')
+        db.session.add(product)
+        db.session.commit()
+
+        card = product_card(product_summary(product))
+        assert '$20.00' in card
+        assert product_card(product_summary(product)) == card
+        assert cards == [product.id]
+
+        # The committed change bumps updated_at, so the next lookup misses
+        product.price = 18.0
+        db.session.commit()
+        assert '$18.00' in product_card(product_summary(product))
+        assert cards == [product.id, product.id]
+
+
+def test_cards_without_a_version_are_not_cached(cards):
+    summary = {'id': 1, 'title': 'Desk Lamp', 'price': 20.0, 'rating': 4.5, 'category': 'Electronics', 'version': None}
+    product_card(summary)
+    product_card(summary)
+    assert cards == [1, 1]
+    assert len(reply_templates.card_cache) == 0
+
+
+def test_card_cache_is_bounded(cards):
+    for product_id in range(3):
+        product_card({'id': product_id, 'title': f'Lamp {product_id}', 'price': 20.0, 'rating': 4.5,
+                      'category': 'Electronics', 'version': '2026-01-01T00:00:00'})
+    assert len(reply_templates.card_cache) == 2
+    assert reply_templates.card_cache.evictions == 1
+
+
+def test_card_cache_size_comes_from_config(make_app, cards):
+    make_app(REPLY_CARD_CACHE_SIZE=16)
+    assert reply_templates.card_cache.max_entries == 16
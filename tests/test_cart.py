@@ -0,0 +1,112 @@
+"""Tests for batched cart operations: all-or-nothing batches, stock checks and add-to-cart replies"""
+
+import pytest
+
+import routes
+from app import db
+from models import User, Product
+
+
+@pytest.fixture
+def shop(make_app):
+    """App with holds off, a shopper, a lamp with 3 units and a cookbook with 100; yields (app, user_id, lamp_id, book_id)."""
+    app = make_app(STOCK_RESERVATIONS_ENABLED=False, SEMANTIC_SEARCH_ENABLED=False)
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com')
+        lamp = Product(title='Desk Lamp', price=20.0, category='Electronics', stock=3)
+        book = Product(title='Cookbook', price=9.5, category='Books', stock=100)
+        db.session.add_all([user, lamp, book])
+        db.session.commit()
+        yield app, user.id, lamp.id, book.id
+
+
+@pytest.fixture
+def client(shop):
+    app, user_id, _, _ = shop
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+    return client
+
+
+def post(client, *operations):
+    return client.post('/api/cart', json={'operations': list(operations)})
+
+
+def cart_lines(client):
+    return {item['product_id']: item['quantity'] for item in client.get('/api/cart').get_json()['items']}
+
+
+def test_batch_applies_operations_in_order(shop, client):
+    _, _, lamp_id, book_id = shop
+    response = post(client,
+                    {'op': 'add', 'product_id': lamp_id},
+                    {'op': 'add', 'product_id': lamp_id},
+                    {'op': 'add', 'product_id': book_id, 'quantity': 50},
+                    {'op': 'set', 'product_id': book_id, 'quantity': 40})
+    assert response.status_code == 200
+    snapshot = response.get_json()['cart']
+    assert snapshot['count'] == 2
+    assert snapshot['quantity'] == 42
+    assert snapshot['total'] == 2 * 20.0 + 40 * 9.5
+    assert cart_lines(client) == {lamp_id: 2, book_id: 40}
+
+
+def test_unknown_product_rejects_the_whole_batch(shop, client):
+    _, _, lamp_id, _ = shop
+    response = post(client, {'op': 'add', 'product_id': lamp_id}, {'op': 'add', 'product_id': 999})
+    assert response.status_code == 404
+    assert response.get_json()['items'] == [{'product_id': 999}]
+    assert cart_lines(client) == {}
+
+
+def test_shortage_rejects_the_whole_batch(shop, client):
+    _, _, lamp_id, book_id = shop
+    post(client, {'op': 'add', 'product_id': lamp_id, 'quantity': 2})
+
+    response = post(client, {'op': 'add', 'product_id': book_id}, {'op': 'add', 'product_id': lamp_id, 'quantity': 2})
+    assert response.status_code == 409
+    assert response.get_json()['items'] == [
+        {'product_id': lamp_id, 'title': 'Desk Lamp', 'requested': 4, 'available': 3}
+    ]
+    assert cart_lines(client) == {lamp_id: 2}
+
+
+def test_removing_below_stock_is_accepted(shop, client):
+    _, _, lamp_id, _ = shop
+    post(client, {'op': 'add', 'product_id': lamp_id, 'quantity': 3})
+    response = post(client, {'op': 'add', 'product_id': lamp_id}, {'op': 'set', 'product_id': lamp_id, 'quantity': 1})
+    assert response.status_code == 200
+    assert cart_lines(client) == {lamp_id: 1}
+
+
+@pytest.mark.parametrize('operations', [
+    None,
+    [],
+    [{'op': 'swap', 'product_id': 1}],
+    [{'op': 'add', 'product_id': '1'}],
+    [{'op': 'add', 'product_id': 1, 'quantity': 0}],
+])
+def test_malformed_batch_is_rejected(client, operations):
+    response = client.post('/api/cart', json={'operations': operations})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_add_to_cart_names_the_product(shop, client):
+    _, _, lamp_id, _ = shop
+    response = client.post('/api/add-to-cart', json={'product_id': lamp_id})
+    assert response.status_code == 200
+    assert response.get_json() == {'success': True, 'message': 'Desk Lamp added to cart!', 'cart_count': 1}
+
+    assert client.post('/api/add-to-cart', json={'product_id': lamp_id, 'quantity': 3}).status_code == 409
+
+
+def test_add_to_cart_without_the_line_in_the_snapshot(shop, client, monkeypatch):
+    _, _, lamp_id, _ = shop
+    # The line was removed again between the commit and the snapshot read
+    monkeypatch.setattr(routes, 'apply_operations',
+                        lambda user_id, operations: {'items': [], 'count': 0, 'quantity': 0, 'total': 0.0})
+    response = client.post('/api/add-to-cart', json={'product_id': lamp_id})
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'Added to cart!'
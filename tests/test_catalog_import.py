@@ -0,0 +1,50 @@
+"""Tests for catalog_import normalisation and loading"""
+
+import pytest
+
+from app import db
+from catalog_import import normalize_product, load_products
+from models import Product
+
+
+def test_zero_stock_and_rating_are_kept():
+    row = normalize_product({'title': 'Sold out lamp', 'category': 'Electronics', 'price': '12', 'stock': '0',
+                             'rating': '0'})
+    assert row['stock'] == 0
+    assert row['rating'] == 0.0
+
+
+@pytest.mark.parametrize('missing', [None, ''])
+def test_missing_stock_and_rating_take_defaults(missing):
+    row = normalize_product({'title': 'Lamp', 'category': 'Electronics', 'price': 12, 'stock': missing,
+                             'rating': missing})
+    assert row['stock'] == 10
+    assert row['rating'] == 4.0
+
+
+@pytest.mark.parametrize('record', [
+    {'category': 'Books', 'price': '5'},
+    {'title': 'Novel', 'category': 'Books'},
+    {'title': 'Novel', 'category': 'Books', 'price': '-1'},
+    {'title': 'Novel', 'category': 'Books', 'price': 'cheap'},
+])
+def test_invalid_records_are_rejected(record):
+    with pytest.raises(ValueError):
+        normalize_product(record)
+
+
+def test_import_zero_stock_record(app):
+    records = [
+        {'sku': 'LAMP-1', 'title': 'Desk Lamp', 'category': 'Electronics', 'price': '20', 'stock': '5'},
+        {'sku': 'LAMP-2', 'title': 'Floor Lamp', 'category': 'Electronics', 'price': '45', 'stock': 0},
+    ]
+    with app.app_context():
+        stats = load_products(normalize_product(record) for record in records)
+        assert stats['written'] == 2
+        stock = dict(db.session.execute(db.select(Product.sku, Product.stock)).all())
+        assert stock == {'LAMP-1': 5, 'LAMP-2': 0}
+
+        # A refreshed feed selling the last units out updates the row to 0, not the default
+        load_products([normalize_product(dict(records[0], stock='0'))])
+        db.session.expire_all()
+        assert db.session.scalar(db.select(Product.stock).filter_by(sku='LAMP-1')) == 0
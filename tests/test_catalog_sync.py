@@ -0,0 +1,132 @@
+"""Tests for the post-commit catalog patches and the cross-process change feed"""
+
+import threading
+
+import pytest
+from sqlalchemy import insert, update, delete, select, func
+
+import catalog_sync as catalog_sync_module
+from app import db, warm_up
+from catalog_sync import catalog_sync, record_reload
+from catalog_snapshot import catalog_snapshot
+from models import Product, CatalogChange
+from search_index import product_index
+
+
+@pytest.fixture
+def warm_app(make_app):
+    app = make_app(CATALOG_SYNC_INTERVAL=0.0, SEMANTIC_SEARCH_ENABLED=False)
+    with app.app_context():
+        db.session.add(Product(title='Desk Lamp', price=20.0, category='Electronics', stock=3))
+        db.session.commit()
+    warm_up(app)
+    return app
+
+
+def feed_entry(connection, product_id):
+    """Write a product change like another worker would: straight to the database, with a feed entry."""
+    connection.execute(insert(CatalogChange).values(product_id=product_id))
+
+
+def feed_length():
+    return db.session.scalar(select(func.count()).select_from(CatalogChange))
+
+
+def test_commit_patches_index_and_writes_feed(warm_app):
+    with warm_app.app_context():
+        entries = feed_length()
+        product = Product(title='Reading Lamp', price=15.0, category='Electronics')
+        db.session.add(product)
+        db.session.flush()
+        assert product_index.search(['reading']) == []
+        db.session.commit()
+        assert product_index.search(['reading']) == [product.id]
+        assert feed_length() == entries + 1
+
+
+def test_rollback_leaves_no_phantom(warm_app):
+    with warm_app.app_context():
+        entries = feed_length()
+        db.session.add(Product(title='Phantom Speaker', price=15.0, category='Electronics'))
+        db.session.flush()
+        db.session.rollback()
+        assert product_index.search(['phantom']) == []
+        assert feed_length() == entries
+
+
+def test_changes_from_other_processes_are_applied(warm_app):
+    with warm_app.app_context(), db.engine.begin() as connection:
+        product_id = connection.execute(insert(Product).values(
+            title='Bluetooth Speaker', price=30.0, category='Electronics', stock=0)).inserted_primary_key[0]
+        lamp_id = connection.scalar(select(Product.id).filter_by(title='Desk Lamp'))
+        connection.execute(update(Product).where(Product.id == lamp_id).values(title='Desk Light', stock=0))
+        feed_entry(connection, product_id)
+        feed_entry(connection, lamp_id)
+
+    with warm_app.test_request_context():
+        assert product_index.search(['speaker']) == []
+        warm_app.preprocess_request()  # before_request runs the feed check
+        assert product_index.search(['speaker']) == [product_id]
+        assert product_index.search(['lamp']) == []
+        assert product_index.search(['light']) == [lamp_id]
+        if catalog_snapshot is not None:
+            assert catalog_snapshot.filter(in_stock=True) == []
+
+    with warm_app.app_context(), db.engine.begin() as connection:
+        connection.execute(delete(Product).where(Product.id == product_id))
+        feed_entry(connection, product_id)
+    with warm_app.app_context():
+        catalog_sync.refresh()
+    assert product_index.search(['speaker']) == []
+
+
+def test_reload_entry_rebuilds_in_background(warm_app, monkeypatch):
+    with warm_app.app_context(), db.engine.begin() as connection:
+        connection.execute(insert(Product).values(title='Imported Novel', price=9.0, category='Books'))
+        record_reload(connection)
+
+    # Hold the rebuild until the request below has been served from the current copies
+    served = threading.Event()
+    real_rebuild = catalog_sync_module.rebuild
+    monkeypatch.setattr(catalog_sync_module, 'rebuild', lambda: served.wait(5) and real_rebuild())
+
+    rebuilds = catalog_sync.rebuilds
+    with warm_app.test_request_context():
+        warm_app.preprocess_request()
+        assert product_index.search(['lamp']) != []
+        assert product_index.search(['novel']) == []
+    served.set()
+    catalog_sync._rebuilding.join(5)
+    assert catalog_sync.rebuilds == rebuilds + 1
+    assert len(product_index.search(['novel'])) == 1
+
+
+def test_late_commit_is_applied(warm_app):
+    with warm_app.app_context():
+        catalog_sync.refresh()
+        version = catalog_sync.version
+        with db.engine.begin() as connection:
+            early_id = connection.execute(insert(Product).values(
+                title='Early Speaker', price=30.0, category='Electronics')).inserted_primary_key[0]
+            late_id = connection.execute(insert(Product).values(
+                title='Late Radio', price=25.0, category='Electronics')).inserted_primary_key[0]
+            # Id version + 1 is taken by a transaction that commits after version + 2
+            connection.execute(insert(CatalogChange).values(id=version + 2, product_id=early_id))
+        catalog_sync.refresh()
+        assert catalog_sync.version == version + 2
+        assert product_index.search(['speaker']) == [early_id]
+
+        with db.engine.begin() as connection:
+            connection.execute(insert(CatalogChange).values(id=version + 1, product_id=late_id))
+        assert catalog_sync.refresh() == 1
+        assert product_index.search(['radio']) == [late_id]
+
+
+def test_feed_is_pruned(warm_app):
+    catalog_sync.retention = 2
+    with warm_app.app_context():
+        for number in range(5):
+            db.session.add(Product(title=f'Notebook {number}', price=3.0, category='Books'))
+            db.session.commit()
+        catalog_sync.refresh(block=True)
+        assert feed_length() == 2
@@ -0,0 +1,103 @@
+"""Tests for chat history keyset pagination: cursors, timestamp ties and page sizes"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from models import User, ChatSession, ChatMessage
+
+START = datetime(2026, 1, 1, 12, 0)
+
+
+@pytest.fixture
+def history(make_app):
+    """
+    Logged-in client whose chat has 7 messages, 'm0' oldest, where m2-m4 share
+    one timestamp; another user's chat has 'other'. Yields (client, other_message_id).
+    """
+    app = make_app(CHAT_HISTORY_PAGE_SIZE=3)
+    with app.app_context():
+        ada = User(username='ada', email='ada@example.com')
+        bob = User(username='bob', email='bob@example.com')
+        db.session.add_all([ada, bob])
+        db.session.flush()
+        mine = ChatSession(user_id=ada.id, session_token='ada-token')
+        theirs = ChatSession(user_id=bob.id, session_token='bob-token')
+        db.session.add_all([mine, theirs])
+        db.session.flush()
+        offsets = [0, 1, 2, 2, 2, 3, 4]
+        db.session.add_all([ChatMessage(session_id=mine.id, message=f'm{number}', sender='user',
+                                        timestamp=START + timedelta(minutes=offset))
+                            for number, offset in enumerate(offsets)])
+        other = ChatMessage(session_id=theirs.id, message='other', sender='user', timestamp=START)
+        db.session.add(other)
+        db.session.commit()
+        user_id, other_id = ada.id, other.id
+
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+        flask_session['chat_token'] = 'ada-token'
+    return client, other_id
+
+
+def page(client, **params):
+    response = client.get('/api/chat-history', query_string=params)
+    assert response.status_code == 200
+    payload = response.get_json()
+    return [message['message'] for message in payload['messages']], payload['next_cursor']
+
+
+def test_pages_cover_every_message_once(history):
+    client, _ = history
+    pages = []
+    messages, cursor = page(client)
+    pages.append(messages)
+    while cursor:
+        messages, cursor = page(client, before=cursor)
+        pages.append(messages)
+    # m2-m4 share a timestamp and a page boundary; the id tiebreak keeps them in order
+    assert pages == [['m4', 'm5', 'm6'], ['m1', 'm2', 'm3'], ['m0']]
+
+
+@pytest.mark.parametrize('limit, expected', [
+    (2, ['m5', 'm6']),
+    (100, ['m4', 'm5', 'm6']),  # Capped at CHAT_HISTORY_PAGE_SIZE
+    (0, ['m6']),
+    (-5, ['m6']),
+    ('many', ['m4', 'm5', 'm6']),  # Not a number: the default size
+])
+def test_limit_is_clamped(history, limit, expected):
+    client, _ = history
+    assert page(client, limit=limit)[0] == expected
+
+
+@pytest.mark.parametrize('cursor', ['garbage', '2026-01-01T12:00:00', '2026-01-01T12:00:00_x', '_5', 'yesterday_5'])
+def test_malformed_cursor_is_rejected(history, cursor):
+    client, _ = history
+    response = client.get('/api/chat-history', query_string={'before': cursor})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+def test_tampered_cursor_stays_in_own_session(history):
+    client, other_id = history
+    # A hand-made cursor just after another user's message pages through this chat only
+    messages, cursor = page(client, before=f'{START.isoformat()}_{other_id + 1}', limit=3)
+    assert messages == ['m0']
+    assert cursor is None
+
+    messages, _ = page(client, before=f'{(START + timedelta(days=1)).isoformat()}_1')
+    assert messages == ['m4', 'm5', 'm6']
+
+
+@pytest.mark.parametrize('message_id', [2 ** 80, -1])
+def test_out_of_range_cursor_id_is_rejected(history, message_id):
+    client, _ = history
+    response = client.get('/api/chat-history', query_string={'before': f'{START.isoformat()}_{message_id}'})
+    assert response.status_code == 400
+
+
+def test_requires_login(make_app):
+    assert make_app().test_client().get('/api/chat-history').status_code == 401
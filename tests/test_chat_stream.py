@@ -0,0 +1,82 @@
+"""Tests for the SSE chat stream: event order and the payloads static/js/chat.js reads"""
+
+import json
+
+import pytest
+from sqlalchemy import select
+
+from app import db
+from models import User, Product, ChatMessage
+
+
+@pytest.fixture
+def client(make_app):
+    """Logged-in chat client of an app with two electronics products; yields (app, client)."""
+    app = make_app(SEMANTIC_SEARCH_ENABLED=False)
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com')
+        db.session.add(user)
+        db.session.add_all([Product(title='Earbuds', price=20.0, category='Electronics', stock=5),
+                            Product(title='Speaker', price=45.0, category='Electronics', stock=2)])
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+        flask_session['chat_token'] = 'stream-token'
+    yield app, client
+
+
+def stream(client, message):
+    """POST to the stream and parse it as chat.js does; returns [(event, data), ...]."""
+    response = client.post('/api/chat/stream', json={'message': message})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = []
+    for block in response.get_data(as_text=True).split('\n\n'):
+        if not block:
+            continue
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+def test_product_reply_events(client):
+    app, client = client
+    events = stream(client, 'show me electronics')
+    names = [name for name, _ in events]
+    assert names == ['intent', 'text', 'product', 'product', 'done']
+
+    intent, text, *products, done = [data for _, data in events]
+    assert intent == {'type': 'search', 'message': '🔎 Searching the catalog...'}
+    assert done['user_message'] == 'show me electronics'
+    assert 'timestamp' in done
+    reply = done['bot_response']
+    assert reply['type'] == 'products'
+    assert text['message'] == reply['intro']
+    # Each product event is the reply's product plus its rendered card
+    assert [{key: value for key, value in product.items() if key != 'card'} for product in products] == reply['products']
+    assert all(product['title'] in product['card'] for product in products)
+
+
+def test_plain_reply_events(client):
+    app, client = client
+    events = stream(client, 'hello')
+    assert [name for name, _ in events] == ['intent', 'done']
+    assert events[0][1] == {'type': 'greeting', 'message': ''}
+    assert events[-1][1]['bot_response']['type'] == 'greeting'
+
+
+def test_turn_is_saved_after_the_stream(client):
+    app, client = client
+    events = stream(client, 'show me electronics')
+    with app.app_context():
+        saved = db.session.execute(select(ChatMessage.sender, ChatMessage.message).order_by(ChatMessage.id)).all()
+    assert [tuple(row) for row in saved] == [('user', 'show me electronics'),
+                                            ('bot', events[-1][1]['bot_response']['message'])]
+
+
+def test_rejected_before_streaming(client):
+    app, client = client
+    assert client.post('/api/chat/stream', json={'message': '  '}).status_code == 400
+    assert app.test_client().post('/api/chat/stream', json={'message': 'hi'}).status_code == 401
@@ -0,0 +1,91 @@
+"""Tests for conversation context: refining the last listing, starting over and expiry"""
+
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+from app import db
+from conversation import conversations
+from models import User, Product
+
+CATALOG = [
+    ('Earbuds', 20.0, 4.1, 5, 'Electronics'),
+    ('Speaker', 45.0, 4.6, 0, 'Electronics'),
+    ('Headphones', 80.0, 4.8, 2, 'Electronics'),
+    ('Monitor', 150.0, 4.3, 1, 'Electronics'),
+    ('Cookbook', 25.0, 4.0, 0, 'Books'),
+    ('Novel', 12.0, 4.5, 3, 'Books'),
+]
+
+
+@pytest.fixture
+def client(make_app):
+    """Logged-in chat client of an app with the CATALOG products."""
+    app = make_app(SEMANTIC_SEARCH_ENABLED=False, CATALOG_CACHE_ENABLED=False)
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com')
+        db.session.add(user)
+        db.session.add_all([Product(title=title, price=price, rating=rating, stock=stock, category=category)
+                            for title, price, rating, stock, category in CATALOG])
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+        flask_session['chat_token'] = 'conversation-token'
+    conversations.refinements = 0
+    return client
+
+
+def chat(client, message):
+    """Send a chat message; returns the titles shown, or the reply type when there are none."""
+    response = client.post('/api/chat', json={'message': message})
+    assert response.status_code == 200
+    bot_response = response.get_json()['bot_response']
+    if bot_response['type'] != 'products':
+        return bot_response['type']
+    return sorted(product['title'] for product in bot_response['products'])
+
+
+def test_follow_ups_refine_the_listing(client):
+    assert chat(client, 'show me electronics') == ['Earbuds', 'Headphones', 'Monitor', 'Speaker']
+    assert chat(client, 'now under $50') == ['Earbuds', 'Speaker']
+    assert chat(client, 'only in stock') == ['Earbuds']
+    # Filters apply to the whole listing, so a higher bound widens it again
+    assert chat(client, 'what about under $100') == ['Earbuds', 'Headphones']
+    assert conversations.refinements == 3
+
+
+def test_new_listing_resets_the_filters(client):
+    chat(client, 'show me electronics')
+    assert chat(client, 'now under $20') == ['Earbuds']
+
+    assert chat(client, 'show me books') == ['Cookbook', 'Novel']
+    # The price bound of the electronics listing doesn't carry over to the $25 cookbook
+    assert chat(client, 'what about rated 4+') == ['Cookbook', 'Novel']
+    assert chat(client, 'only in stock') == ['Novel']
+
+
+def test_bare_number_is_not_a_refinement(client):
+    chat(client, 'show me electronics')
+    chat(client, 'now 3')
+    assert conversations.refinements == 0
+
+
+def test_cleared_chat_forgets_the_listing(client):
+    chat(client, 'show me electronics')
+    assert client.post('/api/clear-chat').status_code == 200
+    chat(client, 'now under $50')
+    assert conversations.refinements == 0
+
+
+def test_context_expires(client, monkeypatch):
+    chat(client, 'show me electronics')
+    later = time.time() + conversations.ttl + 1
+    monkeypatch.setattr(cache, 'time', SimpleNamespace(time=lambda: later))
+
+    # Answered on its own: every product under $50, books included
+    assert chat(client, 'now under $50') == ['Cookbook', 'Earbuds', 'Novel', 'Speaker']
+    assert conversations.refinements == 0
@@ -0,0 +1,45 @@
+"""Tests for intents.classify"""
+
+import pytest
+
+import intents
+from intents import classify
+
+
+def regex_only(message):
+    """classify() with the word-lookup fast path turned off."""
+    starts = intents.PHRASE_STARTS
+    intents.PHRASE_STARTS = frozenset(intents.WORD_GROUPS) | frozenset(intents.WORD_PATTERN.findall(message.lower()))
+    try:
+        return classify(message)
+    finally:
+        intents.PHRASE_STARTS = starts
+
+
+@pytest.mark.parametrize('message', [
+    'hi', 'show me electronics', 'find some tech gadgets', 'clothing please', 'show my cart',
+    'search for headphones', 'is the jacket available', 'something cheaper', 'help', 'thanks',
+    'hey, what is this', 'books books electronics',
+])
+def test_fast_path_matches_regex(message):
+    assert classify(message) == regex_only(message)
+
+
+@pytest.mark.parametrize('message, name, slots', [
+    ('books under $20', 'price', {'category': 'Books', 'max_price': 20.0}),
+    ('what can you do', 'help', {}),
+    ('how do I add to cart', 'add_to_cart', {}),
+    ('electronics rated 4.5+ in stock', 'category', {'min_rating': 4.5, 'in_stock': True}),
+    ('show me a 4k webcam', 'search', {'max_price': None, 'keywords': ['4k', 'webcam']}),
+    ('headphones under 50', 'price', {'max_price': 50.0, 'keywords': ['headphones']}),
+    ('anything cheaper than 40', 'price', {'max_price': 40.0}),
+    ('$35 headphones', 'default', {'max_price': 35.0}),
+    ('iphone 15', 'default', {'max_price': None, 'keywords': ['iphone', '15']}),
+    ('find 2 lamps under $30', 'price', {'max_price': 30.0, 'keywords': ['2', 'lamps']}),
+    ('now 3', 'default', {'max_price': None}),
+])
+def test_phrases_and_numbers(message, name, slots):
+    intent = classify(message)
+    assert intent.name == name
+    for key, value in slots.items():
+        assert intent.slots[key] == value
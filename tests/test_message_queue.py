@@ -0,0 +1,95 @@
+"""Tests for the chat message write-behind queue"""
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from message_queue import chat_writer
+from models import User, ChatSession, ChatMessage
+
+
+@pytest.fixture
+def writer(make_app):
+    make_app(CHAT_WRITE_BEHIND=True, CHAT_WRITE_MAX_ATTEMPTS=2, CHAT_WRITE_MAX_BUFFER=10)
+    chat_writer.dropped = 0
+    yield chat_writer
+    with chat_writer._lock:
+        chat_writer._buffer.clear()
+    chat_writer._failures = 0
+
+
+@pytest.fixture
+def session_id(writer):
+    with writer._app.app_context():
+        user = User(username='writer', email='writer@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        chat_session = ChatSession(user_id=user.id, session_token='token')
+        db.session.add(chat_session)
+        db.session.commit()
+        return chat_session.id
+
+
+def stored_messages(app):
+    with app.app_context():
+        return [row.message for row in db.session.query(ChatMessage).order_by(ChatMessage.id)]
+
+
+def test_flush_writes_batch(writer, session_id):
+    writer.enqueue(session_id, 'hello', 'user')
+    writer.enqueue(session_id, 'hi there', 'bot')
+    assert writer.flush() == 2
+    assert stored_messages(writer._app) == ['hello', 'hi there']
+
+
+def test_rejected_row_is_dropped_not_retried(writer, session_id):
+    writer.enqueue(session_id, 'first', 'user')
+    writer.enqueue(session_id, None, 'bot')  # NOT NULL violation
+    writer.enqueue(session_id, 'third', 'user')
+    assert writer.flush() == 2
+    assert writer.dropped == 1
+    assert writer._buffer == []
+    assert stored_messages(writer._app) == ['first', 'third']
+
+
+def test_transient_error_keeps_rows(writer, session_id, monkeypatch):
+    calls = []
+    insert = writer._insert
+
+    def flaky(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise OperationalError('INSERT', {}, Exception('database is locked'))
+        insert(rows)
+
+    monkeypatch.setattr(writer, '_insert', flaky)
+    writer.enqueue(session_id, 'kept', 'user')
+    assert writer.flush() == 0
+    assert len(writer._buffer) == 1
+    assert writer.flush() == 1
+    assert stored_messages(writer._app) == ['kept']
+
+
+def test_repeated_transient_errors_fall_back_to_rows(writer, session_id, monkeypatch):
+    insert = writer._insert
+
+    def failing_batches(rows):
+        if len(rows) > 1:
+            raise OperationalError('INSERT', {}, Exception('too many SQL variables'))
+        insert(rows)
+
+    monkeypatch.setattr(writer, '_insert', failing_batches)
+    writer.enqueue(session_id, 'a', 'user')
+    writer.enqueue(session_id, 'b', 'bot')
+    assert writer.flush() == 0
+    assert writer.flush() == 2
+    assert stored_messages(writer._app) == ['a', 'b']
+
+
+def test_buffer_is_capped(writer, session_id, monkeypatch):
+    monkeypatch.setattr(writer, 'flush', lambda: 0)
+    for number in range(15):
+        writer.enqueue(session_id, f'message {number}', 'user')
+    assert len(writer._buffer) == 10
+    assert writer._buffer[0]['message'] == 'message 5'
+    assert writer.dropped == 5
@@ -0,0 +1,61 @@
+"""Tests for request instrumentation: who may scrape /metrics and the Server-Timing header"""
+
+import pytest
+
+from app import db
+from models import User
+
+
+@pytest.fixture
+def client(make_app):
+    """Logged-in client of an app with metrics on and no scrape token."""
+    app = make_app(METRICS_ENABLED=True, SEMANTIC_SEARCH_ENABLED=False)
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+        flask_session['chat_token'] = 'metrics-token'
+    return client
+
+
+def test_metrics_are_off_by_default(app):
+    assert app.test_client().get('/metrics').status_code == 404
+    assert 'Server-Timing' not in app.test_client().get('/api/cart-count').headers
+
+
+def test_loopback_scrape_is_allowed(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'shopmate_request_duration_seconds' in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('environ, headers', [
+    ({'REMOTE_ADDR': '203.0.113.7'}, {}),
+    ({}, {'X-Forwarded-For': '203.0.113.7'}),  # Through a proxy on the same host
+])
+def test_remote_scrape_is_refused(client, environ, headers):
+    assert client.get('/metrics', environ_base=environ, headers=headers).status_code == 403
+
+
+def test_token_is_required_when_configured(make_app):
+    client = make_app(METRICS_ENABLED=True, METRICS_TOKEN='s3cret').test_client()
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'},
+                          environ_base={'REMOTE_ADDR': '203.0.113.7'})
+    assert response.status_code == 200
+
+
+def test_server_timing_skips_streamed_responses(client):
+    response = client.post('/api/chat', json={'message': 'hello'})
+    assert response.status_code == 200
+    assert 'total;dur=' in response.headers['Server-Timing']
+
+    response = client.post('/api/chat/stream', json={'message': 'hello'})
+    assert response.mimetype == 'text/event-stream'
+    assert 'Server-Timing' not in response.headers
+    response.get_data()
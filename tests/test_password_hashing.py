@@ -0,0 +1,49 @@
+"""Tests for the password hash pool: rehash checks and recovery from a broken pool"""
+
+import os
+
+import pytest
+
+from password_hashing import PasswordHasher, HashingBusy
+
+
+def die(marker):
+    """Kill the hash process the first time (or every time, without a marker path)."""
+    if marker is None or not os.path.exists(marker):
+        if marker is not None:
+            open(marker, 'w').close()
+        os._exit(1)
+    return 'hashed'
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher()
+    hasher.workers = 1
+    yield hasher
+    if hasher._pool is not None:
+        hasher._pool.shutdown()
+
+
+def test_broken_pool_is_retried_on_a_fresh_one(hasher, tmp_path):
+    marker = str(tmp_path / 'died')
+    assert hasher._call(die, marker) == 'hashed'
+    assert os.path.exists(marker)
+    assert hasher._call(die, marker) == 'hashed'
+
+
+def test_pool_breaking_twice_sheds_the_login(hasher):
+    with pytest.raises(HashingBusy):
+        hasher._call(die, None)
+    assert hasher.rejected == 1
+
+
+def test_needs_rehash_after_parameter_change(hasher):
+    hasher.workers = 0
+    hasher.method = 'pbkdf2:sha256:1000'
+    password_hash = hasher.hash('secret')
+    assert hasher.verify(password_hash, 'secret')
+    assert not hasher.needs_rehash(password_hash)
+
+    hasher.salt_length = 24
+    assert hasher.needs_rehash(password_hash)
@@ -0,0 +1,103 @@
+"""Tests for read-replica routing and read-your-writes stickiness, on SQLite replica files"""
+
+import logging
+
+import pytest
+from flask import g
+from sqlalchemy import select
+
+from app import db
+from message_queue import chat_writer
+from models import User, Product, ChatSession, ChatMessage
+from replicas import replica_router, copy_sqlite
+
+
+@pytest.fixture
+def replicated(make_app, tmp_path):
+    """
+    App with one SQLite replica, a shopper and a product copied to it; a second
+    product exists on the primary only. Yields (app, user_id, replicated_id, primary_only_id).
+    """
+    app = make_app(DATABASE_REPLICA_URLS=f"sqlite:///{tmp_path / 'replica.db'}", CHAT_WRITE_BEHIND=True,
+                   CACHE_BACKEND=f"sqlite:///{tmp_path / 'cache.db'}", SEMANTIC_SEARCH_ENABLED=False,
+                   METRICS_ENABLED=True)
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com')
+        replicated = Product(title='Desk Lamp', price=20.0, category='Electronics', stock=3)
+        db.session.add_all([user, replicated])
+        db.session.commit()
+        copy_sqlite(db.engine.url.database, str(tmp_path / 'replica.db'))
+        primary_only = Product(title='Floor Lamp', price=45.0, category='Electronics', stock=5)
+        db.session.add(primary_only)
+        db.session.commit()
+        ids = user.id, replicated.id, primary_only.id
+    yield (app, *ids)
+    with chat_writer._lock:
+        chat_writer._buffer.clear()
+
+
+def product_ids():
+    return set(db.session.scalars(select(Product.id)))
+
+
+def test_reads_go_to_replica(replicated):
+    app, _, replicated_id, _ = replicated
+    with app.test_request_context('/'):
+        reads = replica_router.replica_reads
+        assert product_ids() == {replicated_id}
+        assert replica_router.replica_reads == reads + 1
+
+
+def test_write_sends_rest_of_request_to_primary(replicated):
+    app, user_id, replicated_id, primary_only_id = replicated
+    with app.test_request_context('/', method='POST'):
+        db.session.add(ChatSession(user_id=user_id, session_token='token'))
+        db.session.flush()
+        assert g.db_primary
+        assert product_ids() == {replicated_id, primary_only_id}
+        db.session.rollback()
+
+
+def test_chat_flush_sends_history_read_to_primary(replicated):
+    app, user_id, _, _ = replicated
+    with app.app_context():
+        chat_session = ChatSession(user_id=user_id, session_token='token')
+        db.session.add(chat_session)
+        db.session.commit()
+        session_id = chat_session.id
+
+    with app.test_request_context('/', method='POST'):
+        chat_writer.enqueue(session_id, 'hello', 'user')
+        chat_writer.flush()
+        assert g.get('db_primary')
+        history = db.session.scalars(select(ChatMessage.message).where(ChatMessage.session_id == session_id)).all()
+        assert history == ['hello']
+
+
+def test_user_sticks_to_primary_after_a_write(replicated):
+    app, user_id, _, primary_only_id = replicated
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+
+    response = client.post('/api/cart', json={'operations': [{'op': 'add', 'product_id': primary_only_id}]})
+    assert response.status_code == 200
+
+    # The cart line exists on the primary only; the next request must still see it
+    cart = client.get('/api/cart').get_json()
+    assert [item['product_id'] for item in cart['items']] == [primary_only_id]
+
+
+def test_replica_queries_are_instrumented(replicated):
+    app, _, _, _ = replicated
+    with app.test_request_context('/'):
+        reads = replica_router.replica_reads
+        product_ids()
+        assert replica_router.replica_reads == reads + 1
+        assert g._timings['sql_count'] == 1
+
+
+def test_memory_cache_backend_warns(make_app, tmp_path, caplog):
+    with caplog.at_level(logging.WARNING, logger='replicas'):
+        make_app(DATABASE_REPLICA_URLS=f"sqlite:///{tmp_path / 'replica.db'}")
+    assert 'CACHE_BACKEND=memory' in caplog.text
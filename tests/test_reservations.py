@@ -0,0 +1,126 @@
+"""Tests for cart stock holds: taking, renewing and releasing them, and imports around them"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app import db
+from catalog_import import normalize_product, load_products
+from models import User, Product, CartItem, StockReservation
+from reservations import stock_reservations
+from routes import filter_catalog
+
+
+@pytest.fixture
+def shop(make_app):
+    """App with holds on, a shopper and a lamp with 3 units; yields (app, user_id, product_id)."""
+    app = make_app(STOCK_RESERVATIONS_ENABLED=True, STOCK_EXPIRY_INTERVAL=0, STOCK_HOLD_TTL=900,
+                   SEMANTIC_SEARCH_ENABLED=False)
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com')
+        product = Product(sku='LAMP-1', title='Desk Lamp', price=20.0, category='Electronics', stock=3)
+        db.session.add_all([user, product])
+        db.session.commit()
+        yield app, user.id, product.id
+
+
+@pytest.fixture
+def client(shop):
+    app, user_id, _ = shop
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+    return client
+
+
+def set_quantity(client, product_id, quantity):
+    return client.post('/api/cart', json={'operations': [{'op': 'set', 'product_id': product_id, 'quantity': quantity}]})
+
+
+def stock(product_id):
+    db.session.expire_all()
+    return db.session.scalar(select(Product.stock).where(Product.id == product_id))
+
+
+def holds(user_id):
+    return db.session.execute(
+        select(StockReservation.product_id, StockReservation.quantity, StockReservation.expires_at)
+        .where(StockReservation.user_id == user_id)
+    ).all()
+
+
+def test_adding_to_cart_takes_stock(shop, client):
+    _, user_id, product_id = shop
+    response = client.post('/api/add-to-cart', json={'product_id': product_id, 'quantity': 2})
+    assert response.status_code == 200
+    assert stock(product_id) == 1
+    assert [(row.product_id, row.quantity) for row in holds(user_id)] == [(product_id, 2)]
+
+    # Shrinking the line gives units back
+    assert set_quantity(client, product_id, 1).status_code == 200
+    assert stock(product_id) == 2
+    assert [row.quantity for row in holds(user_id)] == [1]
+
+
+def test_shortage_is_rejected(shop, client):
+    _, user_id, product_id = shop
+    response = set_quantity(client, product_id, 4)
+    assert response.status_code == 409
+    assert stock(product_id) == 3
+    assert holds(user_id) == []
+    assert db.session.scalar(select(CartItem.id).where(CartItem.user_id == user_id)) is None
+
+
+def test_lapsed_hold_is_released(shop, client):
+    _, user_id, product_id = shop
+    set_quantity(client, product_id, 2)
+    assert stock_reservations.expire(now=datetime.utcnow()) == 0
+
+    assert stock_reservations.expire(now=datetime.utcnow() + timedelta(hours=1)) == 1
+    assert stock(product_id) == 3
+    assert holds(user_id) == []
+    assert db.session.scalar(select(CartItem.id).where(CartItem.user_id == user_id)) is None
+    assert db.session.get(User, user_id).cart_count == 0
+
+
+def test_cart_change_renews_every_hold(shop, client):
+    _, user_id, product_id = shop
+    other = Product(sku='LAMP-2', title='Floor Lamp', price=45.0, category='Electronics', stock=5)
+    db.session.add(other)
+    db.session.commit()
+    other_id = other.id
+
+    set_quantity(client, product_id, 1)
+    first = {row.product_id: row.expires_at for row in holds(user_id)}
+    db.session.execute(StockReservation.__table__.update().values(expires_at=datetime.utcnow()))
+    db.session.commit()
+
+    set_quantity(client, other_id, 1)
+    renewed = {row.product_id: row.expires_at for row in holds(user_id)}
+    assert renewed.keys() == {product_id, other_id}
+    assert renewed[product_id] >= first[product_id]
+
+
+def test_import_subtracts_held_units(shop, client):
+    _, _, product_id = shop
+    set_quantity(client, product_id, 2)
+
+    load_products([normalize_product({'sku': 'LAMP-1', 'title': 'Desk Lamp', 'category': 'Electronics',
+                                      'price': '20', 'stock': '10'})])
+    assert stock(product_id) == 8
+
+    # Holds above the feed count leave the column negative until they are released
+    load_products([normalize_product({'sku': 'LAMP-1', 'title': 'Desk Lamp', 'category': 'Electronics',
+                                      'price': '20', 'stock': '1'})])
+    assert stock(product_id) == -1
+    stock_reservations.expire(now=datetime.utcnow() + timedelta(hours=1))
+    assert stock(product_id) == 1
+
+
+def test_in_stock_filter_sees_held_stock(shop, client):
+    _, _, product_id = shop
+    set_quantity(client, product_id, 3)
+
+    assert filter_catalog('Electronics') != []
+    assert filter_catalog('Electronics', in_stock=True) == []
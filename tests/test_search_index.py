@@ -0,0 +1,111 @@
+"""Tests for the search tokenizer shared by the BM25 and semantic indexes, and for the warm-up that builds them"""
+
+import pytest
+from sqlalchemy import select
+
+import catalog_snapshot
+import search_index
+import semantic_index
+from app import create_app, db, warm_up
+from catalog_sync import catalog_sync
+from models import Product
+from search_index import tokenize
+from semantic_index import expand_terms
+
+
+def test_plurals_fold_to_singular():
+    assert tokenize('Wireless Headphones, USB Chargers') == ['wireless', 'headphone', 'usb', 'charger']
+
+
+def test_short_words_and_double_s_are_kept():
+    assert tokenize('this plus bags glass') == ['this', 'plus', 'bags', 'glass']
+
+
+def test_stop_words_dropped_from_semantic_terms():
+    assert 'this' not in expand_terms('this desk lamp')
+
+
+@pytest.fixture
+def fresh_copies(monkeypatch):
+    """Empty catalog copies in place of the process-wide ones other tests may have filled."""
+    monkeypatch.setattr(search_index, 'product_index', search_index.ProductSearchIndex())
+    if catalog_snapshot.catalog_snapshot is not None:
+        monkeypatch.setattr(catalog_snapshot, 'catalog_snapshot', catalog_snapshot.CatalogSnapshot())
+    if semantic_index.semantic_index is not None:
+        monkeypatch.setattr(semantic_index, 'semantic_index', semantic_index.SemanticProductIndex(dimensions=64))
+
+
+@pytest.fixture
+def shop(make_app, tmp_path, fresh_copies):
+    """App factory whose database holds two products."""
+    def make(**settings):
+        app = make_app(SEMANTIC_INDEX_PATH=str(tmp_path / 'vectors.npy'), **settings)
+        with app.app_context():
+            if not db.session.scalar(select(Product.id)):
+                db.session.add_all([Product(title='Desk Lamp', description='LED lamp', price=20.0, category='Home'),
+                                    Product(title='Cookbook', description='Quick dinners', price=15.0, category='Books')])
+                db.session.commit()
+        return app
+    return make
+
+
+def test_warm_up_loads_the_catalog_copies(shop):
+    pytest.importorskip('numpy')
+    app = shop(CATALOG_SNAPSHOT_ENABLED=True, SEMANTIC_SEARCH_ENABLED=True)
+    warm_up(app)
+
+    assert app.extensions['shopmate_warm']
+    assert search_index.product_index.ready and len(search_index.product_index) == 2
+    assert catalog_snapshot.catalog_snapshot.ready and len(catalog_snapshot.catalog_snapshot) == 2
+    assert semantic_index.semantic_index.ready and len(semantic_index.semantic_index) == 2
+    assert catalog_sync.version is not None
+
+    with app.app_context():
+        lamp_id = db.session.scalar(select(Product.id).filter_by(title='Desk Lamp'))
+    assert search_index.product_index.search(tokenize('lamps')) == [lamp_id]
+
+
+def test_disabled_copies_stay_empty(shop):
+    app = shop(CATALOG_SNAPSHOT_ENABLED=False, SEMANTIC_SEARCH_ENABLED=False)
+    warm_up(app)
+    assert search_index.product_index.ready
+    for copy in (catalog_snapshot.catalog_snapshot, semantic_index.semantic_index):
+        assert copy is None or not copy.ready
+
+
+def test_warm_up_runs_once(shop, monkeypatch):
+    app = shop(SEMANTIC_SEARCH_ENABLED=False)
+    builds = []
+    monkeypatch.setattr(search_index, 'build_product_index', lambda: builds.append(True))
+    warm_up(app)
+    warm_up(app)
+    assert builds == [True]
+
+
+def test_first_request_warms_up(shop):
+    app = shop(SEMANTIC_SEARCH_ENABLED=False)
+    assert not search_index.product_index.ready
+    app.test_client().get('/login')
+    assert app.extensions['shopmate_warm']
+    assert len(search_index.product_index) == 2
+
+
+def test_pending_migrations_stop_warm_up(tmp_path, fresh_copies):
+    config = {'TESTING': True, 'SECRET_KEY': 'test', 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'new.db'}",
+              'CACHE_BACKEND': 'memory', 'DATABASE_REPLICA_URLS': '', 'PASSWORD_HASH_WORKERS': 0,
+              'SEMANTIC_SEARCH_ENABLED': False}
+    app = create_app(dict(config, SCHEMA_AUTO_MIGRATE=False))
+    with pytest.raises(RuntimeError, match='pending migrations'):
+        warm_up(app)
+    assert not app.extensions.get('shopmate_warm')
+    assert not search_index.product_index.ready
+    with app.app_context():
+        db.engine.dispose()
+
+    app = create_app(dict(config, SCHEMA_AUTO_MIGRATE=True))
+    warm_up(app)
+    assert search_index.product_index.ready
+    with app.app_context():
+        assert db.session.scalar(select(Product.id)) is None
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,96 @@
+"""Tests for the semantic index delta: what re-embeds, the cached delta matrix and compaction"""
+
+import pytest
+
+import semantic_index as semantic_module
+from app import db, warm_up
+from models import Product
+
+np = pytest.importorskip('numpy')
+
+CATALOG = [
+    (1, 'Wireless Headphones', 'Over-ear headphones with noise cancelling', 'Electronics'),
+    (2, 'Bluetooth Speaker', 'Portable speaker for music', 'Electronics'),
+    (3, 'Cookbook', 'Recipes for quick dinners', 'Books'),
+    (4, 'Desk Lamp', 'LED lamp with dimmer', 'Home'),
+]
+# Enough extra rows for the IVF partitions (16 at least)
+FILLER = [(100 + number, f'Notebook {number}', 'Lined paper notebook', 'Office') for number in range(40)]
+
+
+@pytest.fixture
+def index():
+    index = semantic_module.SemanticProductIndex(dimensions=64)
+    index.build(lambda: CATALOG)
+    return index
+
+
+def test_unchanged_text_stays_out_of_the_delta(index):
+    index.add(*CATALOG[0])
+    assert index._delta == {}
+
+    index.add(1, 'Wireless Earbuds', 'In-ear headphones', 'Electronics')
+    assert list(index._delta) == [1]
+    assert index.search('earbuds')[0][0] == 1
+
+
+def test_delta_matrix_is_stacked_once_per_change(index):
+    index.add(5, 'Reading Lamp', 'Clip-on lamp', 'Home')
+    index.search('lamp')
+    stacked = index._delta_matrix
+    index.search('light for reading')
+    assert index._delta_matrix is stacked
+
+    index.add(6, 'Floor Lamp', 'Tall lamp', 'Home')
+    assert index._delta_matrix is None
+    assert {product_id for product_id, _ in index.search('lamp', limit=10)} >= {4, 5, 6}
+
+
+@pytest.mark.parametrize('partitioned', [False, True])
+def test_delta_is_compacted(index, monkeypatch, partitioned):
+    monkeypatch.setattr(semantic_module, 'DELTA_COMPACT_SIZE', 2)
+    catalog = CATALOG + FILLER if partitioned else CATALOG
+    if partitioned:
+        monkeypatch.setattr(semantic_module, 'EXACT_SEARCH_LIMIT', 2)
+        index.nprobe = 16  # Every partition, so the check below is exact
+    index.build(lambda: catalog)
+    assert (index._centroids is not None) == partitioned
+
+    index.remove(3)
+    index.add(5, 'Reading Lamp', 'Clip-on lamp', 'Home')
+    index.add(6, 'Floor Lamp', 'Tall lamp', 'Home')
+    assert len(index._delta) == 2
+    index.add(2, 'Bluetooth Soundbar', 'Speaker bar for the TV', 'Electronics')
+    if partitioned:
+        # A tenth of the catalog is above DELTA_COMPACT_SIZE here
+        assert len(index._delta) == 3
+        assert index.compact()
+
+    assert index._delta == {}
+    assert sorted(index._rows) == sorted({1, 2, 4, 5, 6} | {row[0] for row in catalog[len(CATALOG):]})
+    assert len(index) == len(catalog) + 1
+    assert index.search('speaker')[0][0] == 2
+    assert index.search('lamp', limit=3)[0][0] in (4, 5, 6)
+    assert 3 not in {product_id for product_id, _ in index.search('recipes dinners', limit=10)}
+
+
+def test_price_edit_does_not_re_embed(make_app):
+    app = make_app(SEMANTIC_SEARCH_ENABLED=True)
+    with app.app_context():
+        product = Product(title='Desk Lamp', description='LED lamp', price=20.0, category='Home', stock=3)
+        db.session.add(product)
+        db.session.commit()
+        product_id = product.id
+    warm_up(app)
+
+    index = semantic_module.semantic_index
+    with app.app_context():
+        product = db.session.get(Product, product_id)
+        product.price = 18.0
+        product.stock = 2
+        db.session.commit()
+        assert index._delta == {}
+
+        product.title = 'Dimmable Desk Lamp'
+        db.session.commit()
+        assert list(index._delta) == [product_id]
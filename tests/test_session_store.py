@@ -0,0 +1,71 @@
+"""Tests for the chat session store: token lookups and the idle-session sweep"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app import db
+from models import User, ChatSession, ChatMessage
+from session_store import chat_sessions
+
+
+@pytest.fixture
+def chat(make_app):
+    """Logged-in client with a chat token; yields (app, client, user_id, token)."""
+    app = make_app(CHAT_SESSION_SWEEP_INTERVAL=0, CHAT_SESSION_MAX_IDLE=3600, SEMANTIC_SEARCH_ENABLED=False)
+    with app.app_context():
+        user = User(username='ada', email='ada@example.com')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    token = chat_sessions.new_token()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = user_id
+        flask_session['chat_token'] = token
+    yield app, client, user_id, token
+    chat_sessions.forget(token)
+
+
+def send(client, message):
+    return client.post('/api/chat', json={'message': message})
+
+
+def test_first_message_creates_the_session(chat):
+    app, client, user_id, token = chat
+    assert send(client, 'hello').status_code == 200
+    with app.app_context():
+        chat_session_id = chat_sessions.get(token, user_id)
+        assert db.session.scalar(select(ChatSession.session_token).filter_by(id=chat_session_id)) == token
+
+
+def test_sweep_deletes_idle_sessions(chat):
+    app, client, user_id, token = chat
+    send(client, 'hello')
+    with app.app_context():
+        assert chat_sessions.sweep() == 0
+        assert chat_sessions.sweep(now=datetime.utcnow() + timedelta(hours=2)) == 1
+        assert db.session.scalar(select(ChatSession.id)) is None
+        assert db.session.scalar(select(ChatMessage.id)) is None
+    assert chat_sessions.get(token, user_id) is None
+
+
+def test_chat_after_another_worker_swept_the_session(chat):
+    app, client, user_id, token = chat
+    send(client, 'hello')
+    with app.app_context():
+        swept_id = chat_sessions.get(token, user_id)
+        chat_sessions.sweep(now=datetime.utcnow() + timedelta(hours=2))
+    # The sweep ran in another worker: this one's memory cache still has the old id
+    chat_sessions.remember(token, swept_id, user_id)
+
+    response = send(client, 'show me lamps')
+    assert response.status_code == 200
+    with app.app_context():
+        chat_session_id = db.session.scalar(select(ChatSession.id).filter_by(session_token=token))
+        assert chat_session_id is not None
+        assert chat_sessions.get(token, user_id) == chat_session_id
+        messages = db.session.scalars(select(ChatMessage.session_id)).all()
+        assert messages == [chat_session_id, chat_session_id]